@@ -1,12 +1,21 @@
+import uuid
+
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
 
 from utils.sidebar import Sidebar
 from utils.load_data import load_data
 from utils.max_event import get_max_event
 from utils.ai_assistant import render_ai_assistant
-from utils.fetch_waveform import fetch_waveform, get_nearby_stations
+from utils.ai_context import register_context
+from utils.fetch_waveform import find_event_waveform, get_nearby_stations
 from utils.seismology import fft_analysis
+from utils.preprocessing import preprocess
+from utils.spectral import compute_spectrogram
+from utils.downsample import plot_waveform
+from utils.map_layer import build_map_figure, resolve_selection, MAX_CLUSTER_ZOOM
+from utils.prefetch import get_prefetcher, rank_events
 
 
 unfiltered_df = load_data()
@@ -25,47 +34,53 @@ st.set_page_config(
 
 st.title("Dashboard sismica")
 
+DEFAULT_MAP_CENTER = {"lat": 42.0, "lon": 12.5}
+DEFAULT_MAP_ZOOM = 5
+
 
 @st.fragment
 def render_map_with_interaction(df):
     st.header("Mappa degli eventi sismici")
-    df["name"] = df["time"].dt.strftime("Evento %Y-%m-%d %H:%M:%S")
-    fig_map = px.scatter_map(
-        df,
-        # Marker settings
-        lat="latitude",
-        lon="longitude",
-        size="magnitude",
-        size_max=15,
-        opacity=0.7,
-        color="magnitude",
-        color_continuous_scale=px.colors.sequential.Burgyl,
-        hover_name="name",
-        hover_data=["magnitude", "depth", "latitude", "longitude"],
-        labels={
-            "magnitude": "Magnitudo", 
-            "depth": "Profondità (km)",
-            "latitude": "Latitudine", 
-            "longitude": "Longitudine"
-        },
-        # Map settings
-        zoom=5,
-        center={"lat": 42.0, "lon": 12.5},
-        map_style="open-street-map",
-        title="",
-        height=800,
-    )
-    fig_map.update_traces(unselected=dict(marker=dict(opacity=0.7))) # do not blur unselected markers, keep default opacity
-    event = st.plotly_chart(fig_map, width="stretch", on_select="rerun", selection_mode="points")
 
+    # Map view (zoom/center) drives the clustering resolution
+    if "map_view" not in st.session_state:
+        st.session_state.map_view = {"zoom": DEFAULT_MAP_ZOOM, "center": DEFAULT_MAP_CENTER, "version": 0}
+    view = st.session_state.map_view
+
+    col_zoom, col_reset = st.columns([4, 1])
+    with col_zoom:
+        view["zoom"] = st.slider("Livello di zoom", 3, MAX_CLUSTER_ZOOM, view["zoom"], key=f"map_zoom_{view['version']}")
+    with col_reset:
+        if st.button("Vista iniziale"):
+            st.session_state.map_view = {"zoom": DEFAULT_MAP_ZOOM, "center": DEFAULT_MAP_CENTER, "version": view["version"] + 1}
+            st.rerun(scope="fragment")
+
+    fig_map = build_map_figure(df, view["zoom"], view["center"])
+    event = st.plotly_chart(fig_map, key=f"event_map_{view['version']}", width="stretch", on_select="rerun", selection_mode="points")
+
+    # Warm station lookup and waveforms of the events most likely to be clicked next
+    candidates = rank_events(df)
+    if st.session_state.get("prefetch_key") != tuple(candidates.index):
+        st.session_state.prefetch_key = tuple(candidates.index)
+        if "prefetch_session" not in st.session_state:
+            st.session_state.prefetch_session = uuid.uuid4().hex
+        get_prefetcher().schedule(st.session_state.prefetch_session, candidates)
+
+    kind, target = None, None
     if event and event.selection and event.selection.points:
-        # Retrieve the index of the selected point
-        point = event.selection.points[0]
-        # Handle both object and dict access just in case, but error said dict
-        point_idx = point["point_index"] if isinstance(point, dict) else point.point_index
-        # Index validation
-        if point_idx < len(df):
-            selected_event = df.iloc[point_idx]
+        kind, target = resolve_selection(event.selection.points[0])
+
+    if kind == "cluster":
+        # Drill down into the selected cluster
+        view["center"] = {"lat": target[0], "lon": target[1]}
+        view["zoom"] = min(view["zoom"] + 2, MAX_CLUSTER_ZOOM)
+        view["version"] += 1
+        st.rerun(scope="fragment")
+
+    if kind == "event":
+        # Index validation (customdata holds the catalog index label)
+        if target in df.index:
+            selected_event = df.loc[target]
             
             st.markdown("---")
             st.header(f"Analisi sismica: evento del {selected_event['time']}")
@@ -85,36 +100,31 @@ def render_map_with_interaction(df):
                     status_placeholder.warning("Nessuna stazione trovata (raggio 1.0°).")
                 else:
                     status_placeholder.empty() # Clear the info message
-                    st.write(f"Stazioni trovate: {', '.join(stations)}")
+                    st.write(f"Stazioni trovate: {', '.join(code for code, _ in stations)}")
             
-            wave_df = None
+            wave_trace = None
             found_station = None
             
             if stations:
                 with col_wave_plot:
                     with st.spinner(f"Ricerca dati waveform..."):
-                        for station in stations:
-                            wave_df = fetch_waveform(station, selected_event['time'])
-                            if wave_df is not None:
-                                found_station = station
-                                break
+                        found_station, wave_trace = find_event_waveform(selected_event, stations)
                     
-                    if wave_df is not None:
+                    if wave_trace is not None:
                         st.success(f"Dati recuperati da stazione: **{found_station}**")
+                        # Detrend, taper, instrument response removal and bandpass
+                        wave_trace = preprocess(wave_trace)
                         
                         # Create two columns for Time Domain and Frequency Domain
                         col_time, col_freq = st.columns(2)
                         
                         with col_time:
                             st.markdown("**Dominio del tempo**")
-                            fig_wave = px.line(wave_df, x="times", y="velocity", 
-                                             labels={"times": "Tempo", "velocity": "Velocità"})
-                            fig_wave.update_layout(height=300, margin=dict(l=0, r=0, t=30, b=0))
-                            st.plotly_chart(fig_wave, key="wave_chart_time", width="stretch", on_select="ignore", selection_mode="points")
+                            plot_waveform(wave_trace, key="wave_chart_time", xaxis_title="Tempo")
                             
                         with col_freq:
                             st.markdown("**Dominio delle frequenze**")
-                            fft_df = fft_analysis(wave_df)
+                            fft_df = fft_analysis(wave_trace)
                             if not fft_df.empty:
                                 fig_fft = px.line(fft_df, x='Freq (Hz)', y='Power',
                                                 labels={'Freq (Hz)': 'Freq (Hz)', 'Power': 'Power'})
@@ -122,23 +132,37 @@ def render_map_with_interaction(df):
                                 st.plotly_chart(fig_fft, key="wave_chart_freq", width="stretch")
                             else:
                                 st.caption("Analisi in frequenza non disponibile.")
+
+                        st.markdown("**Spettrogramma**")
+                        spec = compute_spectrogram(wave_trace)
+                        if spec is not None:
+                            spec_times, spec_freqs, spec_db = spec
+                            fig_spec = go.Figure(go.Heatmap(x=spec_times, y=spec_freqs, z=spec_db, colorscale="Viridis",
+                                                            colorbar=dict(title="dB")))
+                            fig_spec.update_layout(height=300, margin=dict(l=0, r=0, t=30, b=0),
+                                                   xaxis_title="Tempo", yaxis_title="Freq (Hz)")
+                            st.plotly_chart(fig_spec, key="wave_chart_spectrogram", width="stretch")
+                        else:
+                            st.caption("Spettrogramma non disponibile.")
                     else:
-                        st.error(f"Nessun dato waveform disponibile per le stazioni: {', '.join(stations)}")
+                        st.error(f"Nessun dato waveform disponibile per le stazioni: {', '.join(code for code, _ in stations)}")
             
-            # Update Context for AI
-            st.session_state['ai_context_selection'] = f"""
+            # Context for AI (built only if a question is asked)
+            def selection_context(event=selected_event, station=found_station, trace_found=wave_trace is not None):
+                return f"""
             EVENTO SELEZIONATO:
-            - Data/Ora: {selected_event['time']}
-            - Magnitudo: {selected_event['magnitude']}
-            - Profondità: {selected_event['depth']} km
-            - Località (Lat/Lon): {selected_event['latitude']}, {selected_event['longitude']}
-            - Stazione Dati: {found_station if found_station else 'Nessuna (Nessun dato waveform trovato)'}
-            - Dati Waveform: {'Disponibili' if wave_df is not None else 'Non disponibili'}
+            - Data/Ora: {event['time']}
+            - Magnitudo: {event['magnitude']}
+            - Profondità: {event['depth']} km
+            - Località (Lat/Lon): {event['latitude']}, {event['longitude']}
+            - Stazione Dati: {station if station else 'Nessuna (Nessun dato waveform trovato)'}
+            - Dati Waveform: {'Disponibili' if trace_found else 'Non disponibili'}
             """
+            register_context("selection", selection_context, key=("home", target, found_station))
         else:
-             st.session_state['ai_context_selection'] = "Nessun evento selezionato."
+             register_context("selection", lambda: "Nessun evento selezionato.", key="home")
     else:
-        st.session_state['ai_context_selection'] = "Nessun evento selezionato."
+        register_context("selection", lambda: "Nessun evento selezionato.", key="home")
 
 
 col1, col2 = st.columns([3, 1])
@@ -172,8 +196,13 @@ with col2:
         st.info("Nessun evento trovato con i filtri attuali.")
 
 # --- AI Context Generation ---
-if not df.empty:
-    stats_context = f"""
+def stats_context(df=df):
+    if df.empty:
+        return "Nessun evento visibile con i filtri correnti."
+    top_year = df['time'].dt.year.mode()[0]
+    months = df['time'].dt.to_period('M')
+    top_month = months.mode()[0]
+    context = f"""
     STATISTICHE DATASET FILTRATO:
     - Numero eventi: {len(df)}
     - Magnitudo Media: {df['magnitude'].mean():.2f}
@@ -181,27 +210,22 @@ if not df.empty:
     - Profondità Media: {df['depth'].mean():.2f} km
     - Profondità Massima: {df['depth'].max()} km
     - Profondità Minima: {df['depth'].min()} km
-    - Anno con più eventi: {df['time'].dt.year.mode()[0]} ({len(df[df['time'].dt.year == df['time'].dt.year.mode()[0]])} eventi)
-    - Mese con più eventi: {df['time'].dt.to_period('M').mode()[0]} ({len(df[df['time'].dt.to_period('M') == df['time'].dt.to_period('M').mode()[0]])} eventi)
+    - Anno con più eventi: {top_year} ({(df['time'].dt.year == top_year).sum()} eventi)
+    - Mese con più eventi: {top_month} ({(months == top_month).sum()} eventi)
     - Area più attiva (Lat/Lon): ({df['latitude'].mode()[0]:.2f}, {df['longitude'].mode()[0]:.2f})
     """
-    
+
     max_event = get_max_event(df)
     if max_event is not None:
-        stats_context += f"""
+        context += f"""
         EVENTO CON MAGNITUDO MASSIMA:
         - Data: {max_event['time']}
         - Magnitudo: {max_event['magnitude']}
         - Posizione: {max_event['latitude']}, {max_event['longitude']}
         """
-else:
-    stats_context = "Nessun evento visibile con i filtri correnti."
-
-st.session_state['ai_context_global'] = stats_context
+    return context
 
-# Initialize selection context if not present (to avoid errors on first run)
-if 'ai_context_selection' not in st.session_state:
-    st.session_state['ai_context_selection'] = "Nessun evento selezionato."
+register_context("global", stats_context, key=("home", Sidebar.filter_key()))
 
 render_ai_assistant(context_text="Analisi della Home Page con mappa interattiva.")
 
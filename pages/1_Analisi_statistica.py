@@ -1,21 +1,29 @@
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
-import pandas as pd
 import numpy as np
 
 from utils.sidebar import Sidebar
-from utils.load_data import load_data
+from utils.load_data import current_catalog, load_data
 from utils.ai_assistant import render_ai_assistant
-from utils.seismology import calculate_gutenberg_richter
+from utils.ai_context import register_context
+from utils.catalog_aggregates import OUT_OF_CORE_ROWS, aggregate_catalog, aggregate_frame, summarize_catalog
+from utils.compute_graph import ComputeGraph
 
 
-unfiltered_df = load_data()
-if unfiltered_df is None:
+catalog = current_catalog()
+if catalog is None:
     st.error("Dataset 'catalog.csv' non trovato. Esegui lo script di setup!")
     st.stop()
-Sidebar.init_sidebar(unfiltered_df)
-df, years, depth, magnitude = Sidebar.apply_filters(unfiltered_df)
+
+# Large catalogs are aggregated one partition at a time instead of being filtered in memory
+out_of_core = catalog["rows"] > OUT_OF_CORE_ROWS
+if out_of_core:
+    Sidebar.init_sidebar(None, summary=summarize_catalog(catalog["version"]))
+else:
+    unfiltered_df = load_data()
+    Sidebar.init_sidebar(unfiltered_df)
+    df, years, depth, magnitude = Sidebar.apply_filters(unfiltered_df)
 
 
 st.set_page_config(
@@ -27,28 +35,40 @@ st.set_page_config(
 
 st.title("Analisi statistica")
 
-st.header("Distribuzione delle magnitudo")
-st.markdown("Segue la Legge di Gutenberg-Richter:")
-help="""
-N è il numero cumulativo di eventi con magnitudo ≥ M \n
-"""
-st.latex(r"\log_{10} N = a - bM")
-st.markdown(help)
-# Calculate Frequency-Magnitude Distribution
-magnitudes = df['magnitude'].round(1)
-mag_counts = magnitudes.value_counts().sort_index(ascending=False)
-cdf = mag_counts.cumsum().sort_index() # Cumulative Number of events >= M
-gr_df = pd.DataFrame({'Magnitude': cdf.index, 'Count': cdf.values})
-gr_df['LogCount'] = np.log10(gr_df['Count'])
-
-# Calculate G-R parameters using shared utility (MLE)
-gr_params = calculate_gutenberg_richter(df)
-a_value = gr_params['a_value']
-b_value = gr_params['b_value']
-mc = gr_params['mc']
-valid = gr_params['valid']
+graph = ComputeGraph("statistica")
+
+if out_of_core:
+    graph.source("catalog", catalog["version"])
+    graph.source("filters", Sidebar.filter_key())
 
-if valid:
+    @graph.node("aggregates", "catalog", "filters")
+    def catalog_aggregates(version, filters):
+        return aggregate_catalog(version, filters)
+else:
+    graph.source("df", df, token=(df.attrs.get("catalog_version"), Sidebar.filter_key()))
+
+    @graph.node("aggregates", "df")
+    def frame_aggregates(df):
+        # Same pipeline as out of core, on the filtered frame as a single partition
+        return aggregate_frame(df)
+
+    @graph.node("spatiotemporal_figure", "df")
+    def spatiotemporal_figure(df):
+        return px.scatter(
+            df, 
+            x="time", 
+            y="latitude", 
+            color="magnitude", 
+            # size="magnitude",
+            color_continuous_scale=px.colors.sequential.Burgyl,
+        )
+
+
+@graph.node("gr_figure", "aggregates")
+def gr_figure(aggregates):
+    # Frequency-Magnitude Distribution and G-R parameters (MLE)
+    gr_df, gr_params = aggregates['magnitude_frequency'], aggregates['gr_params']
+    a_value, b_value, mc = gr_params['a_value'], gr_params['b_value'], gr_params['mc']
     fig_gr = px.scatter(gr_df, x="Magnitude", y="LogCount")
     
     # Add fit line
@@ -62,76 +82,142 @@ if valid:
     
     # Show Mc
     fig_gr.add_vline(x=mc, line_width=1, line_dash="dot", line_color="green", annotation_text=f"Mc={mc}")
+    return fig_gr
+
+
+@graph.node("timeline_figure", "aggregates")
+def timeline_figure(aggregates):
+    # Time distribution
+    fig_hist = px.bar(aggregates['timeline'], x='year_month', y='counts', title="Eventi per mese", labels={"year_month": "Mese", "counts": "Numero di eventi"})
+    fig_hist.update_xaxes(showticklabels=True)
+    return fig_hist
+
+
+@graph.node("waiting_figure", "aggregates")
+def waiting_figure(aggregates):
+    # Histogram of inter-event times (fixed bins, computed with the other aggregates)
+    waiting = aggregates['waiting_times']
+    fig_wait = px.bar(waiting.assign(hours=(waiting['start'] + waiting['end']) / 2), x="hours", y="count",
+                      labels={"hours": "Ore tra due eventi consecutivi"})
+    fig_wait.update_layout(bargap=0)
+    return fig_wait
+
+
+@graph.node("interevent_figure", "aggregates")
+def interevent_figure(aggregates):
+    # Inter-event time density on log axes, with the gamma fit
+    distribution = aggregates['interevent_distribution']
+    distribution = distribution[distribution['count'] > 0]
+    fig_ie = px.scatter(distribution, x="hours", y="density", log_x=True, log_y=True,
+                        labels={"hours": "Ore tra due eventi consecutivi", "density": "Densità di probabilità"})
+    if aggregates['interevent']['valid']:
+        fig_ie.add_trace(go.Scatter(x=distribution['hours'], y=distribution['gamma'], mode='lines',
+                                    name=f"Gamma (k={aggregates['interevent']['gamma_shape']:.2f})",
+                                    line=dict(color='red', dash='dash')))
+    return fig_ie
+
+
+@graph.panel("aggregates")
+def gr_panel(aggregates):
+    gr_params = aggregates['gr_params']
+    a_value = gr_params['a_value']
+    b_value = gr_params['b_value']
+    mc = gr_params['mc']
+
+    if gr_params['valid']:
+        st.plotly_chart(graph.get("gr_figure"), width="stretch")
+        
+        st.info(f"a = {a_value:.2f} (Sismicità regionale). Calcolato con MLE su Mc >= {mc}")
+        
+        if 0.8 <= b_value <= 1.2:
+            st.info(f"b = {b_value:.2f} è coerente con la sismicità tettonica standard (~1.0).")
+        elif b_value < 0.8:
+            st.warning(f"b = {b_value:.2f}. Potenziale alto stress sismico.")
+        else:
+            st.warning(f"b = {b_value:.2f}. Potenziale sciame sismico a bassa magnitudo.")
+    else:
+        st.warning("Dati insufficienti per calcolare la distribuzione Gutenberg-Richter (serve più eventi sopra Mc).")
+
+
+@graph.panel("timeline_figure", "waiting_figure", "aggregates")
+def time_panels(fig_hist, fig_wait, aggregates):
+    st.header("Timeline")
+    st.plotly_chart(fig_hist, width="stretch")
+
+    st.header("Istogramma dei tempi di attesa")
+    st.plotly_chart(fig_wait, width="stretch")
+
+    st.header("Distribuzione dei tempi inter-evento")
+    interevent = aggregates['interevent']
+    if interevent['valid']:
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Tempo medio", f"{interevent['mean_hours']:.1f} ore")
+        c2.metric("Coefficiente di variazione", f"{interevent['cv']:.2f}",
+                  help="1 per eventi indipendenti (Poisson), maggiore di 1 per sismicità a grappoli (sciami, repliche).")
+        c3.metric("Forma gamma (k)", f"{interevent['gamma_shape']:.2f}",
+                  help=f"Fit gamma di massima verosimiglianza, scala θ = {interevent['gamma_scale']:.1f} ore. k < 1 indica raggruppamento.")
+        st.plotly_chart(graph.get("interevent_figure"), width="stretch")
+    else:
+        st.warning("Dati insufficienti per la distribuzione dei tempi inter-evento.")
 
-    st.plotly_chart(fig_gr, width="stretch")
-    
-    st.info(f"a = {a_value:.2f} (Sismicità regionale). Calcolato con MLE su Mc >= {mc}")
-    
-    if 0.8 <= b_value <= 1.2:
-        st.info(f"b = {b_value:.2f} è coerente con la sismicità tettonica standard (~1.0).")
-    elif b_value < 0.8:
-        st.warning(f"b = {b_value:.2f}. Potenziale alto stress sismico.")
+    st.header("Pattern spazio-temporale")
+    if out_of_core:
+        st.info(f"Non disponibile per cataloghi con più di {OUT_OF_CORE_ROWS:,} eventi.")
     else:
-        st.warning(f"b = {b_value:.2f}. Potenziale sciame sismico a bassa magnitudo.")
-else:
-    st.warning("Dati insufficienti per calcolare la distribuzione Gutenberg-Richter (serve più eventi sopra Mc).")
-
-   
-st.header("Timeline")
-# Time distribution
-df['year_month'] = df['time'].dt.to_period('M').astype(str)
-counts = df.groupby('year_month').size().reset_index(name='counts')
-fig_hist = px.bar(counts, x='year_month', y='counts', title="Eventi per mese", labels={"year_month": "Mese", "counts": "Numero di eventi"})
-fig_hist.update_xaxes(showticklabels=True)
-st.plotly_chart(fig_hist, width="stretch")
-
-
-st.header("Istogramma dei tempi di attesa")
-# Calculate Inter-event times
-df_sorted = df.sort_values("time")
-df_sorted['delta_time'] = df_sorted['time'].diff().dt.total_seconds() / 3600.0 # hours
-df_clean = df_sorted.dropna()
-# Histogram of waiting times
-fig_wait = px.histogram(df_clean[df_clean['delta_time'] < 100], x="delta_time", nbins=50,
-                        labels={"delta_time": "Ore tra due eventi consecutivi"})
-st.plotly_chart(fig_wait, width="stretch")
-
-
-st.header("Pattern spazio-temporale")
-fig_st = px.scatter(
-    df, 
-    x="time", 
-    y="latitude", 
-    color="magnitude", 
-    # size="magnitude",
-    color_continuous_scale=px.colors.sequential.Burgyl,
-)
-st.plotly_chart(fig_st, width="stretch")
+        st.plotly_chart(graph.get("spatiotemporal_figure"), width="stretch")
+
+
+st.header("Distribuzione delle magnitudo")
+st.markdown("Segue la Legge di Gutenberg-Richter:")
+help="""
+N è il numero cumulativo di eventi con magnitudo ≥ M \n
+"""
+st.latex(r"\log_{10} N = a - bM")
+st.markdown(help)
+gr_panel()
+
+time_panels()
+
+aggregates = graph.get("aggregates")
+gr_params = aggregates['gr_params']
+a_value = gr_params['a_value']
+b_value = gr_params['b_value']
+mc = gr_params['mc']
+valid = gr_params['valid']
+interevent = aggregates['interevent']
 
 
 # --- AI Context Generation ---
-if df.empty:
-    stats_context = "Nessun dato disponibile per l'analisi."
-else:
-    stats_context = f"""
+def stats_context():
+    if not aggregates['n_events']:
+        return "Nessun dato disponibile per l'analisi."
+    context = f"""
     ANALISI STATISTICA (Gutenberg-Richter):
-    - Numero eventi totali: {len(df)}
+    - Numero eventi totali: {aggregates['n_events']}
     - Magnitudo di Completezza (Mc): {mc}
     - b-value: {b_value:.2f} (Valid: {valid})
     - a-value: {a_value:.2f}
     """
-    
+
     if valid:
         if 0.8 <= b_value <= 1.2:
-            stats_context += "\n    - Interpretazione b-value: Coerente con sismicità tettonica standard."
+            context += "\n    - Interpretazione b-value: Coerente con sismicità tettonica standard."
         elif b_value < 0.8:
-            stats_context += "\n    - Interpretazione b-value: Potenziale alto stress sismico."
+            context += "\n    - Interpretazione b-value: Potenziale alto stress sismico."
         else:
-            stats_context += "\n    - Interpretazione b-value: Potenziale sciame sismico."
+            context += "\n    - Interpretazione b-value: Potenziale sciame sismico."
     else:
-        stats_context += "\n    - NOTE: Parametri non affidabili (pochi dati sopra Mc)."
+        context += "\n    - NOTE: Parametri non affidabili (pochi dati sopra Mc)."
+    if interevent['valid']:
+        context += f"""
+    TEMPI INTER-EVENTO:
+    - Tempo medio: {interevent['mean_hours']:.1f} ore
+    - Coefficiente di variazione: {interevent['cv']:.2f} (1 = Poisson, > 1 = sismicità a grappoli)
+    - Fit gamma: k = {interevent['gamma_shape']:.2f}, θ = {interevent['gamma_scale']:.1f} ore
+    """
+    return context
 
-st.session_state['ai_context_global'] = stats_context
-st.session_state['ai_context_selection'] = "" # Clear stale selection from other pages
+register_context("global", stats_context, key=("statistica", Sidebar.filter_key()))
+register_context("selection", None) # Clear stale selection from other pages
 
 render_ai_assistant(context_text="Pagina di Analisi Statistica Avanzata (Legge G-R, Timeline, Tempi d'attesa).")
\ No newline at end of file
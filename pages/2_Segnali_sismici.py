@@ -2,7 +2,6 @@ import os
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
 import plotly.express as px
 from obspy import UTCDateTime
 
@@ -10,7 +9,17 @@ from utils.fetch_waveform import fetch_waveform
 from utils.ai_assistant import render_ai_assistant
 from utils.fetch_waveform import fetch_waveform
 from utils.ai_assistant import render_ai_assistant
+from utils.ai_context import register_context
 from utils.seismology import fft_analysis
+from utils.load_data import load_comparison_data
+from utils.preprocessing import PreprocessConfig, preprocess, get_streaming_preprocessor
+from utils.downsample import plot_waveform
+from utils.realtime_chart import realtime_chart, realtime_spectrogram
+from utils.fingerprint import LABELS, FingerprintIndex, fingerprint, majority_label
+from utils.sds_archive import read_trace
+from utils.noise import DAY_HOURS, NIGHT_HOURS, files_version, noise_percentiles, plot_noise_levels, stored_channels
+from utils.helicorder import plot_helicorder, plot_long_window
+from utils.spectral import WINDOW_FUNCTIONS, SEGMENT_LENGTHS, get_realtime_engine, psd_frame
 
 st.set_page_config(
     layout="wide",
@@ -22,6 +31,8 @@ st.title("Segnali sismici")
 with st.sidebar:
     st.markdown("### Impostazioni")
     refresh_rate_options = {
+        "5 secondi": 5,
+        "10 secondi": 10,
         "30 secondi": 30,
         "1 minuto": 60,
         "2 minuti": 120,
@@ -30,10 +41,26 @@ with st.sidebar:
     selected_refresh_label = st.selectbox(
         "Tempo di aggiornamento",
         options=list(refresh_rate_options.keys()),
-        index=1 # Default to 1 minute
+        index=3 # Default to 1 minute
     )
     refresh_rate = refresh_rate_options[selected_refresh_label]
 
+    st.markdown("### Analisi spettrale")
+    spectral_window = st.selectbox("Finestra", options=list(WINDOW_FUNCTIONS.keys()), index=0)
+    spectral_nperseg = st.select_slider("Lunghezza segmento (campioni)", options=SEGMENT_LENGTHS, value=256)
+    st.markdown("### Pre-elaborazione")
+    band = st.slider("Banda passante (Hz)", 0.1, 45.0, (0.5, 20.0), 0.1)
+    if band[0] == band[1]:
+        st.caption("Banda vuota: nessun filtro applicato.")
+    remove_response = st.checkbox("Rimuovi risposta strumentale", value=True)
+    preprocess_config = PreprocessConfig(freqmin=band[0], freqmax=band[1], response="full" if remove_response else None)
+
+    spectral_config = {
+        "nperseg": spectral_nperseg,
+        "window": spectral_window,
+        "fmax": 20.0,
+    }
+
 # http://portale2.ov.ingv.it/segnali/OVO_HHZ_attuale.html
 stations = [
     "OVO",   # Osservatorio Vesuviano
@@ -56,6 +83,9 @@ stations_channels = {
     "SORR": "HHZ",
 }
 
+# Length (s) of the real-time buffer shown for each station
+REALTIME_WINDOW = 300
+
 stations_colors = {
     "OVO": "orange",
     "CSFT": "red",
@@ -73,91 +103,98 @@ if "waveforms" not in st.session_state:
 
 def update_buffer(station, target_end_time, window_duration=300):
     """
-    Updates the waveform buffer for a station.
+    Updates the waveform buffer (CompactTrace) for a station.
     Fetches only missing data since the last update.
+    Windows kept by scripts/archiver.py are read from the local archive (see fetch_waveform).
     """
     buffer = st.session_state.waveforms.get(station)
     
     # Define channel
     channel = stations_channels[station]
+    target_end = target_end_time.timestamp()
     
     if buffer is None or buffer.empty:
         # Initial fill
-        start_time = target_end_time - pd.Timedelta(seconds=window_duration)
-        new_df = fetch_waveform(station, UTCDateTime(start_time), duration=window_duration, channel=channel)
-        if new_df is not None and not new_df.empty:
-            st.session_state.waveforms[station] = new_df
+        start_time = target_end - window_duration
+        new_trace = fetch_waveform(station, UTCDateTime(start_time), duration=window_duration, channel=channel)
+        if new_trace is not None and not new_trace.empty:
+            st.session_state.waveforms[station] = new_trace
     else:
         # Incremental update
-        last_time = buffer['times'].max()
+        last_time = buffer.endtime
         
         # If the gap is too large (e.g. > 10s), reset and full fetch
-        if (target_end_time - last_time).total_seconds() > 10:
+        if target_end - last_time > 10:
              # Reset buffer
-             start_time = target_end_time - pd.Timedelta(seconds=window_duration)
-             new_df = fetch_waveform(station, UTCDateTime(start_time), duration=window_duration, channel=channel)
-             if new_df is not None and not new_df.empty:
-                 st.session_state.waveforms[station] = new_df
+             start_time = target_end - window_duration
+             new_trace = fetch_waveform(station, UTCDateTime(start_time), duration=window_duration, channel=channel)
+             if new_trace is not None and not new_trace.empty:
+                 st.session_state.waveforms[station] = new_trace
              return
 
         # Fetch only new data if needed
         # We add a small overlap (0.1s) to ensure continuity/stitching
-        fetch_start = last_time - pd.Timedelta(seconds=0.1)
-        duration_to_fetch = (target_end_time - fetch_start).total_seconds()
+        fetch_start = last_time - 0.1
+        duration_to_fetch = target_end - fetch_start
         
         if duration_to_fetch > 0:
-            new_df = fetch_waveform(station, UTCDateTime(fetch_start), duration=duration_to_fetch, channel=channel)
+            new_trace = fetch_waveform(station, UTCDateTime(fetch_start), duration=duration_to_fetch, channel=channel)
             
-            if new_df is not None and not new_df.empty:
-                # Concatenate
-                combined = pd.concat([buffer, new_df])
-                # Drop duplicates on time
-                combined = combined.drop_duplicates(subset='times')
-                # Sort
-                combined = combined.sort_values('times')
-                # Trim to window size
-                cutoff_time = target_end_time - pd.Timedelta(seconds=window_duration)
-                combined = combined[combined['times'] >= cutoff_time]
-                
+            if new_trace is not None and not new_trace.empty:
+                # Merge on the buffer's sample grid (overlap is deduplicated, holes become NaN)
+                # and trim to window size
+                combined = buffer.merge(new_trace).slice(starttime=target_end - window_duration)
                 st.session_state.waveforms[station] = combined
 
 
 def render_tab(station):
-    df = st.session_state.waveforms.get(station)
+    trace = st.session_state.waveforms.get(station)
     
-    if df is None or df.empty:
+    if trace is None or trace.empty:
         st.warning("In attesa di dati...")
         return
 
     st.subheader(f"Stazione: {stations_names[station]} ({station})")
 
+    # Only the samples appended since the last refresh go through the pipeline
+    trace = get_streaming_preprocessor(station, preprocess_config).process(trace)
+
     col1, col2 = st.columns([3, 1])
 
     with col1:
         st.markdown("**Dominio del tempo**")
-        fig = go.Figure()
-        # Ensure times are datetime for proper valid plotting
-        fig.add_trace(go.Scatter(x=df['times'], y=df['velocity'], line=dict(color=stations_colors[station], width=1), name="Velocity"))
-        fig.update_layout(height=300, margin=dict(l=0, r=0, t=30, b=0), xaxis_title="Time", yaxis_title="Velocity (m/s)")
-        st.plotly_chart(fig, width='stretch', height=300)
+        # Only the samples arrived since the last refresh are sent to the browser
+        # A new preprocessing configuration redraws the whole window (and its units)
+        realtime_chart(trace, key=f"realtime_{station}", color=stations_colors[station], window_seconds=REALTIME_WINDOW,
+                       source=preprocess_config)
+
+        # Only the segments completed since the last refresh are transformed
+        engine = get_realtime_engine(station, source=preprocess_config, sampling_rate=trace.sampling_rate,
+                                     **spectral_config)
+        engine.update(trace.data, trace.starttime)
 
         st.markdown("**Dominio delle frequenze**")
-        fft_df = fft_analysis(df)
+        fft_df = psd_frame(engine)
         if not fft_df.empty:
             fig_fft = px.line(fft_df, x='Freq (Hz)', y='Power')
             fig_fft.update_traces(line_color=stations_colors[station])
             st.plotly_chart(fig_fft, width='stretch', height=300)
 
+        st.markdown("**Spettrogramma**")
+        # Only the columns completed since the last refresh are sent to the browser
+        realtime_spectrogram(engine, key=f"realtime_spec_{station}", source=preprocess_config)
+
     with col2:
         # Calculate simple Z-Score on a rolling window
         window_size = 100 # 1 second if 100Hz
-        # We assume regular sampling approx.
-        df['rolling_mean'] = df['velocity'].rolling(window_size).mean()
-        df['rolling_std'] = df['velocity'].rolling(window_size).std()        
+        # Samples are on a regular grid (gaps are NaN and skipped by the rolling window)
+        velocity = pd.Series(trace.data, dtype="float64")
+        rolling_mean = velocity.rolling(window_size).mean()
+        rolling_std = velocity.rolling(window_size).std()
         # Avoid div by zero
-        df['z_score_inst'] = (df['velocity'] - df['rolling_mean']).abs() / (df['rolling_std'] + 1e-6)
-        max_z = df['z_score_inst'].max()
-        # avg_z = df['z_score_inst'].mean()
+        z_score_inst = (velocity - rolling_mean).abs() / (rolling_std + 1e-6)
+        max_z = z_score_inst.max()
+        # avg_z = z_score_inst.mean()
         st.metric("Max Z-Score (allarme)", f"{max_z:.1f}", delta="CRITICAL" if max_z > 5 else "NORMAL")
         
         # Update status for AI Context
@@ -179,7 +216,7 @@ def render_realtime_dashboard():
     
     # Target time: now (delayed by ~5m to match original logic)
     now = UTCDateTime.now()
-    window_duration = 300
+    window_duration = REALTIME_WINDOW
     target_end_time = now - 300 
     
     # Convert to pandas timestamp for buffer arithmetic
@@ -208,40 +245,89 @@ def render_realtime_dashboard():
 st.header("Segnali in tempo reale")
 render_realtime_dashboard()
 
-# --- Comparison Section ---
+# --- Archive Section ---
 
 st.markdown("---")
-st.header("Confronto eventi: Naturale vs antropico")
+st.header("Archivio: elicorder e finestre lunghe")
+
+long_window_options = {
+    "6 ore": 6 * 3600,
+    "24 ore": 86400,
+    "3 giorni": 3 * 86400,
+    "7 giorni": 7 * 86400,
+}
 
-event_tabs = st.tabs(["Evento naturale (Terremoto Campania)", "Evento antropico (Festa scudetto)"])
 
-# Load comparison data
-@st.cache_data
-def load_comparison_data():
-    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
-    quake = pd.read_csv(os.path.join(data_dir, 'waveform_max_event_flegrei.csv')) if os.path.exists(os.path.join(data_dir, 'waveform_max_event_flegrei.csv')) else None
-    napoli = pd.read_csv(os.path.join(data_dir, 'waveform_napoli_scudetto.csv')) if os.path.exists(os.path.join(data_dir, 'waveform_napoli_scudetto.csv')) else None
-    return quake, napoli
+@st.fragment
+def render_archive_views():
+    # Drawn from the min/max pyramid kept by scripts/archiver.py: constant cost for any span
+    col_station, col_day, col_row = st.columns(3)
+    station = col_station.selectbox("Stazione", options=stations, format_func=lambda s: f"{s} - {stations_names[s]}")
+    day = col_day.date_input("Giorno (UTC)", value=pd.Timestamp.now(tz="UTC").date())
+    row_minutes = col_row.selectbox("Durata riga (minuti)", options=[15, 30, 60], index=1)
+    seed_id = f"IV.{station}.*.{stations_channels[station]}"
+
+    tab_heli, tab_long, tab_noise = st.tabs(["Elicorder (24 ore)", "Finestra lunga", "Livelli di rumore (PPSD)"])
+    with tab_heli:
+        day_start = pd.Timestamp(day).timestamp()
+        fig = plot_helicorder(seed_id, day_start, row_minutes, color=stations_colors[station])
+        if fig is None:
+            st.info("Nessun dato archiviato per questo giorno. Avvia `scripts/archiver.py`.")
+        else:
+            st.plotly_chart(fig, width='stretch')
+
+    with tab_long:
+        span_label = st.selectbox("Intervallo", options=list(long_window_options.keys()), index=1)
+        end = UTCDateTime.now().timestamp
+        fig = plot_long_window(seed_id, end - long_window_options[span_label], end, color=stations_colors[station])
+        if fig is None:
+            st.info("Nessun dato archiviato nell'intervallo. Avvia `scripts/archiver.py`.")
+        else:
+            st.plotly_chart(fig, width='stretch')
+
+    with tab_noise:
+        # Hourly PSD histograms accumulated by scripts/update_ppsd.py
+        noise_days = st.selectbox("Periodo", options=[7, 30, 90], index=1, format_func=lambda d: f"Ultimi {d} giorni")
+        channels = stored_channels("IV", station, stations_channels[station])
+        # Whole UTC days (through the end of today), so the cache key only changes daily
+        end = (UTCDateTime(UTCDateTime.now().date) + 86400).timestamp
+        start = end - noise_days * 86400
+        percentiles = None
+        if channels:
+            percentiles = noise_percentiles(channels[0], start, end, files_version(channels[0], start, end))
+        if percentiles is None:
+            st.info("Nessun istogramma PPSD nel periodo. Esegui `scripts/update_ppsd.py`.")
+        else:
+            st.caption(f"{channels[0]}: {percentiles['segments']} segmenti orari. "
+                       f"Giorno {DAY_HOURS[0]}-{DAY_HOURS[1]} UTC, notte {NIGHT_HOURS[0]}-{NIGHT_HOURS[1]} UTC.")
+            st.plotly_chart(plot_noise_levels(percentiles, color=stations_colors[station]), width='stretch')
+
+
+render_archive_views()
+
+# --- Comparison Section ---
+
+st.markdown("---")
+st.header("Confronto eventi: eventi noti più simili")
 
-quake_df, napoli_df = load_comparison_data()
+quake_trace, napoli_trace = load_comparison_data()
 
-def render_comparison_tab(df, title, color):
-    if df is None:
+def render_comparison_tab(trace, title, color):
+    if trace is None:
         st.warning("Dati non trovati. Esegui `scripts/fetch_data.py`.")
         return
 
+    trace = preprocess(trace, preprocess_config)
+
     st.subheader(f"{title}")
     
     # Time Domain
     st.markdown("**Dominio del tempo**")
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=df['times'], y=df['velocity'], line=dict(color=color, width=1), name="Velocity"))
-    fig.update_layout(height=250, margin=dict(l=0, r=0, t=10, b=0), xaxis_title="Time", yaxis_title="Velocity (m/s)")
-    st.plotly_chart(fig, width='stretch', height=250)
+    plot_waveform(trace, key=f"comparison_{color}", color=color, height=250, margin=dict(l=0, r=0, t=10, b=0))
 
     # Frequency Domain
     st.markdown("**Dominio delle frequenze**")
-    fft_df = fft_analysis(df)
+    fft_df = fft_analysis(trace, nperseg=spectral_nperseg, window=spectral_window)
     if not fft_df.empty:
         fig_fft = px.line(fft_df, x='Freq (Hz)', y='Power')
         fig_fft.update_traces(line_color=color)
@@ -266,36 +352,104 @@ else:
     st.warning("Dati non trovati. Esegui `scripts/fetch_data.py`.")
     quake_title = "Terremoto (Max Campi Flegrei)"
 
-with event_tabs[0]:
-    render_comparison_tab(
-        quake_df, 
-        quake_title, 
-        "green"
-    )
+scudetto_title = "Festa scudetto Napoli (Stadio Maradona)"
 
-with event_tabs[1]:
-    render_comparison_tab(
-        napoli_df, 
-        "Festa scudetto Napoli (Stadio Maradona)", 
-        "blue"
-    )
+# Reference recordings: (trace, label, title)
+reference_signals = {
+    "ref/flegrei": (quake_trace, "terremoto", quake_title),
+    "ref/scudetto": (napoli_trace, "antropico", scudetto_title),
+}
 
 
-# --- AI Context Generation ---
-realtime_context = "MONITORAGGIO TEMPO REALE:\n"
-if 'realtime_status' in st.session_state:
-    for st_code, status in st.session_state.realtime_status.items():
-        realtime_context += f"- Stazione {st_code}: Z-Score={status['max_z']:.1f} ({status['status']})\n"
+@st.cache_resource
+def load_fingerprint_index():
+    """
+    Index of the archived windows (scripts/build_fingerprints.py) plus the reference recordings.
+    Built once per server process and shared by every session.
+    """
+    index = FingerprintIndex.load()
+    vectors, labels, metadata = [], [], []
+    for ref_id, (trace, label, title) in reference_signals.items():
+        vector = fingerprint(trace)
+        if vector is not None:
+            vectors.append(vector)
+            labels.append(label)
+            metadata.append({"id": ref_id, "name": title})
+    if vectors:
+        index.add_batch(np.vstack(vectors), labels, metadata)
+    return index
+
+
+def load_neighbour_trace(neighbour):
+    """Waveform of an indexed signal: a reference recording or a window of the local archive."""
+    if neighbour["id"] in reference_signals:
+        return reference_signals[neighbour["id"]][0]
+    network, station, location, channel = neighbour["seed_id"].split(".")
+    return read_trace(network, station, location or "*", channel,
+                      UTCDateTime(neighbour["start"]), UTCDateTime(neighbour["end"]), min_coverage=0.0)
+
+
+def neighbour_title(neighbour):
+    if "name" in neighbour:
+        return neighbour["name"]
+    title = f"{LABELS[neighbour['label']]} {neighbour['seed_id']} {neighbour['time']}"
+    if neighbour.get("magnitude") is not None:
+        title += f" (M{neighbour['magnitude']})"
+    return title
+
+
+fingerprint_index = load_fingerprint_index()
+
+# Query: a real-time buffer or one of the reference recordings
+query_options = {f"Tempo reale - {stations_names[s]} ({s})": (f"realtime/{s}", st.session_state.waveforms.get(s))
+                 for s in stations if st.session_state.waveforms.get(s) is not None}
+query_options.update({title: (ref_id, trace) for ref_id, (trace, _, title) in reference_signals.items()})
+
+col_query, col_k = st.columns([3, 1])
+query_label = col_query.selectbox("Segnale da confrontare", options=list(query_options.keys()))
+n_neighbours = col_k.slider("Eventi simili", 1, 10, 5)
+query_id, query_trace = query_options[query_label]
+
+neighbours = fingerprint_index.query(fingerprint(query_trace), n_neighbours, exclude_id=query_id)
+
+if not neighbours:
+    st.info("Nessun evento noto da confrontare. Esegui `scripts/build_fingerprints.py` dopo aver popolato l'archivio.")
 else:
-    realtime_context += "In attesa di dati dalle stazioni...\n"
+    best_label = majority_label(neighbours)
+    st.metric("Classe più probabile", LABELS[best_label])
+    st.dataframe(pd.DataFrame([{
+        "Etichetta": LABELS[n["label"]],
+        "Segnale": neighbour_title(n),
+        "Distanza": round(n["distance"], 2),
+    } for n in neighbours]), hide_index=True, width='stretch')
+
+col_left, col_right = st.columns(2)
+with col_left:
+    render_comparison_tab(query_trace, query_label, "blue")
+with col_right:
+    if neighbours:
+        best = neighbours[0]
+        render_comparison_tab(load_neighbour_trace(best), f"Più simile: {neighbour_title(best)}", "green")
+
+
+# --- AI Context Generation ---
+def signals_context(query_label=query_label, neighbours=neighbours):
+    # Realtime status changes at every refresh: read when the question is asked
+    realtime_context = "MONITORAGGIO TEMPO REALE:\n"
+    if 'realtime_status' in st.session_state:
+        for st_code, status in st.session_state.realtime_status.items():
+            realtime_context += f"- Stazione {st_code}: Z-Score={status['max_z']:.1f} ({status['status']})\n"
+    else:
+        realtime_context += "In attesa di dati dalle stazioni...\n"
 
-comparison_context = f"""
+    comparison_context = f"""
 CONFRONTO EVENTI:
-1. {quake_title} (Naturale)
-2. Festa Scudetto Napoli (Antropico)
-"""
+Segnale analizzato: {query_label}
+Eventi noti più simili (firma spettrale):
+""" + "".join(f"- {neighbour_title(n)} [{LABELS[n['label']]}], distanza {n['distance']:.2f}\n" for n in neighbours)
+    return realtime_context + "\n" + comparison_context
 
-st.session_state['ai_context_global'] = realtime_context + "\n" + comparison_context
-st.session_state['ai_context_selection'] = ""
+register_context("global", signals_context)
+register_context("selection", None)
 
 render_ai_assistant(context_text="Pagina Lab Segnali: Monitoraggio realtime e confronto firma sismica.")
@@ -1,11 +1,16 @@
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import numpy as np
 
 from utils.sidebar import Sidebar
 from utils.load_data import load_data
 from utils.ai_assistant import render_ai_assistant
+from utils.ai_context import register_context
 from utils.seismology import calculate_gutenberg_richter
+from utils.compute_graph import ComputeGraph
+from utils.rate_analytics import SIGNIFICANCE, daily_counts, rate_changes
 
 
 unfiltered_df = load_data()
@@ -25,6 +30,158 @@ st.title("Allerte e anomalie")
 
 st.header("Analisi sismologica (Gutenberg-Richter)")
 
+graph = ComputeGraph("allerte")
+# Captured once per full run: the Sidebar class attributes are shared by every session,
+# so the fragments below read the filters of this run through the graph
+graph.source("filters", Sidebar.filter_key())
+graph.source("df", df, token=(df.attrs.get("catalog_version"), graph.get("filters")))
+
+
+@graph.node("gr_params", "df")
+def gutenberg_richter(df):
+    return calculate_gutenberg_richter(df)
+
+
+@graph.node("return_periods", "df", "gr_params")
+def return_periods(df, gr_params):
+    # Calculate period duration in years from filtered dataset
+    delta_t_years = (df['time'].max() - df['time'].min()).days / 365.25
+    if delta_t_years < 0.01: delta_t_years = 0.01 
+
+    # Gutenberg-Richter: log10(N) = a - bM
+    log_n = gr_params['a_value'] - gr_params['b_value'] * df['magnitude'].to_numpy()
+    with np.errstate(divide='ignore'):
+        # n_predicted == 0 gives an infinite return period
+        return_period = delta_t_years / 10 ** log_n
+    return df.assign(return_period_years=return_period)
+
+
+@graph.node("rarity_figure", "return_periods")
+def rarity_figure(events):
+    return px.scatter(events, x="time", y="return_period_years",
+                      size="magnitude",
+                      color="return_period_years",
+                      color_continuous_scale="Turbo",
+                      title="Rarità degli eventi (Tempo di ritorno)",
+                      labels={"return_period_years": "Tempo di ritorno stimato (anni)", "time": "Data", "magnitude": "Magnitudo"},
+                      log_y=True) 
+
+
+@graph.node("anomalies", "return_periods", "tr_thresh")
+def find_anomalies(events, tr_thresh):
+    return events[events['return_period_years'] > tr_thresh]
+
+
+@graph.node("daily_counts", "df")
+def events_per_day(df):
+    return daily_counts(df['time'].to_numpy())
+
+
+@graph.node("rate_changes", "daily_counts", "rate_windows")
+def rolling_rate_changes(daily, rate_windows):
+    window_days, bin_days = rate_windows
+    return rate_changes(daily, window_days, bin_days)
+
+
+@graph.node("rate_figure", "rate_changes")
+def rate_figure(rates):
+    fig_rate = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.08,
+                             subplot_titles=("Eventi nella finestra", "Statistiche di variazione del tasso"))
+    fig_rate.add_trace(go.Scatter(x=rates['time'], y=rates['count'], mode='lines', name="Eventi"), row=1, col=1)
+    fig_rate.add_trace(go.Scatter(x=rates['time'], y=rates['beta'], mode='lines', name="β"), row=2, col=1)
+    fig_rate.add_trace(go.Scatter(x=rates['time'], y=rates['z'], mode='lines', name="Z"), row=2, col=1)
+    for level in (SIGNIFICANCE, -SIGNIFICANCE):
+        fig_rate.add_hline(y=level, line_dash="dot", line_color="red", row=2, col=1)
+    fig_rate.update_layout(height=550)
+    return fig_rate
+
+
+def alerts_context(tr_thresh=None, anomalies=None):
+    if df.empty:
+        return "Nessun dato."
+    if tr_thresh is None:
+        return "Parametri Gutenberg-Richter non disponibili per il dataset filtrato."
+    context = f"""
+    ANALISI ANOMALIE (Tempo di Ritorno):
+    - Soglia Rarità impostata: {tr_thresh} anni
+    - b-value utilizzato: {b_value:.2f}
+    """
+
+    if not anomalies.empty:
+        context += f"\n    - EVENTI ANOMALI RILEVATI ({len(anomalies)}):\n"
+        # List top 5 anomalies
+        top_anomalies = anomalies.nlargest(5, 'return_period_years')
+        context += "".join(
+            f"      * Data: {t}, Mag: {m}, TR: {tr:.1f} anni\n"
+            for t, m, tr in zip(top_anomalies['time'], top_anomalies['magnitude'], top_anomalies['return_period_years'])
+        )
+    else:
+        context += "\n    - Nessuna anomalia rilevata con i filtri attuali."
+    return context
+
+
+# Moving the threshold reruns this panel only
+@graph.panel("rarity_figure", interactive=True)
+def rarity_panel(fig_tr):
+    st.divider()
+    st.header("Analisi anomalie probabilistiche")
+    
+    tr_thresh = st.slider("Soglia 'rarità' (Tempo di ritorno in anni)", 
+                          min_value=0.1, max_value=100.0, value=1.0, step=0.1)
+    graph.source("tr_thresh", tr_thresh)
+    anomalies = graph.get("anomalies")
+
+    # The memoised figure is shared by every run: the threshold line is drawn on a copy
+    fig_tr = go.Figure(fig_tr)
+    fig_tr.add_hline(y=tr_thresh, line_dash="dash", line_color="red", annotation_text=f"Soglia > {tr_thresh} anni")
+    st.plotly_chart(fig_tr, width="stretch")
+
+    if not anomalies.empty:
+        st.error(f"Rilevati {len(anomalies)} eventi 'rari' nel dataset selezionato!")
+        st.dataframe(
+            anomalies[['time', 'magnitude', 'depth', 'return_period_years']]
+            .sort_values('return_period_years', ascending=False)
+            .head(20)
+            .style.format({'return_period_years': "{:.2f}"}),
+            hide_index=True
+        )
+    else:
+        st.info("Nessun evento supera la soglia di tempo di ritorno impostata.")
+
+    register_context("global", lambda: alerts_context(tr_thresh, anomalies),
+                     key=("allerte", graph.get("filters"), tr_thresh))
+
+
+# Changing the windows reruns this panel only
+@graph.panel(interactive=True)
+def rate_panel():
+    st.divider()
+    st.header("Variazioni del tasso di sismicità")
+    st.markdown(f"Ogni finestra è confrontata con il resto del catalogo filtrato: β e Z oltre ±{SIGNIFICANCE:g} indicano una variazione significativa (positivi per un aumento).")
+
+    c1, c2 = st.columns(2)
+    window_days = c1.select_slider("Finestra (giorni)", options=[7, 14, 30, 90, 180, 365], value=30)
+    bin_days = c2.select_slider("Intervallo di conteggio (giorni)", options=[1, 7], value=1)
+    graph.source("rate_windows", (window_days, bin_days))
+    rates = graph.get("rate_changes")
+
+    if rates.empty:
+        st.info("Periodo selezionato troppo breve rispetto alla finestra.")
+        return
+    st.plotly_chart(graph.get("rate_figure"), width="stretch")
+
+    latest = rates.iloc[-1]
+    if latest['beta'] > SIGNIFICANCE:
+        st.error(f"Aumento significativo del tasso nell'ultima finestra ({latest['time']:%d/%m/%Y}): β = {latest['beta']:.2f}, Z = {latest['z']:.2f}.")
+    elif latest['beta'] < -SIGNIFICANCE:
+        st.info(f"Diminuzione significativa del tasso nell'ultima finestra ({latest['time']:%d/%m/%Y}): β = {latest['beta']:.2f}, Z = {latest['z']:.2f}.")
+    else:
+        st.success(f"Nessuna variazione significativa nell'ultima finestra ({latest['time']:%d/%m/%Y}): β = {latest['beta']:.2f}, Z = {latest['z']:.2f}.")
+
+
+# Replaced by the rarity panel when the G-R parameters are valid
+register_context("global", alerts_context, key=("allerte", graph.get("filters"), None))
+
 # Directly use the user's filtered dataframe for all statistics.
 # This allows the expert to see how parameters (b-value) change 
 # with filters (e.g. magnitude cut).
@@ -33,7 +190,7 @@ if df.empty:
 else:
     # 2. Estimate G-R Parameters on FILTERED data
 
-    gr_params = calculate_gutenberg_richter(df)
+    gr_params = graph.get("gr_params")
     mc = gr_params['mc']
     b_value = gr_params['b_value']
     a_value = gr_params['a_value']
@@ -59,76 +216,11 @@ else:
     # 3. Calculate Return Period
     
     if not np.isnan(b_value): # Proceed only if we have valid parameters
-        # Calculate period duration in years from filtered dataset
-        if not df.empty:
-            delta_t_years = (df['time'].max() - df['time'].min()).days / 365.25
-            if delta_t_years < 0.01: delta_t_years = 0.01 
-        else:
-            delta_t_years = 1.0
-
-        def calc_return_period(m):
-            # Gutenberg-Richter: log10(N) = a - bM
-            log_n = a_value - (b_value * m)
-            n_predicted = 10 ** log_n
-            
-            if n_predicted == 0: return np.inf
-            return delta_t_years / n_predicted
-
-        df['return_period_years'] = df['magnitude'].apply(calc_return_period)
-
-        # Plotting & Alerts
-        st.divider()
-        st.header("Analisi anomalie probabilistiche")
-        
-        tr_thresh = st.slider("Soglia 'rarità' (Tempo di ritorno in anni)", 
-                              min_value=0.1, max_value=100.0, value=1.0, step=0.1)
-
-        anomalies = df[df['return_period_years'] > tr_thresh]
-
-        fig_tr = px.scatter(df, x="time", y="return_period_years",
-                            size="magnitude",
-                            color="return_period_years",
-                            color_continuous_scale="Turbo",
-                            title="Rarità degli eventi (Tempo di ritorno)",
-                            labels={"return_period_years": "Tempo di ritorno stimato (anni)", "time": "Data", "magnitude": "Magnitudo"},
-                            log_y=True) 
-        
-        fig_tr.add_hline(y=tr_thresh, line_dash="dash", line_color="red", annotation_text=f"Soglia > {tr_thresh} anni")
-        st.plotly_chart(fig_tr, width="stretch")
-
-        if not anomalies.empty:
-            st.error(f"Rilevati {len(anomalies)} eventi 'rari' nel dataset selezionato!")
-            st.dataframe(
-                anomalies[['time', 'magnitude', 'depth', 'return_period_years']]
-                .sort_values('return_period_years', ascending=False)
-                .head(20)
-                .style.format({'return_period_years': "{:.2f}"}),
-                hide_index=True
-            )
-        else:
-            st.info("Nessun evento supera la soglia di tempo di ritorno impostata.")
-
-
-# --- AI Context Generation ---
-if df.empty:
-    alerts_context = "Nessun dato."
-else:
-    alerts_context = f"""
-    ANALISI ANOMALIE (Tempo di Ritorno):
-    - Soglia Rarità impostata: {tr_thresh} anni
-    - b-value utilizzato: {b_value:.2f}
-    """
-    
-    if not anomalies.empty:
-        alerts_context += f"\n    - EVENTI ANOMALI RILEVATI ({len(anomalies)}):\n"
-        # List top 5 anomalies
-        top_anomalies = anomalies.sort_values('return_period_years', ascending=False).head(5)
-        for _, row in top_anomalies.iterrows():
-            alerts_context += f"      * Data: {row['time']}, Mag: {row['magnitude']}, TR: {row['return_period_years']:.1f} anni\n"
-    else:
-        alerts_context += "\n    - Nessuna anomalia rilevata con i filtri attuali."
+        rarity_panel()
+
+    # 4. Rate changes (independent of the G-R parameters)
+    rate_panel()
 
-st.session_state['ai_context_global'] = alerts_context
-st.session_state['ai_context_selection'] = ""
+register_context("selection", None)
 
 render_ai_assistant(context_text="Pagina Allerte: Analisi probabilistica del Tempo di Ritorno.")
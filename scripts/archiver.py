@@ -0,0 +1,135 @@
+import argparse
+import os
+import signal
+import sys
+import tempfile
+
+import numpy as np
+from obspy import Stream, Trace, UTCDateTime
+
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utils.acquisition import (DEFAULT_CHANNELS, DEFAULT_LATENCY, DEFAULT_RETENTION_DAYS, MAX_CHUNK,
+                               STATE_PATH, Archiver, FDSNSource, ReplaySource)
+from utils.sds_archive import ARCHIVE_DIR, read_stream, write_stream
+from utils.trace import CompactTrace
+
+
+def parse_channel(text: str) -> tuple:
+    """NET.STA.LOC.CHA (empty or '*' location allowed)."""
+    parts = text.split(".")
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError(f"expected NET.STA.LOC.CHA, got '{text}'")
+    return tuple(p if p else "*" for p in parts)
+
+
+def check():
+    """
+    Archives a generated replay archive (one hour across midnight, with a 5-minute gap)
+    step by step, restarting the archiver halfway, and verifies the result sample by sample.
+    """
+    rate, latency = 20.0, 60.0
+    recorded_start = UTCDateTime(2024, 1, 1, 23, 30)
+    gap = (1800, 2100)  # seconds after recorded_start with no data
+    shift = 400 * 86400  # whole days: the archived hour crosses midnight too
+    live_start = recorded_start + shift
+
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-1000, 1000, int(3600 * rate)).astype(np.int32)
+    header = {"network": "IV", "station": "OVO", "location": "", "channel": "HHZ", "sampling_rate": rate}
+    n_before, n_after = int(gap[0] * rate), int(gap[1] * rate)
+    recorded = Stream([Trace(samples[:n_before], header={**header, "starttime": recorded_start}),
+                       Trace(samples[n_after:], header={**header, "starttime": recorded_start + gap[1]})])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        replay_dir, archive_dir = os.path.join(tmp, "replay"), os.path.join(tmp, "sds")
+        state_path, pyramid_dir = os.path.join(tmp, "state.json"), os.path.join(tmp, "pyramid")
+        write_stream(recorded, replay_dir)
+        source = ReplaySource(replay_dir, recorded_start, now=live_start)
+        channels = [("IV", "OVO", "*", "HHZ")]
+
+        def archiver():
+            return Archiver(source, channels, root=archive_dir, state_path=state_path, latency=latency,
+                            retention_days=0, pyramid_root=pyramid_dir)
+
+        # The first step starts MAX_CHUNK seconds before its target: that is the data start
+        now = live_start + MAX_CHUNK + latency
+        written = 0
+        for n_steps in (7, 8):  # Second part with a new archiver, resumed from the state file
+            current = archiver()
+            for _ in range(n_steps):
+                written += current.step(now)
+                now += 240
+        assert written == len(samples) - (n_after - n_before), f"{written} samples written"
+
+        stored = read_stream("IV", "OVO", "*", "HHZ", live_start, live_start + 3600, archive_dir)
+        assert sum(tr.stats.npts for tr in stored) == written, "records stored twice"
+        archived = CompactTrace.from_stream(stored)
+        assert abs(archived.starttime - live_start.timestamp) < 1e-6, "archive does not start at the data start"
+        assert archived.npts == len(samples), f"{archived.npts} samples archived (duplicates or losses)"
+        missing = np.isnan(archived.data)
+        assert missing.sum() == n_after - n_before and missing[n_before:n_after].all(), "gap not preserved"
+        assert np.array_equal(archived.data[~missing], samples[~missing].astype(np.float32)), "samples differ"
+        days = {d for d in os.listdir(os.path.join(archive_dir, str(live_start.year), "IV", "OVO", "HHZ.D"))}
+        assert len(days) == 2, f"expected two day files, found {sorted(days)}"
+        assert os.listdir(pyramid_dir), "pyramid not updated"
+
+        # Retention runs on a step: two days later only the newest day file is kept
+        Archiver(source, [], root=archive_dir, state_path=state_path, retention_days=1,
+                 pyramid_root=pyramid_dir).step(live_start + 2 * 86400)
+        remaining = read_stream("IV", "OVO", "*", "HHZ", live_start, live_start + 3600, archive_dir)
+        assert remaining and min(tr.stats.starttime for tr in remaining) >= UTCDateTime(
+            (live_start + 86400).date), "retention did not delete the old day file"
+
+    print(f"Archiver check passed: {written} samples across midnight, gap kept, restart resumed without duplicates.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Continuously archive station channels into the local SDS archive.")
+    parser.add_argument("--channels", type=parse_channel, nargs="+", default=DEFAULT_CHANNELS,
+                        metavar="NET.STA.LOC.CHA")
+    parser.add_argument("--fdsn", default=None, help="FDSN datacenter or base URL (default: FDSN_BASE_URL)")
+    parser.add_argument("--replay", default=None, metavar="SDS_DIR",
+                        help="Replay a local SDS archive instead of querying FDSN")
+    parser.add_argument("--replay-start", default=None, help="Recorded time replayed as 'now' (ISO format)")
+    parser.add_argument("--archive", default=ARCHIVE_DIR)
+    parser.add_argument("--state", default=STATE_PATH)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="Seconds behind real time")
+    parser.add_argument("--retention-days", type=int, default=DEFAULT_RETENTION_DAYS, help="0 keeps everything")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between polls")
+    parser.add_argument("--once", action="store_true", help="Run a single step and exit")
+    parser.add_argument("--check", action="store_true",
+                        help="Archive a generated replay archive into a temporary directory and verify it")
+    args = parser.parse_args()
+
+    if args.check:
+        check()
+        return
+
+    if args.replay:
+        if not args.replay_start:
+            parser.error("--replay requires --replay-start")
+        source = ReplaySource(args.replay, UTCDateTime(args.replay_start))
+    else:
+        source = FDSNSource(args.fdsn)
+
+    archiver = Archiver(source, args.channels, root=args.archive, state_path=args.state,
+                        latency=args.latency, retention_days=args.retention_days)
+    if args.once:
+        print(f"Archived {archiver.step()} samples.")
+        return
+
+    stop = {"requested": False}
+
+    def request_stop(signum, frame):
+        print("Stopping after the current step...")
+        stop["requested"] = True
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    print(f"Archiving {len(args.channels)} channels into {os.path.abspath(args.archive)} every {args.interval:.0f} s.")
+    archiver.run(args.interval, should_stop=lambda: stop["requested"])
+
+
+if __name__ == "__main__":
+    main()
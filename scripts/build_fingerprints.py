@@ -0,0 +1,83 @@
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from obspy import UTCDateTime
+
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from harvest_waveforms import REGIONS, select_events
+from utils.fingerprint import INDEX_PATH, FingerprintIndex, fingerprint
+from utils.sds_archive import ARCHIVE_DIR, read_trace
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+CATALOG_PATH = os.path.join(DATA_DIR, 'catalog.csv')
+
+# Window fingerprinted for each event (seconds from origin) and minimum data required
+EVENT_WINDOW = (0.0, 120.0)
+MIN_SECONDS = 30.0
+# Quiet window taken this long before each event, labelled as background noise
+NOISE_OFFSET = 3600.0
+
+
+def archived_stations(network: str, year: int, root: str = ARCHIVE_DIR) -> list[str]:
+    return sorted(os.path.basename(p) for p in glob.glob(os.path.join(root, str(year), network, "*")))
+
+
+def window_fingerprint(network: str, station: str, channel: str, start: UTCDateTime, end: UTCDateTime):
+    trace = read_trace(network, station, "*", channel, start, end, min_coverage=0.0)
+    if trace is None or np.count_nonzero(~np.isnan(trace.data)) < MIN_SECONDS * trace.sampling_rate:
+        return None, None
+    return fingerprint(trace), trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint the archived event windows into a similarity index.")
+    parser.add_argument("--region", choices=sorted(REGIONS), default="campania")
+    parser.add_argument("--minmag", type=float, default=2.5)
+    parser.add_argument("--network", default="IV")
+    parser.add_argument("--channel", default="HHZ")
+    args = parser.parse_args()
+
+    if not os.path.exists(CATALOG_PATH):
+        print("Catalog not found. Run scripts/fetch_data.py first.")
+        return
+    catalog = pd.read_csv(CATALOG_PATH, parse_dates=['time'])
+    events = select_events(catalog, args.region, args.minmag)
+
+    vectors, labels, metadata = [], [], []
+    for _, event in events.iterrows():
+        origin = UTCDateTime(event['time'])
+        for station in archived_stations(args.network, origin.year):
+            windows = [
+                ("terremoto", origin + EVENT_WINDOW[0], origin + EVENT_WINDOW[1]),
+                ("rumore", origin - NOISE_OFFSET, origin - NOISE_OFFSET + EVENT_WINDOW[1] - EVENT_WINDOW[0]),
+            ]
+            for label, start, end in windows:
+                vector, trace = window_fingerprint(args.network, station, args.channel, start, end)
+                if vector is None:
+                    continue
+                vectors.append(vector)
+                labels.append(label)
+                metadata.append({
+                    "id": f"{trace.seed_id}/{start.isoformat()}",
+                    "seed_id": trace.seed_id,
+                    "start": start.timestamp,
+                    "end": end.timestamp,
+                    "time": origin.isoformat()[:19],
+                    "magnitude": float(event['magnitude']) if label == "terremoto" else None,
+                })
+
+    index = FingerprintIndex()
+    if vectors:
+        index.add_batch(np.vstack(vectors), labels, metadata)
+    index.save(INDEX_PATH)
+    print(f"Indexed {len(index)} windows ({labels.count('terremoto')} events, {labels.count('rumore')} noise) "
+          f"-> {INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
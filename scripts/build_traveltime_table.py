@@ -0,0 +1,16 @@
+import os
+import sys
+import time
+
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utils.travel_times import DEFAULT_MODEL, DISTANCES, DEPTHS, build_table, save_table, table_path
+
+
+if __name__ == "__main__":
+    model = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL
+    print(f"Building travel-time table for model '{model}' ({len(DISTANCES)} distances x {len(DEPTHS)} depths)...")
+    t0 = time.time()
+    table = build_table(model)
+    save_table(table, model)
+    print(f"Saved {table_path(model)} in {time.time() - t0:.0f} s.")
@@ -0,0 +1,90 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utils import shared_catalog
+from utils.catalog_aggregates import COLUMNS, aggregate, aggregate_frame, filter_mask, frame_partition
+
+# Filters of the check: (years, depth, magnitude, latitude, longitude), as in Sidebar.filter_key
+CHECK_FILTERS = ((2021, 2023), (0.0, 30.0), (0.5, 9.0), (36.0, 46.0), (8.0, 18.0))
+
+
+def synthetic_catalog(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Clustered event times (with exact ties), outside-filter events and missing values."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2020-06-01T00:00:00", "ns")
+    # Background events, aftershock-like bursts and repeated instants (zero waiting times)
+    background = rng.uniform(0, 4 * 365 * 86400, rows // 2)
+    bursts = rng.choice(background, rows // 50)[:, None] + rng.exponential(600.0, (rows // 50, 20))
+    seconds = np.concatenate([background, bursts.ravel()])
+    seconds = np.sort(np.concatenate([seconds, rng.choice(seconds, rows - len(seconds))]))
+    df = pd.DataFrame({
+        "time": start + (seconds * 1e9).astype("timedelta64[ns]"),
+        "latitude": rng.uniform(34.0, 48.0, rows),
+        "longitude": rng.uniform(6.0, 20.0, rows),
+        "depth": rng.exponential(12.0, rows),
+        "magnitude": np.round(0.5 + rng.exponential(0.45, rows), 1),
+    })
+    df.loc[rng.choice(rows, rows // 100, replace=False), "magnitude"] = np.nan
+    df.loc[rng.choice(rows, rows // 100, replace=False), "depth"] = np.nan
+    return df
+
+
+def assert_same(name: str, expected, actual):
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(expected, actual, check_exact=True, obj=name)
+    elif isinstance(expected, pd.Series):
+        pd.testing.assert_series_equal(expected, actual, check_exact=True, obj=name)
+    elif isinstance(expected, dict):
+        assert expected.keys() == actual.keys(), f"{name}: keys differ"
+        for key in expected:
+            assert_same(f"{name}.{key}", expected[key], actual[key])
+    elif isinstance(expected, float) and np.isnan(expected):
+        assert isinstance(actual, float) and np.isnan(actual), f"{name}: {actual} instead of NaN"
+    else:
+        assert expected == actual, f"{name}: {actual!r} instead of {expected!r}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Verifies that the out-of-core aggregation of the statistics page (published catalog, "
+                    "one partition at a time) gives exactly the results of the in-memory path.")
+    parser.add_argument("--catalog", default=None, help="Catalog CSV to use (default: a synthetic catalog)")
+    parser.add_argument("--rows", type=int, default=20000, help="Events of the synthetic catalog")
+    parser.add_argument("--partition-rows", type=int, default=777)
+    args = parser.parse_args()
+
+    if args.catalog:
+        df = pd.read_csv(args.catalog, usecols=COLUMNS)
+        df['time'] = pd.to_datetime(df['time'])
+        filters = None
+    else:
+        df = synthetic_catalog(args.rows)
+        filters = CHECK_FILTERS
+    df = df.sort_values('time', kind='stable').reset_index(drop=True)
+
+    # In-memory path of the page: filtered frame, one partition
+    selected = df if filters is None else df[filter_mask(frame_partition(df), filters)]
+    expected = aggregate_frame(selected)
+
+    # Out-of-core path: published in small partitions, filtered while streaming
+    with tempfile.TemporaryDirectory() as shared_dir:
+        shared_catalog.SHARED_DIR = shared_dir  # Keep the published check catalog out of data/
+        shared_catalog.POINTER_PATH = os.path.join(shared_dir, 'current.json')
+        frames = (df.iloc[i:i + args.partition_rows] for i in range(0, len(df), args.partition_rows))
+        version = shared_catalog.publish(frames, source="check")["version"]
+        actual = aggregate(lambda: shared_catalog.iter_partitions(version, COLUMNS), filters)
+
+    assert_same("aggregates", expected, actual)
+    print(f"Aggregates identical: {expected['n_events']} of {len(df)} events, "
+          f"{-(-len(df) // args.partition_rows)} partitions of {args.partition_rows} rows.")
+
+
+if __name__ == "__main__":
+    main()
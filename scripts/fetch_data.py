@@ -1,13 +1,20 @@
 import os
+import sys
 from obspy import UTCDateTime
-from obspy.clients.fdsn import Client
 import pandas as pd
 
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utils.trace import CompactTrace
+from utils.fdsn import get_client
+from utils.inventory import load_inventory
+from utils.load_data import publish_catalog
+from utils.preprocessing import preprocess
+
 # Configuration
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
 os.makedirs(DATA_DIR, exist_ok=True)
 
-client = Client("INGV", force_redirect=True)
 chunks = [
     (UTCDateTime("2000-01-01"), UTCDateTime("2001-12-31")),
     (UTCDateTime("2002-01-01"), UTCDateTime("2003-12-31")),
@@ -32,7 +39,7 @@ def fetch_catalog():
         print(f"\t Requesting {starttime} to {endtime}...")
 
         try:
-            catalog = client.get_events(
+            catalog = get_client().get_events(
                 starttime=starttime, 
                 endtime=endtime, 
                 minmagnitude=2.5, 
@@ -78,8 +85,12 @@ def fetch_catalog():
         # Sort by time
         df = df.sort_values("time")
         output_path = os.path.join(DATA_DIR, "catalog.csv")
-        df.to_csv(output_path, index=False)
+        # Written aside and renamed, so running dashboards never read a partial file
+        df.to_csv(f"{output_path}.tmp", index=False)
+        os.replace(f"{output_path}.tmp", output_path)
         print(f"Total Catalog saved to {output_path} ({len(df)} events)")
+        pointer = publish_catalog()
+        print(f"Shared catalog version {pointer['version']} published")
         
         fetch_comparison_waveforms(df)
         
@@ -111,7 +122,7 @@ def fetch_comparison_waveforms(catalog_df):
 
     # 2. Download Quake Waveform
     success = save_waveform(
-        filename=f"waveform_max_event_flegrei.csv", 
+        filename="waveform_max_event_flegrei", 
         starttime=UTCDateTime(max_event['time']) - 60, # Start 1 min before
         duration=300, # 5 mins
         station="OVO", 
@@ -126,7 +137,7 @@ def fetch_comparison_waveforms(catalog_df):
     # 2023-05-04 20:37:00 UTC (Approximate time of goal/final whistle celebration)
     scudetto_time = UTCDateTime("2023-05-04T20:37:00")
     success = save_waveform(
-        filename=f"waveform_napoli_scudetto.csv",
+        filename="waveform_napoli_scudetto",
         starttime=scudetto_time, 
         duration=300, 
         station="OVO", 
@@ -138,10 +149,15 @@ def fetch_comparison_waveforms(catalog_df):
         print(f"Failed to download waveform for Napoli Scudetto.")
 
 
-def save_waveform(filename, starttime, duration, station, channel):
+def save_waveform(filename, starttime, duration, station, channel, preprocess_config=None):
+    """
+    Downloads a waveform and saves it as a CompactTrace (.npy + JSON header).
+    If preprocess_config is given, the trace is preprocessed (e.g. response removed) before saving;
+    by default raw counts are stored and the dashboard preprocesses them on display.
+    """
     print(f"Downloading {filename} from {station} starting {starttime}...")
     try:
-        st = client.get_waveforms(
+        st = get_client().get_waveforms(
             network="IV", 
             station=station, 
             location="*", 
@@ -150,20 +166,18 @@ def save_waveform(filename, starttime, duration, station, channel):
             endtime=starttime + duration
         )
         if len(st) > 0:
-            tr = st[0]
             # Resample strictly to 100Hz to ensure consistent data
-            tr.resample(100.0)
-            
-            # Create DF
-            times = pd.to_datetime(tr.times("timestamp"), unit="s")
-            df_wave = pd.DataFrame({
-                "times": times,
-                "velocity": tr.data
-            })
+            st.resample(100.0)
+            trace = CompactTrace.from_stream(st)
+            # Cache the station response locally together with the data
+            load_inventory(trace.network, trace.station)
+            if preprocess_config is not None:
+                trace = preprocess(trace, preprocess_config)
             
+            # Binary .npy samples + JSON header (memory-mappable by the dashboard)
             out_path = os.path.join(DATA_DIR, filename)
-            df_wave.to_csv(out_path, index=False)
-            print(f"Saved {filename} ({len(df_wave)} samples).")
+            trace.save(out_path)
+            print(f"Saved {filename}.npy ({trace.npts} samples, {len(trace.gaps())} gaps).")
             return True
         else:
             print(f"No waveforms found for {filename} at {station}.")
@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from obspy import UTCDateTime
+from obspy.clients.fdsn import Client
+from obspy.geodetics import locations2degrees
+
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utils.fdsn import get_client
+from utils.sds_archive import ARCHIVE_DIR, covers, write_stream
+from utils.travel_times import phase_window
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+CATALOG_PATH = os.path.join(DATA_DIR, 'catalog.csv')
+STATE_PATH = os.path.join(DATA_DIR, 'harvest_state.jsonl')
+
+# (min lat, max lat, min lon, max lon)
+REGIONS = {
+    "campania": (39.9, 41.6, 13.7, 15.9),
+    "campi_flegrei": (40.75, 40.90, 13.90, 14.25),
+    "vesuvio": (40.75, 40.88, 14.35, 14.50),
+    "italia": (35.0, 47.5, 6.0, 19.0),
+}
+
+# Datacenter serving each network and the max number of concurrent requests it accepts
+NETWORK_DATACENTER = {"IV": "INGV"}
+DATACENTER_CONCURRENCY = {"INGV": 2}
+
+# Lines per get_waveforms_bulk request
+BULK_CHUNK = 20
+# Window used when no travel-time table is available (seconds from origin)
+DEFAULT_WINDOW = (0.0, 120.0)
+
+
+def select_events(catalog: pd.DataFrame, region: str, minmag: float, years: tuple = None) -> pd.DataFrame:
+    """Catalog events inside a named region with magnitude >= minmag."""
+    minlat, maxlat, minlon, maxlon = REGIONS[region]
+    mask = (
+        catalog['latitude'].between(minlat, maxlat) &
+        catalog['longitude'].between(minlon, maxlon) &
+        (catalog['magnitude'] >= minmag)
+    )
+    if years is not None:
+        mask &= catalog['time'].dt.year.between(years[0], years[1])
+    return catalog[mask].sort_values('time')
+
+
+def fetch_station_table(client: Client, region: str, radius: float, network: str, channel: str,
+                        starttime: UTCDateTime, endtime: UTCDateTime) -> pd.DataFrame:
+    """
+    One station query for the whole region (padded by the search radius),
+    instead of one query per event.
+    """
+    minlat, maxlat, minlon, maxlon = REGIONS[region]
+    inventory = client.get_stations(network=network, channel=channel, level="station",
+                                    minlatitude=minlat - radius, maxlatitude=maxlat + radius,
+                                    minlongitude=minlon - radius, maxlongitude=maxlon + radius,
+                                    starttime=starttime, endtime=endtime)
+    rows = []
+    for net in inventory:
+        for sta in net:
+            rows.append({
+                "network": net.code,
+                "station": sta.code,
+                "latitude": sta.latitude,
+                "longitude": sta.longitude,
+                "start": sta.start_date.timestamp if sta.start_date else -np.inf,
+                "end": sta.end_date.timestamp if sta.end_date else np.inf,
+            })
+    return pd.DataFrame(rows)
+
+
+def plan_requests(events: pd.DataFrame, stations: pd.DataFrame, max_stations: int, radius: float,
+                  channel: str) -> list[tuple]:
+    """
+    Plans (network, station, location, channel, start, end) lines: the nearest active stations
+    within radius of each event, with a travel-time based window.
+    """
+    plan = []
+    if stations.empty:
+        return plan
+    for _, event in events.iterrows():
+        origin = UTCDateTime(event['time'])
+        active = stations[(stations['start'] <= origin.timestamp) & (stations['end'] >= origin.timestamp)]
+        if active.empty:
+            continue
+        dist = locations2degrees(event['latitude'], event['longitude'],
+                                 active['latitude'].to_numpy(), active['longitude'].to_numpy())
+        order = np.argsort(dist)
+        for k in order[:max_stations]:
+            if dist[k] > radius:
+                break
+            window = phase_window(float(dist[k]), float(event['depth']))
+            offset, duration = window if window is not None else DEFAULT_WINDOW
+            row = active.iloc[k]
+            plan.append((row['network'], row['station'], "*", channel, origin + offset, origin + offset + duration))
+    return plan
+
+
+def chunk_key(chunk: list[tuple]) -> str:
+    text = "\n".join(" ".join(str(v) for v in line) for line in chunk)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def load_done(state_path: str) -> set:
+    if not os.path.exists(state_path):
+        return set()
+    with open(state_path) as f:
+        return {json.loads(line)["key"] for line in f if line.strip()}
+
+
+def harvest(plan: list[tuple], state_path: str = STATE_PATH, archive_dir: str = ARCHIVE_DIR):
+    """
+    Downloads the plan with bulk requests, respecting per-datacenter concurrency limits.
+    Completed chunks are recorded in state_path, so an interrupted run can be resumed.
+    """
+    # Skip windows already in the archive
+    todo = [line for line in plan if not covers(*line, root=archive_dir)]
+    print(f"{len(plan)} windows planned, {len(plan) - len(todo)} already archived.")
+
+    # Group by datacenter, then split into bulk chunks
+    by_datacenter = {}
+    for line in todo:
+        datacenter = NETWORK_DATACENTER.get(line[0], "INGV")
+        by_datacenter.setdefault(datacenter, []).append(line)
+
+    done = load_done(state_path)
+    jobs = []
+    for datacenter, lines in by_datacenter.items():
+        for i in range(0, len(lines), BULK_CHUNK):
+            chunk = lines[i:i + BULK_CHUNK]
+            key = chunk_key(chunk)
+            if key not in done:
+                jobs.append((datacenter, key, chunk))
+    print(f"{len(jobs)} bulk requests to run.")
+
+    clients = {dc: get_client(dc) for dc in by_datacenter}
+    semaphores = {dc: threading.Semaphore(DATACENTER_CONCURRENCY.get(dc, 1)) for dc in by_datacenter}
+    write_lock = threading.Lock()  # day files are read-merge-written: one writer at a time
+
+    def run(datacenter, key, chunk):
+        with semaphores[datacenter]:
+            st = clients[datacenter].get_waveforms_bulk(chunk)
+        with write_lock:
+            n_files = write_stream(st, archive_dir)
+            with open(state_path, "a") as f:
+                f.write(json.dumps({"key": key, "datacenter": datacenter, "traces": len(st)}) + "\n")
+        return len(st), n_files
+
+    max_workers = sum(DATACENTER_CONCURRENCY.get(dc, 1) for dc in by_datacenter) or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run, *job): job for job in jobs}
+        for n, future in enumerate(as_completed(futures), start=1):
+            datacenter, key, chunk = futures[future]
+            try:
+                n_traces, n_files = future.result()
+                print(f"\t [{n}/{len(jobs)}] {datacenter}: {n_traces} traces -> {n_files} day files")
+            except Exception as e:
+                print(f"\t [{n}/{len(jobs)}] {datacenter}: error ({e}), will be retried on next run")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Harvest waveforms of catalog events into the local SDS archive.")
+    parser.add_argument("--region", choices=sorted(REGIONS), default="campania")
+    parser.add_argument("--minmag", type=float, default=3.5)
+    parser.add_argument("--years", type=int, nargs=2, default=None, metavar=("FROM", "TO"))
+    parser.add_argument("--max-stations", type=int, default=5)
+    parser.add_argument("--radius", type=float, default=1.0, help="Max epicentral distance (degrees)")
+    parser.add_argument("--network", default="IV")
+    parser.add_argument("--channel", default="HHZ")
+    args = parser.parse_args()
+
+    if not os.path.exists(CATALOG_PATH):
+        print("Catalog not found. Run scripts/fetch_data.py first.")
+        return
+    catalog = pd.read_csv(CATALOG_PATH, parse_dates=['time'])
+    events = select_events(catalog, args.region, args.minmag, args.years)
+    print(f"Selected {len(events)} events (M >= {args.minmag}, {args.region}).")
+    if events.empty:
+        return
+
+    client = get_client(NETWORK_DATACENTER.get(args.network))
+    stations = fetch_station_table(client, args.region, args.radius, args.network, args.channel,
+                                   UTCDateTime(events['time'].min()), UTCDateTime(events['time'].max()))
+    plan = plan_requests(events, stations, args.max_stations, args.radius, args.channel)
+    harvest(plan)
+
+
+if __name__ == "__main__":
+    main()
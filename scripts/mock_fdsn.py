@@ -0,0 +1,233 @@
+import argparse
+import fnmatch
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from obspy import Stream, Trace, UTCDateTime
+from obspy.clients.fdsn.header import DEFAULT_PARAMETERS, DEFAULT_TYPES, OPTIONAL_PARAMETERS
+from obspy.core.event import Catalog, Event, Magnitude, Origin
+from obspy.core.inventory import Channel, Inventory, Network, Station
+from obspy.geodetics import locations2degrees
+
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Synthetic IV stations: code -> (latitude, longitude, elevation)
+STATIONS = {
+    "OVO": (40.827, 14.397, 608.0),
+    "CSFT": (40.829, 14.142, 89.0),
+    "IOCA": (40.828, 14.120, 90.0),
+    "SORR": (40.627, 14.372, 340.0),
+    "NAPI": (40.846, 14.258, 30.0),
+}
+CHANNELS = ("HHZ", "HHN", "HHE")
+SAMPLING_RATE = 100.0
+
+XS_TYPES = {str: "xs:string", float: "xs:double", int: "xs:int", bool: "xs:boolean"}
+
+
+def wadl(service: str, base: str) -> bytes:
+    """Minimal WADL declaring every parameter ObsPy knows for the service."""
+    params = "".join(
+        f'<param name="{name}" style="query" type="{XS_TYPES.get(DEFAULT_TYPES.get(name), "xs:dateTime")}"/>'
+        for name in DEFAULT_PARAMETERS[service] + OPTIONAL_PARAMETERS[service]
+    )
+    return (f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<application xmlns="http://wadl.dev.java.net/2009/02">'
+            f'<resources base="{base}/fdsnws/{service}/1/"><resource path="query">'
+            f'<method name="GET" id="query"><request>{params}</request></method>'
+            f'</resource></resources></application>').encode()
+
+
+def _matches(code: str, pattern: str) -> bool:
+    return any(fnmatch.fnmatch(code, p) for p in (pattern or "*").split(","))
+
+
+def station_xml(query: dict) -> bytes:
+    t0 = UTCDateTime(2000, 1, 1)
+    stations = []
+    for code, (lat, lon, elev) in STATIONS.items():
+        if not _matches(code, query.get("station")):
+            continue
+        if "latitude" in query and "maxradius" in query:
+            if locations2degrees(float(query["latitude"]), float(query["longitude"]), lat, lon) > float(query["maxradius"]):
+                continue
+        channels = [Channel(cha, "", lat, lon, elev, 0.0, sample_rate=SAMPLING_RATE, start_date=t0)
+                    for cha in CHANNELS if _matches(cha, query.get("channel"))]
+        level = query.get("level", "station")
+        stations.append(Station(code, lat, lon, elev, start_date=t0,
+                                channels=channels if level in ("channel", "response") else []))
+    if not stations or not _matches("IV", query.get("network")):
+        return None
+    buf = io.BytesIO()
+    Inventory([Network("IV", stations=stations)], source="mock_fdsn").write(buf, format="STATIONXML")
+    return buf.getvalue()
+
+
+def miniseed(query: dict) -> bytes:
+    """Noise with a small event every 10 minutes, deterministic per channel and time."""
+    start, end = UTCDateTime(query["starttime"]), UTCDateTime(query["endtime"])
+    i0 = int(np.ceil(start.timestamp * SAMPLING_RATE))
+    i1 = int(np.floor(end.timestamp * SAMPLING_RATE))
+    if i1 <= i0:
+        return None
+    stream = Stream()
+    for code in STATIONS:
+        if not _matches(code, query.get("station")):
+            continue
+        for cha in CHANNELS:
+            if not _matches(cha, query.get("channel")):
+                continue
+            rng = np.random.default_rng(zlib.crc32(f"{code}.{cha}.{i0}".encode()))
+            t = np.arange(i0, i1) / SAMPLING_RATE
+            phase = np.mod(t, 600.0)
+            burst = 2000.0 * np.exp(-phase / 3.0) * np.sin(2 * np.pi * 5.0 * phase) * (phase > 0)
+            data = (rng.normal(0, 100.0, len(t)) + burst).astype(np.int32)
+            stream.append(Trace(data, header={"network": "IV", "station": code, "location": "", "channel": cha,
+                                              "sampling_rate": SAMPLING_RATE,
+                                              "starttime": UTCDateTime(i0 / SAMPLING_RATE)}))
+    if not stream:
+        return None
+    buf = io.BytesIO()
+    stream.write(buf, format="MSEED", reclen=512)
+    return buf.getvalue()
+
+
+def quakeml(query: dict) -> bytes:
+    start = UTCDateTime(query.get("starttime", "2000-01-01"))
+    end = UTCDateTime(query.get("endtime", UTCDateTime()))
+    rng = np.random.default_rng(int(start.timestamp) % 2 ** 32)
+    minmag = float(query.get("minmagnitude", 2.5))
+    events = []
+    for _ in range(20):
+        t = start + rng.uniform(0, end - start)
+        origin = Origin(time=t, latitude=40.83 + rng.normal(0, 0.05), longitude=14.14 + rng.normal(0, 0.05),
+                        depth=rng.uniform(1e3, 4e3))
+        events.append(Event(origins=[origin], magnitudes=[Magnitude(mag=round(minmag + rng.exponential(0.45), 1))]))
+    buf = io.BytesIO()
+    Catalog(events).write(buf, format="QUAKEML")
+    return buf.getvalue()
+
+
+class MockFDSNHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    latency = 0.0
+    hits: Counter = Counter()
+    lock = threading.Lock()
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        parts = url.path.strip("/").split("/")
+        if url.path == "/stats":
+            with self.lock:
+                return self._send(200, json.dumps(self.hits).encode(), "application/json")
+
+        with self.lock:
+            self.hits[url.path] += 1
+        time.sleep(self.latency)
+        if len(parts) != 4 or parts[0] != "fdsnws" or parts[1] not in DEFAULT_PARAMETERS:
+            return self._send(404)
+        service, resource = parts[1], parts[3]
+        base = f"http://{self.headers.get('Host')}"
+        if resource == "application.wadl":
+            return self._send(200, wadl(service, base), "application/xml")
+        if resource != "query":
+            return self._send(404)
+        body = {"station": station_xml, "dataselect": miniseed, "event": quakeml}[service](query)
+        if body is None:
+            return self._send(204)
+        content_type = "application/vnd.fdsn.mseed" if service == "dataselect" else "application/xml"
+        self._send(200, body, content_type)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 8080, latency: float = 0.0) -> ThreadingHTTPServer:
+    """Starts the mock server on a background thread (port 0 picks a free one)."""
+    MockFDSNHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockFDSNHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def check(server: ThreadingHTTPServer):
+    """
+    Fires 16 identical station requests and 16 waveform requests over 4 distinct windows
+    through the gateway, and verifies that the server received one request per distinct query.
+    """
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    from utils import fdsn
+
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    with tempfile.TemporaryDirectory() as discovery_dir:
+        fdsn.DISCOVERY_DIR = discovery_dir  # Keep the service discovery out of data/
+        client = fdsn.get_client(base_url)
+        t0 = UTCDateTime(2024, 1, 1)
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(lambda _: client.get_stations(network="IV", latitude=40.83, longitude=14.14,
+                                                             maxradius=1.0, starttime=t0, endtime=t0 + 100),
+                              range(16)))
+            list(executor.map(lambda i: client.get_waveforms("IV", "OVO", "*", "HHZ", t0 + 60 * (i % 4),
+                                                              t0 + 60 * (i % 4) + 120), range(16)))
+    print(json.dumps(fdsn.metrics(), indent=2))
+    print("Requests received by the server:", json.dumps(MockFDSNHandler.hits, indent=2))
+
+    stations, waveforms = (MockFDSNHandler.hits[f"/fdsnws/{service}/1/query"] for service in ("station", "dataselect"))
+    assert stations == 1, f"{stations} station queries for 16 identical requests"
+    assert waveforms == 4, f"{waveforms} dataselect queries for 4 distinct windows"
+    print("Coalescing check passed: 1 station query for 16 requests, 4 dataselect queries for 4 windows.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local FDSN stand-in (station, dataselect, event) with synthetic data. "
+                    "Point the dashboard at it with FDSN_BASE_URL=http://127.0.0.1:<port>.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every request (s)")
+    parser.add_argument("--check", action="store_true",
+                        help="Fire identical concurrent requests through the gateway, print its metrics and "
+                             "verify the requests received (free port, latency of at least 0.3 s)")
+    args = parser.parse_args()
+
+    if args.check:
+        # Free port, and enough latency for the concurrent requests to overlap
+        server = serve(0, max(args.latency, 0.3))
+    else:
+        server = serve(args.port, args.latency)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"Mock FDSN server on {base_url} (request counts at {base_url}/stats)")
+
+    if args.check:
+        check(server)
+        server.shutdown()
+        return
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
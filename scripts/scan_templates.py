@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+from obspy import UTCDateTime
+
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from harvest_waveforms import REGIONS, select_events
+from utils.inventory import load_inventory
+from utils.matched_filter import (DEFAULT_TEMPLATE_LENGTH, MAD_THRESHOLD, scan, template_from_event_trace,
+                                  templates_from_catalog)
+from utils.sds_archive import read_trace
+from utils.trace import CompactTrace
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+CATALOG_PATH = os.path.join(DATA_DIR, 'catalog.csv')
+
+
+def station_coordinates(network: str, stations: list[str], channel: str) -> dict:
+    """seed id -> (latitude, longitude) from the locally cached inventories."""
+    coords = {}
+    for code in stations:
+        inventory = load_inventory(network, code)
+        if inventory is None:
+            continue
+        sta = inventory[0][0]
+        coords[f"{network}.{code}.*.{channel}"] = (sta.latitude, sta.longitude)
+    return coords
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan a day of archived data for repeats of known events.")
+    parser.add_argument("--day", required=True, help="UTC day to scan (YYYY-MM-DD)")
+    parser.add_argument("--network", default="IV")
+    parser.add_argument("--stations", nargs="+", default=["OVO", "CSFT", "IOCA", "SORR"])
+    parser.add_argument("--channel", default="HHZ")
+    parser.add_argument("--region", choices=sorted(REGIONS), default="campi_flegrei",
+                        help="Catalog events used as templates")
+    parser.add_argument("--minmag", type=float, default=2.5)
+    parser.add_argument("--max-templates", type=int, default=50)
+    parser.add_argument("--length", type=float, default=DEFAULT_TEMPLATE_LENGTH, help="Template length (s)")
+    parser.add_argument("--threshold", type=float, default=MAD_THRESHOLD, help="Detection threshold in MADs")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    templates = []
+    # The Campi Flegrei max event saved by scripts/fetch_data.py
+    quake = CompactTrace.load(os.path.join(DATA_DIR, "waveform_max_event_flegrei"))
+    template = template_from_event_trace("Max Campi Flegrei", quake, args.length)
+    if template is not None:
+        templates.append(template)
+
+    # Catalog events with archived waveforms (scripts/harvest_waveforms.py)
+    if os.path.exists(CATALOG_PATH):
+        catalog = pd.read_csv(CATALOG_PATH, parse_dates=['time'])
+        events = select_events(catalog, args.region, args.minmag)
+        events = events.nlargest(args.max_templates, 'magnitude')
+        coords = station_coordinates(args.network, args.stations, args.channel)
+        templates += templates_from_catalog(events, coords, args.length)
+    templates = templates[:args.max_templates]
+    print(f"{len(templates)} templates.")
+    if not templates:
+        return
+
+    day = UTCDateTime(args.day)
+    continuous = [read_trace(args.network, code, "*", args.channel, day, day + 86400, min_coverage=0.0)
+                  for code in args.stations]
+    continuous = [tr for tr in continuous if tr is not None]
+    print(f"{len(continuous)} stations with archived data on {args.day}.")
+
+    t0 = time.time()
+    detections = scan(continuous, templates, args.threshold, workers=args.workers)
+    print(f"Scan done in {time.time() - t0:.0f} s: {len(detections)} detections.")
+
+    if detections:
+        df = pd.DataFrame([vars(d) for d in detections])
+        df['time'] = pd.to_datetime(df['time'], unit='s')
+        output_path = os.path.join(DATA_DIR, f"detections_{args.day}.csv")
+        df.to_csv(output_path, index=False)
+        print(df.to_string(index=False))
+        print(f"Saved {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+from obspy import UTCDateTime
+
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utils.noise import update
+from utils.sds_archive import ARCHIVE_DIR
+
+
+def archived_channels(network: str, stations: list[str], channel: str, days: list, root: str = ARCHIVE_DIR) -> list[str]:
+    """Seed ids present in the archive for the given stations and days."""
+    seed_ids = set()
+    for day in days:
+        for station in stations:
+            pattern = os.path.join(root, str(day.year), network, station, f"{channel}.D", "*")
+            for path in glob.glob(pattern):
+                seed_ids.add(".".join(os.path.basename(path).split(".")[:4]))
+    return sorted(seed_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accumulate hourly PPSD segments from the local SDS archive.")
+    parser.add_argument("--days", type=int, default=30, help="Days back from today to bring up to date")
+    parser.add_argument("--network", default="IV")
+    parser.add_argument("--stations", nargs="+", default=["OVO", "CSFT", "IOCA", "SORR"])
+    parser.add_argument("--channel", default="HHZ")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    now = UTCDateTime()
+    today = UTCDateTime(now.year, now.month, now.day)
+    days = [today - k * 86400 for k in range(args.days, -1, -1)]
+    seed_ids = archived_channels(args.network, args.stations, args.channel, days)
+    print(f"{len(seed_ids)} channels, {len(days)} days.")
+
+    t0 = time.time()
+    updated = update(seed_ids, days, workers=args.workers)
+    for (seed_id, day), segments in sorted(updated.items()):
+        print(f"\t {seed_id} {day}: {segments} segments")
+    print(f"{len(updated)} channel-days updated in {time.time() - t0:.0f} s (up-to-date days skipped).")
+
+
+if __name__ == "__main__":
+    main()
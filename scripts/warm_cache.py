@@ -0,0 +1,59 @@
+import argparse
+import os
+import sys
+import time
+
+# Allow importing the dashboard's utils package when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utils import disk_cache
+from utils.load_data import load_comparison_data, load_data
+from utils.preprocessing import PreprocessConfig, preprocess
+from utils.realtime_chart import install_plotly_js
+from utils.seismology import calculate_gutenberg_richter, fft_analysis
+from utils.sidebar import Sidebar
+from utils.spectral import WINDOW_FUNCTIONS
+
+# Defaults of the "Segnali sismici" sidebar
+DEFAULT_WINDOW = next(iter(WINDOW_FUNCTIONS))
+DEFAULT_NPERSEG = 256
+DEFAULT_PREPROCESS = PreprocessConfig(freqmin=0.5, freqmax=20.0, response="full")
+
+
+def step(label: str, func, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f"{label}: {time.perf_counter() - t0:.2f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fills the disk cache with the results the dashboard computes for its default "
+                    "filters, so the first visitors after a restart do not wait for them, and installs "
+                    "the real-time charts' plotly.js. "
+                    "Run it before starting the server.")
+    parser.parse_args()
+    print(f"Disk cache: {os.path.abspath(disk_cache.CACHE_DIR)} "
+          f"(max {disk_cache.MAX_BYTES / 2 ** 20:.0f} MB)")
+
+    if not step("plotly.js for the real-time charts", install_plotly_js):
+        print("Could not copy plotly.js into utils/components/realtime_chart: the real-time charts "
+              "will be redrawn in full at every refresh.")
+
+    df = step("Catalog", load_data)
+    if df is None:
+        print("Dataset 'catalog.csv' not found: run scripts/fetch_data.py first.")
+    else:
+        Sidebar.set_defaults(df)
+        filtered_df, *_ = Sidebar.apply_filters(df)
+        step("Gutenberg-Richter (default filters)", calculate_gutenberg_richter, filtered_df)
+
+    for trace in load_comparison_data():
+        if trace is None:
+            continue
+        processed = step(f"Preprocessing {trace.seed_id}", preprocess, trace, DEFAULT_PREPROCESS)
+        step(f"Spectrum {trace.seed_id}", fft_analysis, processed, nperseg=DEFAULT_NPERSEG, window=DEFAULT_WINDOW)
+
+
+if __name__ == "__main__":
+    main()
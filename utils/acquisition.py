@@ -0,0 +1,174 @@
+import json
+import os
+import time
+
+from obspy import Stream, UTCDateTime
+
+from utils import pyramid
+from utils.sds_archive import ARCHIVE_DIR, append_stream, enforce_retention, read_stream
+from utils.trace import CompactTrace
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+STATE_PATH = os.path.join(DATA_DIR, 'archiver_state.json')
+
+# Channels followed by the real-time page: (network, station, location, channel)
+DEFAULT_CHANNELS = [
+    ("IV", "OVO", "*", "HHZ"),
+    ("IV", "CSFT", "*", "HHZ"),
+    ("IV", "IOCA", "*", "HHZ"),
+    ("IV", "SORR", "*", "HHZ"),
+]
+
+# Seconds behind real time (data is not yet available at the datacenter right away).
+# Must stay below the 300 s delay of the real-time page, so it finds its window in the archive.
+DEFAULT_LATENCY = 120
+# Longest window requested at once: bounds memory when catching up after an outage
+MAX_CHUNK = 600
+# A window still missing after this many seconds is given up and left as a gap
+GAP_TIMEOUT = 900
+DEFAULT_RETENTION_DAYS = 30
+
+
+class FDSNSource:
+    """Waveforms from an FDSN dataselect service."""
+
+    def __init__(self, base_url: str = None):
+        self.base_url = base_url
+
+    def get_waveforms(self, network, station, location, channel, starttime, endtime) -> Stream:
+        from utils.fdsn import BACKGROUND, get_client, priority
+        try:
+            with priority(BACKGROUND):
+                return get_client(self.base_url).get_waveforms(network, station, location, channel, starttime, endtime)
+        except Exception as e:
+            # FDSNNoDataException for windows not yet available, network errors otherwise
+            print(f"\t {network}.{station}.{channel}: no data ({type(e).__name__})")
+            return Stream()
+
+
+class ReplaySource:
+    """
+    Replays a local SDS archive as if it were live: a request for [t0, t1] is served from
+    [t0 - shift, t1 - shift] and shifted back. Used to run the archiver offline and in tests.
+    """
+
+    def __init__(self, root: str, replay_start: UTCDateTime, now: UTCDateTime = None):
+        self.root = root
+        self.shift = (now or UTCDateTime()) - replay_start
+
+    def get_waveforms(self, network, station, location, channel, starttime, endtime) -> Stream:
+        st = read_stream(network, station, location, channel,
+                         starttime - self.shift, endtime - self.shift, self.root)
+        for tr in st:
+            tr.stats.starttime += self.shift
+        return st
+
+
+def load_state(path: str = STATE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state: dict, path: str = STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+class Archiver:
+    """
+    Pulls the configured channels from a source and appends them to the SDS archive.
+
+    For each channel only the time of the next missing sample is kept (persisted in the
+    state file, so a restart resumes where it stopped). Every step requests at most
+    MAX_CHUNK seconds per channel and appends them to the day file, so memory stays bounded.
+    The same samples update the min/max/RMS pyramid used by the long-window views.
+    """
+
+    def __init__(self, source, channels: list = DEFAULT_CHANNELS, root: str = ARCHIVE_DIR,
+                 state_path: str = STATE_PATH, latency: float = DEFAULT_LATENCY,
+                 gap_timeout: float = GAP_TIMEOUT, retention_days: int = DEFAULT_RETENTION_DAYS,
+                 pyramid_root: str = pyramid.PYRAMID_DIR):
+        self.source = source
+        self.channels = [tuple(c) for c in channels]
+        self.root = root
+        self.state_path = state_path
+        self.latency = latency
+        self.gap_timeout = gap_timeout
+        self.retention_days = retention_days
+        self.pyramid_root = pyramid_root
+        self.state = load_state(state_path)
+        self._last_retention = None
+
+    @staticmethod
+    def _key(channel: tuple) -> str:
+        return ".".join(channel)
+
+    def step(self, now: UTCDateTime = None) -> int:
+        """
+        Archives everything available up to now - latency. Returns the number of samples written.
+        """
+        now = now or UTCDateTime()
+        target = now - self.latency
+        written = 0
+        for channel in self.channels:
+            key = self._key(channel)
+            start = UTCDateTime(self.state[key]) if key in self.state else target - MAX_CHUNK
+            while start < target:
+                end = min(start + MAX_CHUNK, target)
+                st = self.source.get_waveforms(*channel, start, end)
+                st = self._clip(st, start, end)
+                if st:
+                    append_stream(st, self.root)
+                    if self.pyramid_root:
+                        pyramid.update(CompactTrace.from_stream(st), self.pyramid_root)
+                    written += sum(tr.stats.npts for tr in st)
+                    last = max(tr.stats.endtime + tr.stats.delta for tr in st)
+                else:
+                    last = start
+
+                if end - last < 1e-3 or now - end > self.gap_timeout:
+                    # Window complete, or too old to wait for: anything missing stays a gap
+                    next_start = end
+                else:
+                    # Tail not available yet: retry from the last sample on the next step
+                    next_start = last
+                self.state[key] = next_start.isoformat()
+                if next_start < end:
+                    break
+                start = next_start
+        save_state(self.state, self.state_path)
+
+        if self.retention_days and (self._last_retention is None or now - self._last_retention >= 3600):
+            deleted = enforce_retention(self.retention_days, now, self.root)
+            if self.pyramid_root:
+                pyramid.enforce_retention(self.retention_days, now.timestamp, self.pyramid_root)
+            if deleted:
+                print(f"Retention: deleted {deleted} day files older than {self.retention_days} days.")
+            self._last_retention = now
+        return written
+
+    @staticmethod
+    def _clip(st: Stream, start: UTCDateTime, end: UTCDateTime) -> Stream:
+        """Keeps samples in [start, end), so consecutive windows never overlap."""
+        st = st.copy()
+        st.merge(method=1)
+        for tr in st:
+            tr.trim(start, end - tr.stats.delta / 2, nearest_sample=False)
+        return Stream([tr for tr in st if tr.stats.npts])
+
+    def run(self, interval: float = 10.0, should_stop=lambda: False):
+        """Runs step() every interval seconds until should_stop() returns True."""
+        while not should_stop():
+            t0 = time.time()
+            try:
+                n = self.step()
+                print(f"{UTCDateTime().isoformat()} archived {n} samples")
+            except Exception as e:
+                print(f"Archiver step failed: {e}")
+            while not should_stop() and time.time() - t0 < interval:
+                time.sleep(0.5)
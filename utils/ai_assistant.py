@@ -1,68 +1,111 @@
+import threading
+
 import streamlit as st
-from google import genai
-import streamlit.components.v1 as components
-import os
-from dotenv import load_dotenv
-import time
 
-load_dotenv()
+from utils import ai_client, ai_context, catalog_query
 
-# Configure API
-api_key = os.getenv("GOOGLE_API_KEY")
+class ReplyJob:
+    """
+    Generates one assistant reply on a background thread.
 
-def get_ai_response(prompt, context_text):
-    """Call Google Gemini API"""
-    if not api_key:
-        return "⚠️ API Key mancante. Configurala nel file .env."
-    
-    try:
-        client = genai.Client(api_key=api_key)
-        full_prompt = f"""
-        Sei un esperto sismologo e data scientist.
-        L'utente sta guardando una dashboard di analisi sismica.
-        
-        CONTESTO PAGINA ATTUALE:
-        {context_text}
-        
-        CONTESTO DINAMICO (Generale):
-        {st.session_state.get('ai_context_global', '')}
-        
-        CONTESTO SELEZIONE (Dettagli):
-        {st.session_state.get('ai_context_selection', '')}
-        
-        DOMANDA UTENTE:
-        {prompt}
-        
-        ISTRUZIONI:
-        1. Rispondi in modo conciso, scientifico ma semplice.
-        2. Usa l'italiano.
-        3. IMPORTANTE: Basati ESCLUSIVAMENTE sui dati forniti nel contesto qui sopra.
-        4. NON inventare dati numerici, stazioni o eventi non presenti nel contesto. Se l'informazione non c'è, dì "Non ho questa informazione".
-        """
-        response = client.models.generate_content(
-            model="gemini-flash-lite-latest", 
-            contents=full_prompt
+    The script thread only reads the chunks received so far, so a rerun (or any other
+    interaction) never blocks on the model, and an interrupted render resumes from the
+    accumulated text. The contexts are captured when the question is asked: the worker
+    never touches session state. With a catalog engine the model can query the whole
+    catalog through tools (see utils.catalog_query).
+    """
+
+    def __init__(self, prompt, page_context, global_context, selection_context, engine=None):
+        self.chunks = []
+        self.done = False
+        self._cancelled = threading.Event()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, args=(prompt, page_context, global_context, selection_context, engine), daemon=True
         )
-        return response.text
-    except Exception as e:
-        return f"Errore: {str(e)}"
+        self._thread.start()
+
+    def _run(self, prompt, page_context, global_context, selection_context, engine):
+        try:
+            if ai_client.get_backend() is None:
+                self._push("⚠️ API Key mancante. Configurala nel file .env.")
+                return
+            chunks = ai_client.stream(
+                prompt, page_context, global_context, selection_context,
+                tools=catalog_query.TOOLS if engine is not None else None,
+                call_tool=engine.call if engine is not None else None,
+            )
+            try:
+                for chunk in chunks:
+                    if self._cancelled.is_set():
+                        break
+                    self._push(chunk)
+            finally:
+                chunks.close()
+        except Exception as e:
+            self._push(f"Errore: {str(e)}")
+        finally:
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    def _push(self, chunk):
+        with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def text(self):
+        with self._condition:
+            return "".join(self.chunks)
+
+    def iter_text(self):
+        """Yields the text received so far, then each new chunk until the reply is complete."""
+        i = 0
+        while True:
+            with self._condition:
+                while i == len(self.chunks) and not self.done:
+                    self._condition.wait(timeout=0.1)
+                new = self.chunks[i:]
+                i = len(self.chunks)
+                finished = self.done and i == len(self.chunks)
+            if new:
+                yield "".join(new)
+            if finished:
+                return
+
+
+def cancel_reply():
+    """Stops the reply being generated, keeping what was already written."""
+    job = st.session_state.get("chat_job")
+    if job is None:
+        return
+    job.cancel()
+    if job.text:
+        st.session_state.messages.append({"role": "assistant", "content": job.text + " …*(interrotta)*"})
+    st.session_state.chat_job = None
+
 
 @st.fragment
 def render_chat_content(context_text):
     """
     Isolated fragment for chat logic to prevent full app reruns.
     """
-    # Initialize processing state
-    if "chat_processing" not in st.session_state:
-        st.session_state.chat_processing = False
-
     # Helper Callback for Input
     def handle_input():
-        if st.session_state.popover_chat_input:
-            # Add User Message
-            st.session_state.messages.append({"role": "user", "content": st.session_state.popover_chat_input})
-            # Set processing flag - This triggers the UI update on the NEXT run
-            st.session_state.chat_processing = True
+        question = st.session_state.popover_chat_input
+        if question:
+            # A new question replaces the one still being answered
+            cancel_reply()
+            st.session_state.messages.append({"role": "user", "content": question})
+            # The page contexts are only built now, when a question is actually sent
+            contexts = ai_context.materialize_all()
+            # Generation starts right away, before the fragment reruns
+            st.session_state.chat_job = ReplyJob(question, context_text, contexts["global"], contexts["selection"],
+                                                 catalog_query.current_engine())
 
     # Chat History
     chat_container = st.container(height=350)
@@ -80,68 +123,16 @@ def render_chat_content(context_text):
         on_submit=handle_input
     )
     
-    # Handle AI Response (Processing Phase)
-    if st.session_state.chat_processing:
-        # Retrieve last user message
-        last_user_msg = st.session_state.messages[-1]["content"]
-        
-        # Display spinner inside the chat container
+    # Reply in progress: tokens are rendered as they arrive
+    job = st.session_state.get("chat_job")
+    if job is not None:
         with chat_container:
-            
-            # 1. Scroll to BOTTOM to show "Sto pensando..." (Inject JS *outside* the message bubble to avoid empty space)
-            ts_start = int(time.time() * 1000)
-            js_scroll_bottom = f"""
-            <script>
-                setTimeout(function() {{
-                    var messages = window.parent.document.querySelectorAll('[data-testid="stChatMessage"]');
-                    if (messages.length > 0) {{
-                        var lastMessage = messages[messages.length - 1];
-                        lastMessage.scrollIntoView({{block: 'end', behavior: 'smooth'}});
-                    }}
-                }}, 100);
-            </script>
-            <div style="display:none;">{ts_start}_start</div>
-            """
-            components.html(js_scroll_bottom, height=0, width=0)
-
             with st.chat_message("assistant"):
-                with st.spinner("Sto pensando..."):
-                    ai_reply = get_ai_response(last_user_msg, context_text)
-                st.markdown(ai_reply) # Render immediately!
-        
-        # Scroll to the top of the new message
-        # We target the last stChatMessage element and scroll it to the TOP (block='start')
-        # We add a longer delay (1sec) and a retry mechanism to fight against Streamlit's auto-scroll
-        unique_id = int(time.time() * 1000)
-        js_scroll = f"""
-        <script>
-            function scrollToTop() {{
-                try {{
-                    var messages = window.parent.document.querySelectorAll('[data-testid="stChatMessage"]');
-                    if (messages.length > 0) {{
-                        var lastMessage = messages[messages.length - 1];
-                        lastMessage.scrollIntoView({{block: 'start', behavior: 'smooth'}});
-                    }}
-                }} catch(e) {{
-                    console.log("Scroll error:", e);
-                }}
-            }}
-
-            // Attempt 1: 1000ms
-            setTimeout(scrollToTop, 1000);
-            
-            // Attempt 2: 1500ms (just in case)
-            setTimeout(scrollToTop, 1500);
-        </script>
-        <div style="display:none;">{unique_id}</div>
-        """
-        components.html(js_scroll, height=0, width=0)
+                ai_reply = st.write_stream(job.iter_text())
         
         # Add AI Message to history for next run
         st.session_state.messages.append({"role": "assistant", "content": ai_reply})
-        
-        # Reset processing flag
-        st.session_state.chat_processing = False
+        st.session_state.chat_job = None
 
 def render_ai_assistant(context_text=""):
     """
@@ -0,0 +1,374 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL = "gemini-flash-lite-latest"
+
+# Response cache: identical questions on identical context are answered without a round-trip
+CACHE_TTL = 600.0      # seconds
+CACHE_MAX_ENTRIES = 256
+
+# Model turns that may call tools before it has to answer in text
+MAX_TOOL_ROUNDS = 4
+
+
+@dataclass
+class ToolCall:
+    """A function call requested by the model (raw: the backend's own part, echoed back as is)."""
+    name: str
+    args: dict = field(default_factory=dict)
+    raw: object = None
+
+
+class GeminiBackend:
+    """Google Gemini through one genai.Client, reused for every request of the process."""
+
+    def __init__(self, api_key: str):
+        from google import genai
+        self.client = genai.Client(api_key=api_key)
+
+    def generate_stream(self, prompt: str, model: str):
+        for chunk in self.client.models.generate_content_stream(model=model, contents=prompt):
+            if chunk.text:
+                yield chunk.text
+
+    @staticmethod
+    def _content(message: dict):
+        from google.genai import types
+        if message["role"] == "user":
+            return types.Content(role="user", parts=[types.Part(text=message["text"])])
+        if message["role"] == "model":
+            return types.Content(role="model", parts=[
+                call.raw or types.Part(function_call=types.FunctionCall(name=call.name, args=call.args))
+                for call in message["calls"]
+            ])
+        return types.Content(role="user", parts=[
+            types.Part.from_function_response(name=name, response=result) for name, result in message["results"]
+        ])
+
+    def chat_stream(self, messages: list[dict], model: str, tools: list[dict] = None):
+        """Yields text chunks and ToolCall objects of one model turn."""
+        from google.genai import types
+        config = None
+        if tools:
+            config = types.GenerateContentConfig(
+                tools=[types.Tool(function_declarations=[
+                    types.FunctionDeclaration(name=t["name"], description=t["description"],
+                                              parameters_json_schema=t["parameters"])
+                    for t in tools
+                ])],
+                # Calls are executed by ask_with_tools, not by the SDK
+                automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+            )
+        for chunk in self.client.models.generate_content_stream(
+                model=model, contents=[self._content(m) for m in messages], config=config):
+            if not chunk.candidates or not chunk.candidates[0].content:
+                continue
+            for part in chunk.candidates[0].content.parts or []:
+                if part.function_call:
+                    yield ToolCall(part.function_call.name, dict(part.function_call.args or {}), part)
+                elif part.text and not part.thought:
+                    yield part.text
+
+
+class StubBackend:
+    """
+    Local stand-in for the model (no network): replies with scripted answers or echoes
+    the question. Set AI_BACKEND=stub to use it in the dashboard.
+
+    script drives tool calling, one entry per model turn of a conversation: a list of
+    ToolCall to request, a reply string, or a callable building the reply from the
+    tool results received so far. Turns past the end of the script reply as usual.
+    """
+
+    def __init__(self, replies: dict = None, delay: float = 0.0, token_delay: float = 0.0, script: list = None):
+        self.replies = replies or {}
+        self.script = script or []
+        self.delay = delay
+        self.token_delay = token_delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _reply(self, prompt: str, model: str) -> str:
+        question = prompt.split("DOMANDA UTENTE:")[-1].split("ISTRUZIONI:")[0].strip()
+        for pattern, reply in self.replies.items():
+            if pattern in question:
+                return reply
+        return f"[stub:{model}] {question}"
+
+    def generate_stream(self, prompt: str, model: str):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        for word in self._reply(prompt, model).split(" "):
+            time.sleep(self.token_delay)
+            yield word + " "
+
+    def chat_stream(self, messages: list[dict], model: str, tools: list[dict] = None):
+        results = [result for m in messages if m["role"] == "tool" for _, result in m["results"]]
+        turn = sum(1 for m in messages if m["role"] == "model")
+        step = self.script[turn] if turn < len(self.script) else None
+        if step is None or (isinstance(step, list) and not tools):
+            yield from self.generate_stream(messages[0]["text"], model)
+            return
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if isinstance(step, list):
+            yield from step
+            return
+        text = step(results) if callable(step) else step
+        for word in text.split(" "):
+            time.sleep(self.token_delay)
+            yield word + " "
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    The process-wide backend, created on first use (None if Gemini has no API key).
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if os.getenv("AI_BACKEND", "gemini").lower() == "stub":
+                _backend = StubBackend()
+            elif os.getenv("GOOGLE_API_KEY"):
+                _backend = GeminiBackend(os.getenv("GOOGLE_API_KEY"))
+        return _backend
+
+
+def set_backend(backend):
+    """Replaces the backend (e.g. with a StubBackend in tests) and clears the cache."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+    response_cache.clear()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with a time-to-live, shared by all sessions of the process."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # key -> (expiry, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+response_cache = ResponseCache()
+
+
+class SharedStream:
+    """
+    One answer being generated, shared by every caller asking the same thing.
+
+    A producer thread drives the model stream and appends its chunks; subscribers
+    attached at any time replay the chunks already produced and then follow the new
+    ones. The producer stops (and closes the model stream) when the last subscriber
+    detaches; only a completed answer is cached, an error reaches every subscriber.
+    """
+
+    def __init__(self, key: str, chunks):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0  # changed under _in_flight_lock
+        self.abandoned = False
+        self._source = chunks
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for chunk in self._source:
+                if self.abandoned:
+                    break
+                with self._condition:
+                    self.chunks.append(chunk)
+                    self._condition.notify_all()
+            else:
+                response_cache.put(self.key, "".join(self.chunks))
+        except Exception as e:
+            self.error = e
+        finally:
+            # Closing the generator closes the HTTP stream when nobody is listening any more
+            self._source.close()
+            with _in_flight_lock:
+                if _in_flight.get(self.key) is self:
+                    del _in_flight[self.key]
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    def follow(self):
+        """Yields every chunk from the first one until the answer is complete."""
+        i = 0
+        while True:
+            with self._condition:
+                while i == len(self.chunks) and not self.done:
+                    self._condition.wait()
+                new = self.chunks[i:]
+                i = len(self.chunks)
+                finished = self.done and i == len(self.chunks)
+            yield from new
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+    def detach(self):
+        with _in_flight_lock:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.abandoned = True
+                # A later identical question starts a new stream instead of joining this one
+                if _in_flight.get(self.key) is self:
+                    del _in_flight[self.key]
+
+
+# Answers being generated right now: key -> SharedStream followed by every caller asking the same thing
+_in_flight: dict[str, SharedStream] = {}
+_in_flight_lock = threading.Lock()
+
+
+def cache_key(prompt: str, page_context: str, global_context: str, selection_context: str, model: str,
+              tools: list[dict] = None) -> str:
+    payload = json.dumps([prompt, page_context, global_context, selection_context, model,
+                          sorted(t["name"] for t in tools or [])])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+TOOLS_INSTRUCTION = """
+        5. Per domande sul catalogo (conteggi, statistiche, eventi più forti o più vicini, Gutenberg-Richter)
+           usa gli strumenti disponibili: i loro risultati sono dati esatti e puoi citarli.
+        """
+
+
+def build_prompt(prompt: str, page_context: str, global_context: str, selection_context: str,
+                 tools: bool = False) -> str:
+    return f"""
+        Sei un esperto sismologo e data scientist.
+        L'utente sta guardando una dashboard di analisi sismica.
+
+        CONTESTO PAGINA ATTUALE:
+        {page_context}
+
+        CONTESTO DINAMICO (Generale):
+        {global_context}
+
+        CONTESTO SELEZIONE (Dettagli):
+        {selection_context}
+
+        DOMANDA UTENTE:
+        {prompt}
+
+        ISTRUZIONI:
+        1. Rispondi in modo conciso, scientifico ma semplice.
+        2. Usa l'italiano.
+        3. IMPORTANTE: Basati ESCLUSIVAMENTE sui dati forniti nel contesto qui sopra.
+        4. NON inventare dati numerici, stazioni o eventi non presenti nel contesto. Se l'informazione non c'è, dì "Non ho questa informazione".
+        """ + (TOOLS_INSTRUCTION if tools else "")
+
+
+def ask_with_tools(backend, prompt: str, model: str, tools: list[dict], call_tool):
+    """
+    Runs the model with function calling: requested tools are executed locally with
+    call_tool(name, args) and their results sent back, until the model answers in text
+    (after MAX_TOOL_ROUNDS it must answer without tools). Yields the answer's chunks.
+    """
+    messages = [{"role": "user", "text": prompt}]
+    for round_ in range(MAX_TOOL_ROUNDS + 1):
+        calls = []
+        turn = backend.chat_stream(messages, model, tools if round_ < MAX_TOOL_ROUNDS else None)
+        try:
+            for item in turn:
+                if isinstance(item, ToolCall):
+                    calls.append(item)
+                else:
+                    yield item
+        finally:
+            turn.close()
+        if not calls:
+            return
+        messages.append({"role": "model", "calls": calls})
+        messages.append({"role": "tool", "results": [(c.name, call_tool(c.name, c.args)) for c in calls]})
+
+
+def stream(prompt: str, page_context: str = "", global_context: str = "", selection_context: str = "",
+           model: str = MODEL, tools: list[dict] = None, call_tool=None):
+    """
+    Yields the answer in chunks as the model generates them. A cached answer is yielded
+    at once; identical questions arriving while one is being answered follow the same
+    SharedStream instead of calling the model again.
+    With tools (declarations, executed by call_tool) the model can query local data first.
+    """
+    backend = get_backend()
+    if backend is None:
+        raise RuntimeError("No AI backend configured")
+
+    key = cache_key(prompt, page_context, global_context, selection_context, model, tools)
+    with _in_flight_lock:
+        # Looked up under the lock: a stream completing now is either cached or still in flight
+        cached = response_cache.get(key)
+        shared = None if cached is not None else _in_flight.get(key)
+        owner = cached is None and shared is None
+        if owner:
+            full_prompt = build_prompt(prompt, page_context, global_context, selection_context, tools=bool(tools))
+            if tools:
+                chunks = ask_with_tools(backend, full_prompt, model, tools, call_tool)
+            else:
+                chunks = backend.generate_stream(full_prompt, model)
+            shared = _in_flight[key] = SharedStream(key, chunks)
+        if shared is not None:
+            shared.subscribers += 1
+    if cached is not None:
+        yield cached
+        return
+    if owner:
+        shared.start()
+    try:
+        yield from shared.follow()
+    finally:
+        shared.detach()
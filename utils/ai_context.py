@@ -0,0 +1,68 @@
+import os
+from collections import OrderedDict
+
+import streamlit as st
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Context slots sent to the assistant with every question
+SLOTS = ("global", "selection")
+
+# Size budget of each slot, in characters (keeps prompts small and cheap)
+MAX_CONTEXT_CHARS = int(os.getenv("AI_CONTEXT_MAX_CHARS", 4000))
+
+# Materialized contexts kept per session (one per filter state)
+CACHE_MAX_ENTRIES = 32
+
+TRUNCATION_NOTE = "\n[... contesto troncato ...]"
+
+
+def register_context(slot: str, provider=None, key=None):
+    """
+    Registers the callable that builds a context slot for the current page.
+
+    Nothing is computed here: the provider is only called when the assistant sends a
+    question, so reruns that never open the chat cost nothing.
+
+    Args:
+        slot: One of SLOTS.
+        provider: Callable returning the context text, or None for an empty slot.
+        key: Hashable summary of the state the text depends on (filters, selection...).
+            Texts are cached per (slot, key), so the key should identify the page too;
+            None disables caching for this provider.
+    """
+    if slot not in SLOTS:
+        raise ValueError(f"Unknown context slot: {slot}")
+    providers = st.session_state.setdefault("ai_context_providers", {})
+    providers[slot] = (provider, key)
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars - len(TRUNCATION_NOTE)] + TRUNCATION_NOTE
+
+
+def materialize(slot: str, max_chars: int = MAX_CONTEXT_CHARS) -> str:
+    """Text of a context slot, built by its provider (or taken from the cache)."""
+    provider, key = st.session_state.get("ai_context_providers", {}).get(slot, (None, None))
+    if provider is None:
+        return ""
+    cache = st.session_state.setdefault("ai_context_cache", OrderedDict())
+    cache_key = (slot, key, max_chars)
+    if key is not None and cache_key in cache:
+        cache.move_to_end(cache_key)
+        return cache[cache_key]
+
+    text = _truncate(provider(), max_chars)
+    if key is not None:
+        cache[cache_key] = text
+        while len(cache) > CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+    return text
+
+
+def materialize_all(max_chars: int = MAX_CONTEXT_CHARS) -> dict:
+    """{slot: text} for every slot of the current page."""
+    return {slot: materialize(slot, max_chars) for slot in SLOTS}
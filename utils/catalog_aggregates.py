@@ -0,0 +1,199 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from dotenv import load_dotenv
+
+from utils import shared_catalog
+from utils.rate_analytics import InterEventMoments
+from utils.seismology import ExactSum, estimate_mc, gutenberg_richter_from_stats
+
+load_dotenv()
+
+# Catalogs above this many events are aggregated out of core (one partition at a time)
+OUT_OF_CORE_ROWS = int(os.getenv("CATALOG_OUT_OF_CORE_ROWS", 5_000_000))
+
+# Columns read by the filter -> aggregate pipeline
+COLUMNS = ["time", "latitude", "longitude", "depth", "magnitude"]
+
+# Waiting-time histogram: fixed bins, so that partial histograms add up exactly
+WAITING_MAX_HOURS = 100.0
+WAITING_BINS = 50
+
+
+def frame_partition(df: pd.DataFrame) -> dict:
+    """An in-memory frame as a single partition (views of its columns)."""
+    return {name: df[name].to_numpy() for name in COLUMNS}
+
+
+def filter_mask(part: dict, filters: tuple) -> np.ndarray:
+    """
+    Rows of a partition inside the sidebar filters (see Sidebar.filter_key). NaN and NaT
+    never match, as with the pandas comparisons.
+    """
+    years, depth, magnitude, latitude, longitude = filters
+    year = part["time"].astype("datetime64[Y]").astype(np.int64) + 1970
+    mask = (year >= years[0]) & (year <= years[1]) & ~np.isnat(part["time"])
+    for name, (low, high) in (("magnitude", magnitude), ("depth", depth),
+                              ("latitude", latitude), ("longitude", longitude)):
+        mask &= (part[name] >= low) & (part[name] <= high)
+    return mask
+
+
+def summarize(partitions) -> dict:
+    """Ranges of the catalog columns (NaN ignored), as used for the sidebar bounds."""
+    years, ranges = [], {name: [] for name in COLUMNS[1:]}
+    for part in partitions:
+        time = part["time"][~np.isnat(part["time"])]
+        if len(time):
+            year = time.astype("datetime64[Y]").astype(np.int64) + 1970
+            years += [year.min(), year.max()]
+        for name in ranges:
+            values = part[name][~np.isnan(part[name])]
+            if len(values):
+                ranges[name] += [values.min(), values.max()]
+    summary = {"years": (int(min(years)), int(max(years))) if years else (0, 0)}
+    for name, values in ranges.items():
+        summary[name] = (float(min(values)), float(max(values))) if values else (np.nan, np.nan)
+    return summary
+
+
+class CatalogAggregates:
+    """
+    Filter -> aggregate pipeline of the statistics page, fed partitions in time order:
+    monthly and daily counts, magnitude-frequency counts, waiting-time histogram and
+    moments, and the G-R sufficient statistics. Every aggregate is exactly additive over partitions, so the
+    result does not depend on how the catalog is split (one in-memory frame included).
+    """
+
+    def __init__(self, filters: tuple = None):
+        self.filters = filters
+        self.n_events = 0
+        self._months = Counter()
+        self._days = Counter()
+        self._magnitudes = Counter()  # rounded to 0.1
+        self._waiting = np.zeros(WAITING_BINS, dtype=np.int64)
+        self.interevent = InterEventMoments()
+        self._last_time = None
+        self._magnitude_sum = ExactSum()
+        self._n_above = 0
+
+    def _select(self, part: dict) -> dict:
+        if self.filters is None:
+            return part
+        mask = filter_mask(part, self.filters)
+        return {name: values[mask] for name, values in part.items()}
+
+    def add(self, part: dict):
+        """First pass: counts and waiting times."""
+        part = self._select(part)
+        time, magnitude = part["time"], part["magnitude"]
+        self.n_events += len(time)
+
+        months, counts = np.unique(time[~np.isnat(time)].astype("datetime64[M]"), return_counts=True)
+        self._months.update(dict(zip(months, counts.tolist())))
+        days, counts = np.unique(time[~np.isnat(time)].astype("datetime64[D]"), return_counts=True)
+        self._days.update(dict(zip(days, counts.tolist())))
+        rounded, counts = np.unique(np.round(magnitude[~np.isnan(magnitude)], 1), return_counts=True)
+        self._magnitudes.update(dict(zip(rounded.tolist(), counts.tolist())))
+
+        time = time[~np.isnat(time)]
+        if not len(time):
+            return
+        if self._last_time is not None:
+            # The first waiting time of a partition starts in the previous one
+            time = np.concatenate([[self._last_time], time])
+        deltas_ns = np.diff(time).astype(np.int64)
+        if (deltas_ns < 0).any():
+            raise ValueError("Il catalogo non è in ordine di tempo")
+        hours = deltas_ns / 1e9 / 3600.0
+        self._waiting += np.histogram(hours[hours < WAITING_MAX_HOURS], bins=WAITING_BINS,
+                                      range=(0.0, WAITING_MAX_HOURS))[0]
+        self.interevent.add(hours)
+        self._last_time = time[-1]
+
+    def daily_counts(self) -> pd.Series:
+        """Number of events per day (see utils.rate_analytics.daily_counts)."""
+        days = np.array(sorted(self._days), dtype="datetime64[ns]")
+        return pd.Series([self._days[day] for day in days.astype("datetime64[D]")],
+                         index=pd.DatetimeIndex(days), dtype=np.int64)
+
+    def magnitude_counts(self) -> pd.Series:
+        """{magnitude rounded to 0.1: number of events}, ascending."""
+        return pd.Series(self._magnitudes, dtype=np.int64).sort_index()
+
+    def mc(self) -> float:
+        return estimate_mc(self.magnitude_counts())
+
+    def add_above(self, part: dict, mc: float):
+        """Second pass (once Mc is known): G-R sufficient statistics."""
+        magnitude = self._select(part)["magnitude"]
+        above = magnitude[magnitude >= mc]
+        self._n_above += len(above)
+        self._magnitude_sum.add(above)
+
+    def gr_params(self, mc: float) -> dict:
+        if not self.n_events:
+            return {'a_value': np.nan, 'b_value': np.nan, 'mc': np.nan, 'n_total': 0, 'valid': False}
+        return gutenberg_richter_from_stats(self._n_above, self._magnitude_sum.value(), mc)
+
+    def timeline(self) -> pd.DataFrame:
+        months = sorted(self._months)
+        return pd.DataFrame({
+            'year_month': [str(np.datetime_as_string(month, unit='M')) for month in months],
+            'counts': [self._months[month] for month in months],
+        })
+
+    def magnitude_frequency(self) -> pd.DataFrame:
+        """Cumulative number of events with magnitude >= M (the G-R plot)."""
+        cdf = self.magnitude_counts().sort_index(ascending=False).cumsum().sort_index()
+        gr_df = pd.DataFrame({'Magnitude': cdf.index, 'Count': cdf.values})
+        gr_df['LogCount'] = np.log10(gr_df['Count'])
+        return gr_df
+
+    def waiting_times(self) -> pd.DataFrame:
+        edges = np.linspace(0.0, WAITING_MAX_HOURS, WAITING_BINS + 1)
+        return pd.DataFrame({'start': edges[:-1], 'end': edges[1:], 'count': self._waiting})
+
+
+def aggregate(partitions, filters: tuple = None) -> dict:
+    """
+    Runs the pipeline over partitions (a callable returning an iterable of
+    {column: array} in time order; called twice). Memory is bounded by one partition.
+    """
+    aggregates = CatalogAggregates(filters)
+    for part in partitions():
+        aggregates.add(part)
+    mc = aggregates.mc()
+    for part in partitions():
+        aggregates.add_above(part, mc)
+    return {
+        "n_events": aggregates.n_events,
+        "gr_params": aggregates.gr_params(mc),
+        "magnitude_frequency": aggregates.magnitude_frequency(),
+        "timeline": aggregates.timeline(),
+        "waiting_times": aggregates.waiting_times(),
+        "interevent": aggregates.interevent.summary(),
+        "interevent_distribution": aggregates.interevent.distribution(),
+        "daily_counts": aggregates.daily_counts(),
+    }
+
+
+def aggregate_frame(df: pd.DataFrame) -> dict:
+    """The pipeline on an already filtered in-memory frame."""
+    if not df['time'].is_monotonic_increasing:
+        df = df.sort_values('time', kind='stable')
+    return aggregate(lambda: [frame_partition(df)])
+
+
+@st.cache_data(max_entries=32, show_spinner="Aggregazione del catalogo...")
+def aggregate_catalog(version: str, filters: tuple) -> dict:
+    """The pipeline streamed over a published catalog version."""
+    return aggregate(lambda: shared_catalog.iter_partitions(version, COLUMNS), filters)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def summarize_catalog(version: str) -> dict:
+    return summarize(shared_catalog.iter_partitions(version, COLUMNS))
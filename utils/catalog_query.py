@@ -0,0 +1,233 @@
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils import shared_catalog
+from utils.seismology import gutenberg_richter_mle
+
+EARTH_RADIUS_KM = 6371.0
+
+# Rows returned by list-type tools (keeps tool results, and so prompts, small)
+MAX_ROWS = 20
+# Tool results kept by each engine
+CACHE_MAX_ENTRIES = 512
+
+# Filters shared by every tool (JSON schema, as sent to the model)
+FILTER_PROPERTIES = {
+    "start": {"type": "string", "description": "Inizio intervallo (data/ora ISO, UTC), incluso"},
+    "end": {"type": "string", "description": "Fine intervallo (data/ora ISO, UTC), esclusa"},
+    "min_magnitude": {"type": "number"},
+    "max_magnitude": {"type": "number"},
+    "min_depth": {"type": "number", "description": "Profondità minima (km)"},
+    "max_depth": {"type": "number", "description": "Profondità massima (km)"},
+    "center_latitude": {"type": "number", "description": "Centro dell'area circolare (gradi)"},
+    "center_longitude": {"type": "number", "description": "Centro dell'area circolare (gradi)"},
+    "radius_km": {"type": "number", "description": "Raggio dell'area circolare (km)"},
+}
+
+
+def _schema(properties: dict = None, required: list = None) -> dict:
+    return {"type": "object", "properties": {**(properties or {}), **FILTER_PROPERTIES}, "required": required or []}
+
+
+# Tools the model can call; the engine method has the same name
+TOOLS = [
+    {
+        "name": "count_events",
+        "description": "Numero di eventi del catalogo che soddisfano i filtri.",
+        "parameters": _schema(),
+    },
+    {
+        "name": "event_statistics",
+        "description": "Statistiche (numero, magnitudo e profondità min/media/max, primo e ultimo evento) "
+                       "degli eventi che soddisfano i filtri.",
+        "parameters": _schema(),
+    },
+    {
+        "name": "nearest_events",
+        "description": "Gli eventi più vicini a un punto, con la distanza in km.",
+        "parameters": _schema({
+            "latitude": {"type": "number"},
+            "longitude": {"type": "number"},
+            "k": {"type": "integer", "description": f"Numero di eventi (max {MAX_ROWS})"},
+        }, ["latitude", "longitude"]),
+    },
+    {
+        "name": "gutenberg_richter",
+        "description": "Parametri a, b e Mc della legge di Gutenberg-Richter (MLE) sugli eventi filtrati.",
+        "parameters": _schema({
+            "mc": {"type": "number", "description": "Magnitudo di completezza (stimata se assente)"},
+        }),
+    },
+    {
+        "name": "largest_events",
+        "description": "Gli eventi di magnitudo maggiore che soddisfano i filtri.",
+        "parameters": _schema({
+            "n": {"type": "integer", "description": f"Numero di eventi (max {MAX_ROWS})"},
+        }),
+    },
+]
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _timestamp(value) -> np.datetime64:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        # Catalog times are naive UTC
+        ts = ts.tz_convert(None)
+    return np.datetime64(ts, 'ns')
+
+
+def _number(value):
+    """JSON-friendly scalar (NaN becomes None)."""
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
+
+
+class CatalogQueryEngine:
+    """
+    In-process query engine over the catalog, serving the assistant's tools.
+
+    Columns are held as numpy arrays sorted by time, so the time window of a query is
+    two binary searches and the remaining filters are vectorized masks on that slice.
+    Results are cached by tool name and arguments (the catalog does not change while
+    the engine lives).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        if not df['time'].is_monotonic_increasing:
+            df = df.sort_values('time', kind='stable')
+        # Otherwise the arrays are views of the (shared) catalog columns
+        self.time = df['time'].to_numpy(dtype='datetime64[ns]')
+        self.latitude = df['latitude'].to_numpy(dtype=float)
+        self.longitude = df['longitude'].to_numpy(dtype=float)
+        self.depth = df['depth'].to_numpy(dtype=float)
+        self.magnitude = df['magnitude'].to_numpy(dtype=float)
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def _select(self, start=None, end=None, min_magnitude=None, max_magnitude=None, min_depth=None,
+                max_depth=None, center_latitude=None, center_longitude=None, radius_km=None) -> np.ndarray:
+        """Positions of the events matching the filters (ascending time)."""
+        lo = 0 if start is None else np.searchsorted(self.time, _timestamp(start))
+        hi = len(self.time) if end is None else np.searchsorted(self.time, _timestamp(end))
+        mask = np.ones(max(hi - lo, 0), dtype=bool)
+        for values, low, high in ((self.magnitude, min_magnitude, max_magnitude), (self.depth, min_depth, max_depth)):
+            if low is not None:
+                mask &= values[lo:hi] >= low
+            if high is not None:
+                mask &= values[lo:hi] <= high
+        if radius_km is not None:
+            if center_latitude is None or center_longitude is None:
+                raise ValueError("radius_km richiede center_latitude e center_longitude")
+            mask &= _haversine_km(center_latitude, center_longitude,
+                                  self.latitude[lo:hi], self.longitude[lo:hi]) <= radius_km
+        return lo + np.flatnonzero(mask)
+
+    def _events(self, rows: np.ndarray, distances: np.ndarray = None) -> list[dict]:
+        events = []
+        for j, i in enumerate(rows):
+            event = {
+                "time": str(pd.Timestamp(self.time[i]))[:19],
+                "magnitude": _number(self.magnitude[i]),
+                "depth_km": _number(self.depth[i]),
+                "latitude": _number(self.latitude[i]),
+                "longitude": _number(self.longitude[i]),
+            }
+            if distances is not None:
+                event["distance_km"] = round(float(distances[j]), 1)
+            events.append(event)
+        return events
+
+    def count_events(self, **filters) -> dict:
+        return {"count": int(len(self._select(**filters)))}
+
+    def event_statistics(self, **filters) -> dict:
+        rows = self._select(**filters)
+        if not len(rows):
+            return {"count": 0}
+        mags, depths = self.magnitude[rows], self.depth[rows]
+        return {
+            "count": int(len(rows)),
+            "magnitude": {"min": _number(np.nanmin(mags)), "mean": _number(np.nanmean(mags)),
+                          "max": _number(np.nanmax(mags)), "std": _number(np.nanstd(mags, ddof=1) if len(rows) > 1 else 0.0)},
+            "depth_km": {"min": _number(np.nanmin(depths)), "mean": _number(np.nanmean(depths)),
+                         "max": _number(np.nanmax(depths))},
+            "first_event": str(pd.Timestamp(self.time[rows[0]]))[:19],
+            "last_event": str(pd.Timestamp(self.time[rows[-1]]))[:19],
+        }
+
+    def nearest_events(self, latitude: float, longitude: float, k: int = 5, **filters) -> dict:
+        rows = self._select(**filters)
+        k = max(1, min(int(k), MAX_ROWS, len(rows)))
+        if not len(rows):
+            return {"events": []}
+        distances = _haversine_km(latitude, longitude, self.latitude[rows], self.longitude[rows])
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return {"events": self._events(rows[nearest], distances[nearest])}
+
+    def gutenberg_richter(self, mc: float = None, **filters) -> dict:
+        params = gutenberg_richter_mle(pd.Series(self.magnitude[self._select(**filters)]), mc)
+        return {key: (bool(v) if key == "valid" else int(v) if key == "n_total" else _number(v))
+                for key, v in params.items()}
+
+    def largest_events(self, n: int = 5, **filters) -> dict:
+        rows = self._select(**filters)
+        n = max(1, min(int(n), MAX_ROWS, len(rows)))
+        if not len(rows):
+            return {"events": []}
+        mags = np.nan_to_num(self.magnitude[rows], nan=-np.inf)
+        largest = np.argpartition(-mags, n - 1)[:n]
+        largest = largest[np.argsort(-mags[largest], kind='stable')]
+        return {"events": self._events(rows[largest])}
+
+    def call(self, name: str, args: dict) -> dict:
+        """
+        Runs a tool by name (cached). Invalid calls return {"error": ...} so the model
+        can correct itself instead of the reply failing.
+        """
+        if name not in {tool["name"] for tool in TOOLS}:
+            return {"error": f"Strumento sconosciuto: {name}"}
+        key = json.dumps([name, args], sort_keys=True, default=str)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        try:
+            result = getattr(self, name)(**{k: v for k, v in args.items() if v is not None})
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > CACHE_MAX_ENTRIES:
+                self._cache.popitem(last=False)
+        return result
+
+
+@st.cache_resource(max_entries=shared_catalog.KEEP_VERSIONS, show_spinner=False)
+def load_engine(version: str) -> CatalogQueryEngine:
+    """The engine over one version of the shared catalog, shared by all sessions."""
+    from utils.load_data import attach_catalog
+
+    return CatalogQueryEngine(attach_catalog(version))
+
+
+def current_engine() -> CatalogQueryEngine:
+    """The engine over the current catalog version (None without a catalog)."""
+    from utils.load_data import current_catalog
+
+    pointer = current_catalog()
+    return None if pointer is None else load_engine(pointer["version"])
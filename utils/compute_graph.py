@@ -0,0 +1,96 @@
+import functools
+import hashlib
+import time
+
+import streamlit as st
+
+from utils.disk_cache import fingerprint
+
+
+class ComputeGraph:
+    """
+    Dependency-tracked computations of a page.
+
+    Sources are the page's inputs (filtered catalog, widget values), each with a cheap
+    token identifying its value; nodes are functions of sources and other nodes. A
+    node's token combines its code and its inputs' tokens, and the last value of every
+    node is kept per session: a rerun only recomputes the nodes downstream of a source
+    whose token changed.
+
+    Nodes must depend only on their declared inputs and must not modify them (values
+    are shared with later reruns).
+
+    Panels render node values. A panel with its own widgets (interactive=True) runs as
+    an st.fragment: moving those widgets reruns the panel alone, not the whole page.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._sources: dict[str, tuple] = {}  # name -> (value, token)
+        self._nodes: dict[str, tuple] = {}    # name -> (func, inputs)
+        self._tokens: dict[str, str] = {}     # resolved in this run
+
+    @property
+    def _memo(self) -> dict:
+        """{node: (token, value, seconds)} of this session."""
+        return st.session_state.setdefault(f"compute_graph:{self.name}", {})
+
+    def source(self, name: str, value, token=None):
+        """
+        Sets an input of the graph. Without a token the value itself is fingerprinted:
+        pass one for large values (e.g. the filter state for a filtered DataFrame).
+        """
+        if token is None:
+            token = fingerprint(value).hexdigest()
+        self._sources[name] = (value, repr(token))
+        self._tokens.clear()
+
+    def node(self, name: str, *inputs: str):
+        """Decorator registering func(*input values) as node `name`."""
+        def decorator(func):
+            self._nodes[name] = (func, inputs)
+            return func
+        return decorator
+
+    def token(self, name: str) -> str:
+        if name in self._sources:
+            return self._sources[name][1]
+        if name not in self._tokens:
+            func, inputs = self._nodes[name]
+            h = hashlib.blake2b(f"{name}|{hash(func.__code__)}".encode(), digest_size=16)
+            for dependency in inputs:
+                h.update(self.token(dependency).encode())
+            self._tokens[name] = h.hexdigest()
+        return self._tokens[name]
+
+    def get(self, name: str):
+        """Value of a source or node, recomputed only if an upstream input changed."""
+        if name in self._sources:
+            return self._sources[name][0]
+        token = self.token(name)
+        memo = self._memo
+        if name in memo and memo[name][0] == token:
+            return memo[name][1]
+        func, inputs = self._nodes[name]
+        values = [self.get(dependency) for dependency in inputs]
+        t0 = time.perf_counter()
+        value = func(*values)
+        memo[name] = (token, value, time.perf_counter() - t0)
+        return value
+
+    def timings(self) -> dict:
+        """{node: seconds of its last computation} in this session."""
+        return {name: entry[2] for name, entry in self._memo.items()}
+
+    def panel(self, *inputs: str, interactive: bool = False):
+        """
+        Decorator rendering func(*input values) where it is called; the inputs are
+        evaluated when the panel renders. Interactive panels may also set sources (their
+        widget values) and read nodes with get().
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def render():
+                func(*(self.get(name) for name in inputs))
+            return st.fragment(render) if interactive else render
+        return decorator
@@ -0,0 +1,156 @@
+import dataclasses
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Results of expensive computations, kept across server restarts:
+# <root>/<key[:2]>/<key>.pkl, key = function + version + source + input fingerprint
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'cache')
+MAX_BYTES = int(os.getenv("DISK_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+_evict_lock = threading.Lock()
+
+
+def fingerprint(obj, h=None):
+    """
+    Feeds a stable digest of obj into h (a hashlib object) and returns it. Stable across
+    processes: DataFrames and arrays are hashed by content, dataclasses field by field.
+    """
+    h = h or hashlib.sha256()
+    if isinstance(obj, pd.DataFrame):
+        h.update(b"df")
+        h.update(repr((list(obj.columns), [str(t) for t in obj.dtypes])).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(b"series")
+        h.update(str(obj.dtype).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(b"array")
+        h.update(repr((obj.dtype.str, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        h.update(type(obj).__qualname__.encode())
+        for f in dataclasses.fields(obj):
+            h.update(f.name.encode())
+            fingerprint(getattr(obj, f.name), h)
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            fingerprint(item, h)
+    elif isinstance(obj, dict):
+        h.update(f"dict{len(obj)}".encode())
+        for key in sorted(obj, key=repr):
+            fingerprint(key, h)
+            fingerprint(obj[key], h)
+    else:
+        h.update(repr(obj).encode())
+    return h
+
+
+def file_state(paths) -> list:
+    """(path, size, mtime) of input files, so results follow the files they were computed from."""
+    states = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            states.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            states.append((os.path.basename(path), None, None))
+    return states
+
+
+def _entry_path(key: str, root: str) -> str:
+    return os.path.join(root, key[:2], f"{key}.pkl")
+
+
+def _evict(root: str, max_bytes: int):
+    """Deletes the least recently used entries until the cache is under 90% of max_bytes."""
+    with _evict_lock:
+        entries = []
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if total <= max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= 0.9 * max_bytes:
+                break
+
+
+def disk_cache(version: str = "1", depends_on=None, root: str = None, max_bytes: int = None):
+    """
+    Caches a function's results on disk, so they survive restarts.
+
+    Meant to sit under st.cache_data (memory first, then disk, then compute). Writes are
+    atomic (temporary file + rename), reads refresh the entry's mtime, and the least
+    recently used entries are evicted when the cache grows beyond max_bytes.
+
+    Args:
+        version: Bump to invalidate old results (the function's source is part of the key too).
+        depends_on: Optional callable taking the function's arguments and returning the paths
+            of files the result depends on (their size and mtime enter the key).
+    """
+    def decorator(func):
+        try:
+            source = hashlib.sha256(inspect.getsource(func).encode()).hexdigest()
+        except OSError:
+            # No source file (e.g. frozen or interactive code): the bytecode will do
+            source = hashlib.sha256(func.__code__.co_code).hexdigest()
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_root = root or CACHE_DIR
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            h = hashlib.sha256(f"{func.__module__}.{func.__qualname__}|{version}|{source}".encode())
+            fingerprint(dict(bound.arguments), h)
+            if depends_on is not None:
+                fingerprint(file_state(depends_on(*args, **kwargs)), h)
+            path = _entry_path(h.hexdigest(), cache_root)
+
+            if os.path.exists(path):
+                try:
+                    with open(path, "rb") as f:
+                        result = pickle.load(f)
+                    os.utime(path)
+                    return result
+                except Exception:
+                    # Truncated or stale entry: recompute and overwrite
+                    pass
+
+            result = func(*args, **kwargs)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+                _evict(cache_root, max_bytes or MAX_BYTES)
+            except OSError as e:
+                print(f"Disk cache write failed for {func.__qualname__}: {e}")
+            return result
+
+        return wrapper
+    return decorator
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+from streamlit.errors import StreamlitAPIException
+
+from utils.trace import CompactTrace
+
+# ~2 points per horizontal pixel on a wide chart
+DEFAULT_POINT_BUDGET = 2000
+
+
+def minmax_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """
+    Returns the sorted indices of the minimum and maximum sample of each bucket.
+    Fully vectorized: the signal is padded and reshaped to (n_buckets, bucket_size).
+    """
+    n = len(y)
+    if n_buckets <= 0 or n <= 2 * n_buckets:
+        return np.arange(n)
+
+    bucket_size = int(np.ceil(n / n_buckets))
+    n_buckets = int(np.ceil(n / bucket_size))
+    padded = np.full(n_buckets * bucket_size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, bucket_size)
+
+    base = np.arange(n_buckets) * bucket_size
+    valid = ~np.all(np.isnan(padded), axis=1)
+    filled_min = np.where(np.isnan(padded), np.inf, padded)
+    filled_max = np.where(np.isnan(padded), -np.inf, padded)
+    idx_min = base + np.argmin(filled_min, axis=1)
+    idx_max = base + np.argmax(filled_max, axis=1)
+    return np.unique(np.concatenate([idx_min[valid], idx_max[valid]]))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: returns the indices of the n_out points that best
+    preserve the visual shape of the series.
+
+    The input is first reduced with per-bucket min/max (vectorized), so the sequential
+    LTTB pass only iterates over n_out buckets of a few candidates each.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    candidates = minmax_indices(y, 2 * n_out)
+    cx = x[candidates].astype(np.float64)
+    cy = y[candidates].astype(np.float64)
+    m = len(candidates)
+    if n_out >= m:
+        return candidates
+
+    # Bucket boundaries over the inner candidates (first and last are always kept)
+    edges = np.linspace(1, m - 1, n_out - 1).astype(np.int64)
+    # Average point of every bucket, used as the third vertex of the triangle
+    counts = np.diff(edges)
+    sum_x = np.add.reduceat(cx[1:m - 1], edges[:-1] - 1)
+    sum_y = np.add.reduceat(cy[1:m - 1], edges[:-1] - 1)
+    avg_x = np.append(sum_x / counts, cx[-1])
+    avg_y = np.append(sum_y / counts, cy[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = m - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        bx, by = cx[lo:hi], cy[lo:hi]
+        area = np.abs((cx[a] - avg_x[i + 1]) * (by - cy[a]) - (cx[a] - bx) * (avg_y[i + 1] - cy[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return candidates[selected]
+
+
+def downsample_trace(trace: CompactTrace, max_points: int = DEFAULT_POINT_BUDGET, method: str = "lttb",
+                     x_range: tuple = None) -> tuple[pd.DatetimeIndex, np.ndarray]:
+    """
+    Reduces a waveform to a pixel-budgeted number of points.
+
+    Args:
+        trace: CompactTrace to reduce.
+        max_points: Maximum number of points sent to the browser.
+        method: 'lttb' (shape preserving) or 'minmax' (envelope preserving).
+        x_range: Optional (start, end) timestamps: only this window is resolved.
+
+    Returns:
+        Tuple (times, values). Gaps in the trace are kept as NaN points so they
+        are not drawn as straight lines. Times are only built for the kept samples.
+    """
+    if trace is None or trace.empty:
+        return pd.DatetimeIndex([]), np.array([])
+
+    if x_range is not None:
+        window = trace.slice(pd.Timestamp(x_range[0]).timestamp(), pd.Timestamp(x_range[1]).timestamp())
+        # A zoom window that no longer overlaps the trace (e.g. new event) is ignored
+        if not window.empty:
+            trace = window
+
+    y = np.asarray(trace.data, dtype=np.float64)
+    if len(y) <= max_points:
+        return trace.times(), y
+
+    if method == "minmax":
+        idx = minmax_indices(y, max_points // 2)
+    else:
+        idx = lttb_indices(np.arange(len(y), dtype=np.float64), y, max_points)
+
+    # Re-insert a NaN wherever a gap lies between two kept samples
+    missing = np.cumsum(np.isnan(y))
+    breaks = np.flatnonzero(missing[idx[1:]] - missing[idx[:-1]] > 0) + 1
+    values = np.insert(y[idx], breaks, np.nan)
+    positions = np.insert(idx.astype(np.float64), breaks, (idx[breaks - 1] + idx[breaks]) / 2.0)
+    return trace.times(positions), values
+
+
+def _selection_range(key: str):
+    """
+    Returns the x range of the box drawn on the chart identified by key, if any.
+    """
+    state = st.session_state.get(key)
+    if not state:
+        return None
+    boxes = state.get("selection", {}).get("box", [])
+    if not boxes or "x" not in boxes[0]:
+        return None
+    x0, x1 = boxes[0]["x"][:2]
+    to_ts = lambda v: pd.to_datetime(v, unit="ms") if isinstance(v, (int, float)) else pd.to_datetime(v)
+    start, end = sorted([to_ts(x0), to_ts(x1)])
+    return start, end
+
+
+def plot_waveform(trace: CompactTrace, key: str, color: str = None, height: int = 300,
+                  max_points: int = DEFAULT_POINT_BUDGET, margin: dict = None,
+                  xaxis_title: str = "Time", yaxis_title: str = None):
+    """
+    Renders a downsampled waveform. Drawing a box on the chart zooms in: the selected
+    window is re-resolved at full budget from the original trace.
+    """
+    zoom_key = f"{key}_zoom"
+    version_key = f"{key}_version"
+    st.session_state.setdefault(version_key, 0)
+    # The zoom belongs to one trace: a new trace under the same key starts unzoomed
+    trace_id = (trace.seed_id, trace.starttime)
+    zoom = st.session_state.get(zoom_key)
+    if zoom is not None and zoom[0] != trace_id:
+        st.session_state[zoom_key] = zoom = None
+        st.session_state[version_key] += 1
+    chart_key = f"{key}_{st.session_state[version_key]}"
+
+    # A box drawn on the current chart becomes the new zoom window
+    box = _selection_range(chart_key)
+    if box is not None:
+        st.session_state[zoom_key] = zoom = (trace_id, box)
+        st.session_state[version_key] += 1
+        chart_key = f"{key}_{st.session_state[version_key]}"
+
+    x_range = zoom[1] if zoom is not None else None
+    times, values = downsample_trace(trace, max_points, x_range=x_range)
+
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=times, y=values, line=dict(color=color, width=1), name="Velocity"))
+    fig.update_layout(height=height, margin=margin or dict(l=0, r=0, t=30, b=0),
+                      xaxis_title=xaxis_title, yaxis_title=yaxis_title or trace.amplitude_label, dragmode="select")
+    st.plotly_chart(fig, key=chart_key, width='stretch', height=height, on_select="rerun", selection_mode="box")
+
+    if x_range is not None:
+        st.caption(f"Zoom: {x_range[0]} → {x_range[1]} ({len(values)} punti)")
+        if st.button("Ripristina zoom", key=f"{key}_reset"):
+            st.session_state[zoom_key] = None
+            st.session_state[version_key] += 1
+            _rerun()
+
+
+def _rerun():
+    """Reruns the enclosing fragment during a fragment rerun, the whole app otherwise."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
@@ -0,0 +1,331 @@
+import hashlib
+import heapq
+import io
+import itertools
+import os
+import pickle
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from obspy.clients.fdsn import Client
+
+load_dotenv()
+
+# FDSN datacenter used by the dashboard: an ObsPy shortcut or a base URL
+# (e.g. http://localhost:8080 for a local stand-in)
+FDSN_BASE_URL = os.getenv("FDSN_BASE_URL", "INGV")
+
+# Service discovery results (parsed WADLs) kept on disk between runs
+DISCOVERY_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'fdsn_services')
+DISCOVERY_TTL = 7 * 86400  # seconds
+
+# Keep-alive connections kept open per host, shared by every thread
+POOL_SIZE = 16
+
+# Global rate limit of the process (token bucket): sustained requests per second and burst.
+# A rate of 0 disables the limit.
+RATE_LIMIT = float(os.getenv("FDSN_RATE_LIMIT", 5))
+BURST = int(os.getenv("FDSN_BURST", 10))
+
+# Request priorities (lower is served first): user clicks beat background jobs
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# Latencies kept per endpoint for the percentiles
+LATENCY_WINDOW = 500
+
+_session = None
+_clients: dict[str, Client] = {}
+_lock = threading.Lock()
+_clients_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """The process-wide HTTP session (connection pool), created on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+class TokenBucket:
+    """
+    Token bucket shared by all threads. Waiting requests are served by priority,
+    then in arrival order; a request never overtakes a more urgent one.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT, capacity: int = BURST):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._waiting = []  # heap of tickets
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def ticket(self, priority: int = INTERACTIVE) -> list:
+        """A place in the queue: [priority, arrival order], promotable while waiting."""
+        return [priority, next(self._sequence)]
+
+    def promote(self, ticket: list, priority: int):
+        """Raises a waiting ticket's priority (e.g. a click joining a background request)."""
+        with self._condition:
+            if priority < ticket[0]:
+                ticket[0] = priority
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+    def acquire(self, priority: int = INTERACTIVE, ticket: list = None):
+        if self.rate <= 0:
+            return
+        with self._condition:
+            ticket = ticket or self.ticket(priority)
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    self._refill()
+                    if self._waiting[0] is ticket and self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    # The head sleeps until its token is due; the others until the head moves
+                    timeout = (1 - self._tokens) / self.rate if self._waiting[0] is ticket else None
+                    self._condition.wait(timeout)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.nodata = 0
+        self.coalesced = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            return round(1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1) if latencies else None
+        return {
+            "requests": self.requests, "errors": self.errors, "nodata": self.nodata, "coalesced": self.coalesced,
+            "p50_ms": percentile(0.5), "p95_ms": percentile(0.95),
+            "max_ms": round(1000 * latencies[-1], 1) if latencies else None,
+        }
+
+
+def endpoint_name(url: str) -> str:
+    """Service and resource of an FDSN URL, e.g. 'dataselect/query'."""
+    parts = urllib.parse.urlsplit(url).path.strip("/").split("/")
+    if "fdsnws" in parts and len(parts) > parts.index("fdsnws") + 1:
+        return f"{parts[parts.index('fdsnws') + 1]}/{parts[-1]}"
+    return "/".join(parts)
+
+
+class Gateway:
+    """
+    Single exit point of the process towards FDSN services.
+
+    Identical requests (method, URL, body) in flight at the same time are sent once and
+    every caller gets the same response; each request sent takes a token from the
+    shared bucket at the caller's priority; latencies and outcomes are counted per
+    endpoint (see metrics()).
+    """
+
+    def __init__(self, bucket: TokenBucket = None):
+        self.bucket = bucket or TokenBucket()
+        self._in_flight: dict[tuple, tuple] = {}  # key -> (Future, bucket ticket)
+        self._metrics: dict[str, EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, url: str) -> EndpointMetrics:
+        name = endpoint_name(url)
+        if name not in self._metrics:
+            self._metrics[name] = EndpointMetrics()
+        return self._metrics[name]
+
+    def request(self, method: str, url: str, headers: dict, data: bytes = None, timeout: float = None):
+        """Returns (status, reason, headers, content); transport errors propagate to every waiter."""
+        key = (method, url, data)
+        level = current_priority()
+        with self._lock:
+            entry = self._in_flight.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._in_flight[key] = (Future(), self.bucket.ticket(level))
+            else:
+                self._endpoint(url).coalesced += 1
+        future, ticket = entry
+        if not owner:
+            # Still queued at a lower priority: it now serves this caller too
+            self.bucket.promote(ticket, level)
+            return future.result()
+
+        try:
+            self.bucket.acquire(level, ticket)
+            t0 = time.monotonic()
+            try:
+                response = get_session().request(method, url, data=data, timeout=timeout, headers=headers)
+                result = (response.status_code, response.reason, response.headers, response.content)
+            finally:
+                elapsed = time.monotonic() - t0
+            with self._lock:
+                metrics = self._endpoint(url)
+                metrics.requests += 1
+                metrics.latencies.append(elapsed)
+                if result[0] in (204, 404):
+                    metrics.nodata += 1
+                elif result[0] >= 400:
+                    metrics.errors += 1
+            future.set_result(result)
+            return result
+        except Exception as e:
+            with self._lock:
+                metrics = self._endpoint(url)
+                metrics.requests += 1
+                metrics.errors += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def metrics(self) -> dict:
+        """{endpoint: counters and latency percentiles}."""
+        with self._lock:
+            return {name: m.snapshot() for name, m in sorted(self._metrics.items())}
+
+
+gateway = Gateway()
+
+_default_priority = INTERACTIVE
+_thread_priority = threading.local()
+
+
+def set_default_priority(level: int):
+    """Priority of requests made outside a priority() block (e.g. BACKGROUND in scripts)."""
+    global _default_priority
+    _default_priority = level
+
+
+def current_priority() -> int:
+    return getattr(_thread_priority, "level", _default_priority)
+
+
+@contextmanager
+def priority(level: int):
+    """Requests made by this thread inside the block use the given priority."""
+    previous = getattr(_thread_priority, "level", None)
+    _thread_priority.level = level
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _thread_priority.level
+        else:
+            _thread_priority.level = previous
+
+
+def metrics() -> dict:
+    return gateway.metrics()
+
+
+class _Response:
+    """The part of urllib's response interface used by ObsPy's download_url."""
+
+    def __init__(self, content: bytes, status: int = 200):
+        self._content = content
+        self._status = status
+
+    def getcode(self) -> int:
+        return self._status
+
+    def info(self) -> dict:
+        # requests already decoded any gzip body
+        return {}
+
+    def read(self) -> bytes:
+        return self._content
+
+
+class SessionOpener:
+    """Stands in for ObsPy's urllib opener, sending requests through the gateway."""
+
+    def open(self, request, timeout=None, data=None):
+        url = request.full_url
+        try:
+            status, reason, headers, content = gateway.request("POST" if data else "GET", url,
+                                                               dict(request.header_items()), data, timeout)
+        except requests.Timeout as e:
+            raise socket.timeout(f"timed out: {url}") from e
+        except requests.RequestException as e:
+            raise urllib.error.URLError(e) from e
+        if status >= 400:
+            raise urllib.error.HTTPError(url, status, reason, headers, io.BytesIO(content))
+        return _Response(content, status)
+
+
+class PooledClient(Client):
+    """
+    ObsPy FDSN client whose HTTP requests go through the gateway (shared keep-alive
+    pool, coalescing, rate limit) and whose service discovery is cached on disk, so a
+    restart does not query the WADLs again.
+    Authentication is not supported (the dashboard only reads open data).
+    """
+
+    def _set_opener(self, user, password):
+        self._url_opener = SessionOpener()
+
+    def _discovery_path(self) -> str:
+        import obspy
+        key = f"{self.base_url}|{self.url_subpath}|{sorted(self.major_versions.items())}|{obspy.__version__}"
+        return os.path.join(DISCOVERY_DIR, hashlib.sha1(key.encode()).hexdigest()[:16] + ".pickle")
+
+    def _discover_services(self):
+        path = self._discovery_path()
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < DISCOVERY_TTL:
+            try:
+                with open(path, "rb") as f:
+                    self.services = pickle.load(f)
+                return
+            except Exception:
+                pass  # Unreadable cache: discover again
+        super()._discover_services()
+        os.makedirs(DISCOVERY_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.services, f)
+        os.replace(tmp_path, path)
+
+
+def get_client(base_url: str = None) -> Client:
+    """
+    The shared FDSN client of a datacenter (default FDSN_BASE_URL), built on first use.
+    Nothing touches the network before the first request; failed constructions
+    (e.g. a timeout during service discovery) are retried on the next call.
+    """
+    base_url = base_url or FDSN_BASE_URL
+    # Held while building, so concurrent first requests run the discovery once
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = PooledClient(base_url, force_redirect=True)
+        return _clients[base_url]
@@ -1,24 +1,76 @@
+import threading
+from collections import OrderedDict
+
 from obspy import UTCDateTime
-from obspy.clients.fdsn import Client
+from obspy.clients.fdsn.header import FDSNNoDataException
 from obspy.geodetics import locations2degrees
-import pandas as pd
 
-client = Client("INGV", force_redirect=True)
+from utils.trace import CompactTrace
+from utils.sds_archive import read_trace
+from utils.fdsn import get_client
+from utils.travel_times import phase_window
+
+# Downloaded results shared by all sessions (and warmed by utils.prefetch)
+STATION_CACHE_ENTRIES = 1024
+WAVEFORM_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class _LRUCache:
+    """Thread-safe LRU bounded by entry count and by the bytes of the cached samples."""
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, value, size: int = 0):
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self._entries and ((self.max_entries and len(self._entries) > self.max_entries)
+                                     or (self.max_bytes and self.nbytes > self.max_bytes)):
+                self.nbytes -= self._entries.popitem(last=False)[1][1]
+
+
+station_cache = _LRUCache(max_entries=STATION_CACHE_ENTRIES)
+waveform_cache = _LRUCache(max_bytes=WAVEFORM_CACHE_BYTES)
+
 
 def get_nearby_stations(latitude: float, longitude: float, starttime: UTCDateTime, max_radius: float = 1.0, max_stations: int = 5):
     """
     Finds the nearest seismic stations to a given coordinate within a max radius (in degrees).
-    Returns a list of station codes sorted by distance (ascending).
+    Returns a list of (station code, epicentral distance in degrees) sorted by distance (ascending).
+    Successful lookups are cached.
     """
+    key = (round(latitude, 4), round(longitude, 4), str(UTCDateTime(starttime)), max_radius, max_stations)
+    cached = station_cache.get(key)
+    if cached is not None:
+        return cached
     try:
         # INGV service might require a time window for station availability
         t0 = UTCDateTime(starttime)
-        inventory = client.get_stations(network="IV", level="station",
+        inventory = get_client().get_stations(network="IV", level="station",
                                         latitude=latitude, longitude=longitude,
                                         maxradius=max_radius,
                                         starttime=t0, endtime=t0 + 100) # Check availability around event time
         
         if not inventory or len(inventory) == 0:
+            station_cache.put(key, [])
             return []
 
         station_list = []
@@ -31,28 +83,67 @@ def get_nearby_stations(latitude: float, longitude: float, starttime: UTCDateTim
         # Sort by distance
         station_list.sort(key=lambda x: x[1])
         
-        # Return top N stations codes
-        return [s[0] for s in station_list[:max_stations]]
+        # Return top N stations
+        station_list = station_list[:max_stations]
+        station_cache.put(key, station_list)
+        return station_list
 
     except Exception as e:
         print(f"Error finding stations: {e}")
         return []
 
 def fetch_waveform(station: str, starttime: UTCDateTime, duration: int = 120, network = "IV", location = "*", channel = "HHZ"):
+    """
+    Returns a waveform window as a CompactTrace (None if no data).
+    The local SDS archive is checked first; otherwise the window is downloaded.
+    Multiple segments are merged; gaps between them are kept as NaN samples.
+    Downloads (and "no data" answers) are kept in waveform_cache.
+    """
     try:
         # Added padding to starttime to ensure we catch the event
         t0 = UTCDateTime(starttime)
-        st = client.get_waveforms(network, station, location, channel, t0, t0 + duration)
-        if not st:
-            return None
-            
-        tr = st[0]
-        df = pd.DataFrame({
-            "times": pd.to_datetime(tr.times("timestamp"), unit="s"),
-            "velocity": tr.data
-        })
-        return df
+        archived = read_trace(network, station, location, channel, t0, t0 + duration)
+        if archived is not None:
+            return archived
+
+        key = (network, station, location, channel, round(t0.timestamp, 2), duration)
+        if key in waveform_cache:
+            return waveform_cache.get(key)
+        try:
+            st = get_client().get_waveforms(network, station, location, channel, t0, t0 + duration)
+        except FDSNNoDataException:
+            st = None
+        trace = CompactTrace.from_stream(st) if st else None
+        waveform_cache.put(key, trace, trace.data.nbytes if trace is not None else 0)
+        return trace
     
     except Exception as e:
         print(f"Error fetching waveform: {e}")
         return None
+
+
+def find_event_waveform(event, stations: list, should_stop=lambda: False) -> tuple:
+    """
+    Waveform of an event at the first of the stations (nearest first) with data, requesting
+    only [P - pre, S + post] (fixed 120 s from origin without a travel-time table).
+
+    Args:
+        event: Catalog row (time, depth).
+        stations: (station code, distance in degrees) as returned by get_nearby_stations.
+        should_stop: Checked before each station; the search gives up when it returns True.
+
+    Returns:
+        (station code, CompactTrace), or (None, None) if no station has data.
+    """
+    for station, distance in stations:
+        if should_stop():
+            break
+        window = phase_window(distance, event['depth'])
+        if window is not None:
+            offset, duration = window
+            trace = fetch_waveform(station, UTCDateTime(event['time']) + offset, duration=duration)
+        else:
+            trace = fetch_waveform(station, event['time'])
+        if trace is not None:
+            return station, trace
+    return None, None
@@ -0,0 +1,173 @@
+import json
+import os
+
+import numpy as np
+
+from utils.preprocessing import PreprocessConfig, preprocess_batch
+from utils.spectral import SpectralEngine
+from utils.trace import CompactTrace
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+INDEX_PATH = os.path.join(DATA_DIR, 'fingerprints.npz')
+
+# Conditioning before feature extraction: band powers are relative, so raw counts are fine
+FINGERPRINT_CONFIG = PreprocessConfig(detrend="demean", taper=0.05, freqmin=0.5, freqmax=45.0, response=None)
+
+# Octave bands (Hz) whose share of the total power is part of the fingerprint
+BANDS = [(0.5, 1.0), (1.0, 2.0), (2.0, 4.0), (4.0, 8.0), (8.0, 16.0), (16.0, 32.0)]
+
+FEATURE_NAMES = (
+    [f"band_{lo:g}_{hi:g}" for lo, hi in BANDS]
+    + ["centroid", "dominant", "bandwidth", "duration", "rise_time", "peak_rms"]
+)
+
+# Labels of the known signals (UI names)
+LABELS = {"terremoto": "Terremoto", "antropico": "Antropico", "rumore": "Rumore"}
+
+
+def fingerprint(trace: CompactTrace, nperseg: int = 256) -> np.ndarray:
+    """
+    Compact spectral fingerprint of a waveform window (see FEATURE_NAMES), all log-scaled:
+    relative band powers, spectral centroid, dominant frequency and bandwidth (Welch PSD),
+    5-95% energy duration, rise time to the envelope peak and peak-to-RMS ratio.
+
+    Returns:
+        float32 vector, or None if the window is too short or flat.
+    """
+    if trace is None or trace.npts < nperseg:
+        return None
+    sr = trace.sampling_rate
+    x = preprocess_batch(trace.data[None, :], sr, FINGERPRINT_CONFIG)[0]
+
+    engine = SpectralEngine(sr, nperseg=nperseg, fmax=None)
+    engine.update(x, trace.starttime)
+    freqs, psd = engine.welch()
+    if psd.size == 0:
+        return None
+    keep = freqs >= BANDS[0][0]
+    freqs, psd = freqs[keep], psd[keep]
+    total = psd.sum()
+    if total <= 0:
+        return None
+
+    bands = [psd[(freqs >= lo) & (freqs < hi)].sum() / total for lo, hi in BANDS]
+    centroid = (freqs * psd).sum() / total
+    dominant = freqs[np.argmax(psd)]
+    bandwidth = np.sqrt(((freqs - centroid) ** 2 * psd).sum() / total)
+
+    # Duration measures from the cumulative energy (Husid curve) and the envelope
+    x = np.nan_to_num(x)
+    energy = np.cumsum(x * x)
+    energy /= energy[-1]
+    t5, t95 = np.searchsorted(energy, 0.05), np.searchsorted(energy, 0.95)
+    smooth = max(1, int(sr))
+    envelope = np.convolve(np.abs(x), np.ones(smooth) / smooth, mode="same")
+    peak = int(np.argmax(envelope))
+    rms = np.sqrt(np.mean(x * x))
+
+    features = np.log10(np.maximum(bands, 1e-6)).tolist() + [
+        np.log10(centroid),
+        np.log10(max(dominant, BANDS[0][0])),
+        np.log10(max(bandwidth, 1e-3)),
+        np.log10(1.0 + (t95 - t5) / sr),
+        np.log10(1.0 + max(peak - t5, 0) / sr),
+        np.log10(np.abs(x).max() / rms),
+    ]
+    return np.asarray(features, dtype=np.float32)
+
+
+class FingerprintIndex:
+    """
+    In-memory k-nearest-neighbour index of labelled fingerprints.
+
+    Vectors live in one preallocated float32 matrix that grows by doubling, so batch
+    insertion is a single copy. Distances are Euclidean on features standardized with
+    the statistics of the indexed set; a query is one vectorized pass (sub-millisecond
+    for thousands of signals).
+    """
+
+    def __init__(self, dim: int = len(FEATURE_NAMES), capacity: int = 1024):
+        self.dim = dim
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._size = 0
+        self.labels: list[str] = []
+        self.metadata: list[dict] = []
+        self._scale = None  # (mean, std, standardized vectors), recomputed after insertions
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add_batch(self, vectors: np.ndarray, labels: list[str], metadata: list[dict] = None):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        n = len(vectors)
+        if n == 0:
+            return
+        if self._size + n > len(self._vectors):
+            capacity = max(2 * len(self._vectors), self._size + n)
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+        self._vectors[self._size:self._size + n] = vectors
+        self._size += n
+        self.labels.extend(labels)
+        self.metadata.extend(metadata if metadata is not None else [{} for _ in range(n)])
+        self._scale = None
+
+    def add(self, vector: np.ndarray, label: str, metadata: dict = None):
+        self.add_batch(vector[None, :], [label], [metadata or {}])
+
+    def _standardization(self):
+        if self._scale is None:
+            vectors = self._vectors[:self._size]
+            mean, std = vectors.mean(axis=0), vectors.std(axis=0)
+            std = np.where(std > 0, std, 1.0)
+            self._scale = (mean, std, (vectors - mean) / std)
+        return self._scale
+
+    def query(self, vector: np.ndarray, k: int = 5, exclude_id: str = None) -> list[dict]:
+        """
+        The k most similar indexed signals, closest first.
+        Entries whose metadata 'id' equals exclude_id (the query itself) are skipped.
+
+        Returns:
+            List of dicts with 'label', 'distance' and the entry's metadata.
+        """
+        if self._size == 0 or vector is None:
+            return []
+        mean, std, vectors = self._standardization()
+        distances = np.sqrt((((vectors - (vector - mean) / std)) ** 2).sum(axis=1))
+        if exclude_id is not None:
+            own = [i for i, meta in enumerate(self.metadata) if meta.get("id") == exclude_id]
+            distances[own] = np.inf
+        k = min(k, self._size)
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [{"label": self.labels[i], "distance": float(distances[i]), **self.metadata[i]}
+                for i in nearest if np.isfinite(distances[i])]
+
+    def save(self, path: str = INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, vectors=self._vectors[:self._size],
+                            labels=np.array(self.labels, dtype=str),
+                            metadata=np.array(json.dumps(self.metadata)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = INDEX_PATH) -> "FingerprintIndex":
+        """Loads a saved index (an empty one if the file does not exist)."""
+        index = cls()
+        if os.path.exists(path):
+            with np.load(path) as npz:
+                index.add_batch(npz["vectors"], npz["labels"].tolist(), json.loads(str(npz["metadata"])))
+        return index
+
+
+def majority_label(neighbours: list[dict]) -> str:
+    """Distance-weighted vote among the neighbours (None if there are none)."""
+    if not neighbours:
+        return None
+    votes = {}
+    for n in neighbours:
+        votes[n["label"]] = votes.get(n["label"], 0.0) + 1.0 / (n["distance"] + 1e-6)
+    return max(votes, key=votes.get)
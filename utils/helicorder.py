@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils.pyramid import envelope
+
+# Buckets drawn per helicorder row / per long-window chart: the render cost does not
+# depend on how much time is shown
+ROW_POINTS = 600
+WINDOW_POINTS = 1500
+
+
+def plot_helicorder(seed_id: str, day_start: float, row_minutes: int = 30, color: str = "black",
+                    height: int = 800):
+    """
+    24-hour drum plot of a channel from the min/max pyramid: one row per row_minutes,
+    each bucket drawn as a vertical min-max segment.
+
+    Returns:
+        The figure, or None if nothing is archived for that day.
+    """
+    row_seconds = row_minutes * 60
+    n_rows = 86400 // row_seconds
+    env = envelope(seed_id, day_start, day_start + 86400, n_rows * ROW_POINTS)
+    if env is None:
+        return None
+
+    per_row = len(env["times"]) // n_rows
+    lo = env["min"][:n_rows * per_row].reshape(n_rows, per_row)
+    hi = env["max"][:n_rows * per_row].reshape(n_rows, per_row)
+
+    # Robust common scale: a large event saturates its own row instead of flattening the others
+    amplitude = np.nanpercentile(np.abs(np.concatenate([lo.ravel(), hi.ravel()])), 99.5)
+    scale = 0.5 / amplitude if amplitude > 0 else 1.0
+    offsets = -np.arange(n_rows)[:, None]
+    lo = np.clip(lo * scale, -1.0, 1.0) + offsets
+    hi = np.clip(hi * scale, -1.0, 1.0) + offsets
+
+    # Vertical segments separated by NaN: a single trace for the whole day
+    minutes = np.broadcast_to(np.arange(per_row) * row_minutes / per_row, lo.shape)
+    x = np.stack([minutes, minutes, np.full(lo.shape, np.nan)], axis=-1).ravel()
+    y = np.stack([lo, hi, np.full(lo.shape, np.nan)], axis=-1).ravel()
+
+    fig = go.Figure(go.Scattergl(x=x, y=y, mode="lines", line=dict(color=color, width=1), hoverinfo="skip"))
+    labels = pd.to_datetime(day_start + np.arange(n_rows) * row_seconds, unit="s").strftime("%H:%M")
+    fig.update_layout(
+        height=height,
+        margin=dict(l=0, r=0, t=10, b=0),
+        showlegend=False,
+        xaxis=dict(title="Minuti", range=[0, row_minutes]),
+        yaxis=dict(tickvals=offsets.ravel(), ticktext=list(labels), range=[-n_rows, 1]),
+    )
+    return fig
+
+
+def plot_long_window(seed_id: str, starttime: float, endtime: float, color: str = "black",
+                     height: int = 300):
+    """
+    Min/max band and RMS of a long window (hours to days) from the pyramid.
+
+    Returns:
+        The figure, or None if nothing is archived in the window.
+    """
+    env = envelope(seed_id, starttime, endtime, WINDOW_POINTS)
+    if env is None:
+        return None
+    times = pd.to_datetime(env["times"], unit="s")
+    fig = go.Figure([
+        go.Scatter(x=times, y=env["max"], mode="lines", line=dict(color=color, width=0.5), name="Max"),
+        go.Scatter(x=times, y=env["min"], mode="lines", line=dict(color=color, width=0.5), fill="tonexty",
+                   name="Min"),
+        go.Scatter(x=times, y=env["rms"], mode="lines", line=dict(color="black", width=1), name="RMS"),
+    ])
+    fig.update_layout(height=height, margin=dict(l=0, r=0, t=10, b=0), xaxis_title="Time",
+                      yaxis_title="Counts", hovermode="x unified")
+    return fig
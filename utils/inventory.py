@@ -0,0 +1,47 @@
+import os
+from functools import lru_cache
+
+from obspy import UTCDateTime, read_inventory
+
+from utils.fdsn import get_client
+
+# Station metadata (with instrument responses) is downloaded once and kept here
+INVENTORY_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'inventory')
+
+
+@lru_cache(maxsize=64)
+def load_inventory(network: str, station: str):
+    """
+    Returns the StationXML inventory (level=response) of a station.
+    The inventory is read from the local cache if available, otherwise it is fetched
+    from the FDSN service once and saved to INVENTORY_DIR.
+    """
+    path = os.path.join(INVENTORY_DIR, f"{network}.{station}.xml")
+    if os.path.exists(path):
+        return read_inventory(path)
+
+    try:
+        inventory = get_client().get_stations(network=network, station=station, level="response")
+    except Exception as e:
+        print(f"Error fetching inventory for {network}.{station}: {e}")
+        return None
+
+    os.makedirs(INVENTORY_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    inventory.write(tmp_path, format="STATIONXML")
+    os.replace(tmp_path, path)
+    return inventory
+
+
+def get_response(seed_id: str, time: float):
+    """
+    Returns the ObsPy Response of a channel at the given epoch time (None if unavailable).
+    """
+    network, station, _, _ = seed_id.split(".")
+    inventory = load_inventory(network, station)
+    if inventory is None:
+        return None
+    try:
+        return inventory.get_response(seed_id, UTCDateTime(time))
+    except Exception:
+        return None
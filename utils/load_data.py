@@ -2,16 +2,55 @@ import os
 import pandas as pd
 import streamlit as st
 
+from utils import shared_catalog
+from utils.trace import CompactTrace
+
 # Load Data
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
 catalog_path = os.path.join(DATA_DIR, 'catalog.csv')
 
-@st.cache_data
-def load_data():
+def read_catalog_chunks(chunk_rows: int = shared_catalog.PARTITION_ROWS):
+    for df in pd.read_csv(catalog_path, chunksize=chunk_rows):
+        df['time'] = pd.to_datetime(df['time'])
+        yield df
+
+def publish_catalog():
+    """
+    Publishes catalog.csv as the current shared version (run after a catalog sync).
+    The file is read one partition at a time, so catalogs larger than memory work too.
+    """
+    stamp = shared_catalog.source_stamp(catalog_path)
+    return shared_catalog.publish(read_catalog_chunks(), stamp)
+
+@st.cache_resource(max_entries=shared_catalog.KEEP_VERSIONS, show_spinner=False)
+def attach_catalog(version: str):
+    return shared_catalog.attach(version)
+
+def current_catalog():
+    """
+    Pointer to the current shared version ({"version", "source", "rows"}), publishing
+    catalog.csv first if it is newer. None without a catalog.
+    """
     if not os.path.exists(catalog_path):
         return None
-    df = pd.read_csv(catalog_path)
-    df['time'] = pd.to_datetime(df['time'])
-    return df
+    pointer = shared_catalog.current()
+    if pointer is None or pointer["source"] != shared_catalog.source_stamp(catalog_path):
+        pointer = publish_catalog()
+    return pointer
+
+def load_data():
+    """
+    The catalog, shared read-only by every worker process (see utils.shared_catalog):
+    not to be modified in place. Each call follows the current version, so a sync
+    reaches running sessions at the next rerun.
+    """
+    pointer = current_catalog()
+    return None if pointer is None else attach_catalog(pointer["version"])
 
-df = load_data()
\ No newline at end of file
+def load_comparison_data():
+    # Traces are stored as .npy + JSON header and memory-mapped: loading is cheap, and
+    # st.cache_data would pickle an in-memory copy of the samples (the derived spectra
+    # are cached instead)
+    quake = CompactTrace.load(os.path.join(DATA_DIR, 'waveform_max_event_flegrei'))
+    napoli = CompactTrace.load(os.path.join(DATA_DIR, 'waveform_napoli_scudetto'))
+    return quake, napoli
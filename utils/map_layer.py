@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Cells holding at most this many events are drawn as individual markers
+POINT_DENSITY_THRESHOLD = 5
+# Above this zoom level every event is drawn individually
+MAX_CLUSTER_ZOOM = 11
+# Approximate on-screen size of a cluster cell (pixels, on 256px map tiles)
+CELL_PIXELS = 48
+
+CLUSTER_CURVE = 0
+EVENT_CURVE = 1
+
+
+def cell_size_degrees(zoom: float) -> float:
+    """
+    Size (in degrees) of a clustering cell at the given map zoom level.
+    """
+    return 360.0 / (2 ** zoom) * CELL_PIXELS / 256.0
+
+
+def build_map_layers(df: pd.DataFrame, zoom: float, threshold: int = POINT_DENSITY_THRESHOLD):
+    """
+    Bins events into a zoom-dependent grid.
+
+    Args:
+        df: Filtered catalog (its index labels identify the catalog rows).
+        zoom: Current map zoom level.
+        threshold: Cells with at most this many events are expanded into individual points.
+
+    Returns:
+        Tuple (clusters, points):
+        - clusters: DataFrame with 'latitude', 'longitude', 'count', 'max_magnitude' per dense cell.
+        - points: the subset of df drawn as individual events.
+    """
+    empty_clusters = pd.DataFrame(columns=["latitude", "longitude", "count", "max_magnitude"])
+    if df.empty or zoom >= MAX_CLUSTER_ZOOM:
+        return empty_clusters, df
+
+    cell = cell_size_degrees(zoom)
+    lat = df["latitude"].to_numpy()
+    lon = df["longitude"].to_numpy()
+    mag = df["magnitude"].to_numpy()
+    ix = np.floor(lon / cell).astype(np.int64)
+    iy = np.floor(lat / cell).astype(np.int64)
+
+    # One integer id per occupied cell
+    _, inverse, counts = np.unique(np.stack([ix, iy]), axis=1, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    n_cells = len(counts)
+
+    dense_cell = counts > threshold
+    is_point = ~dense_cell[inverse]
+
+    sum_lat = np.bincount(inverse, weights=lat, minlength=n_cells)
+    sum_lon = np.bincount(inverse, weights=lon, minlength=n_cells)
+    max_mag = np.full(n_cells, -np.inf)
+    np.maximum.at(max_mag, inverse, mag)
+
+    clusters = pd.DataFrame({
+        "latitude": sum_lat / counts,
+        "longitude": sum_lon / counts,
+        "count": counts,
+        "max_magnitude": max_mag,
+    })[dense_cell].reset_index(drop=True)
+
+    return clusters, df[is_point]
+
+
+def build_map_figure(df: pd.DataFrame, zoom: float, center: dict, height: int = 800) -> go.Figure:
+    """
+    Builds the event map: dense areas as clusters (count / max magnitude), sparse areas as events.
+
+    Event markers carry the catalog index label in customdata[0], so a selected point
+    can always be resolved back to its catalog row with df.loc.
+    """
+    # The whole filtered set is clustered: the browser can pan anywhere without a rerun
+    clusters, points = build_map_layers(df, zoom)
+    colorscale = px.colors.sequential.Burgyl
+    mag_range = (df["magnitude"].min(), df["magnitude"].max()) if not df.empty else (0, 1)
+
+    fig = go.Figure()
+
+    # Trace 0: clusters
+    fig.add_trace(go.Scattermap(
+        lat=clusters["latitude"],
+        lon=clusters["longitude"],
+        mode="markers+text",
+        marker=dict(
+            size=np.clip(10 + 6 * np.log10(clusters["count"].astype(float).clip(lower=1)), 10, 40),
+            color=clusters["max_magnitude"],
+            colorscale=colorscale,
+            cmin=mag_range[0],
+            cmax=mag_range[1],
+            opacity=0.8,
+        ),
+        text=clusters["count"].astype(str),
+        textfont=dict(color="black", size=11),
+        customdata=np.stack([clusters["count"], clusters["max_magnitude"]], axis=-1) if not clusters.empty else None,
+        hovertemplate="<b>%{customdata[0]} eventi</b><br>Magnitudo max: %{customdata[1]:.1f}<extra>Cluster</extra>",
+        name="Cluster",
+        showlegend=False,
+    ))
+
+    # Trace 1: individual events
+    # Vectorized date formatting (no per-row strftime)
+    names = np.datetime_as_string(points["time"].to_numpy(dtype="datetime64[s]"), unit="s")
+    if names.size:
+        names = np.char.add("Evento ", np.char.replace(names, "T", " "))
+    fig.add_trace(go.Scattermap(
+        lat=points["latitude"],
+        lon=points["longitude"],
+        mode="markers",
+        marker=dict(
+            size=4 + 11 * (points["magnitude"] - mag_range[0]) / max(mag_range[1] - mag_range[0], 1e-9),
+            color=points["magnitude"],
+            colorscale=colorscale,
+            cmin=mag_range[0],
+            cmax=mag_range[1],
+            opacity=0.7,
+            colorbar=dict(title="Magnitudo"),
+        ),
+        customdata=np.stack([points.index.to_numpy(), points["magnitude"], points["depth"]], axis=-1) if not points.empty else None,
+        text=names,
+        hovertemplate=(
+            "<b>%{text}</b><br>Magnitudo: %{customdata[1]}<br>Profondità (km): %{customdata[2]}"
+            "<br>Latitudine: %{lat}<br>Longitudine: %{lon}<extra></extra>"
+        ),
+        name="Eventi",
+        showlegend=False,
+    ))
+
+    fig.update_layout(
+        map=dict(style="open-street-map", zoom=zoom, center=center),
+        height=height,
+        margin=dict(l=0, r=0, t=0, b=0),
+    )
+    # do not blur unselected markers, keep default opacity
+    fig.update_traces(unselected=dict(marker=dict(opacity=0.7)))
+    return fig
+
+
+def resolve_selection(point) -> tuple:
+    """
+    Interprets a selected map point.
+
+    Returns:
+        ("event", catalog index label) for an individual event,
+        ("cluster", (lat, lon)) for a cluster, or (None, None).
+    """
+    get = (lambda k: point.get(k)) if isinstance(point, dict) else (lambda k: getattr(point, k, None))
+    curve = get("curve_number")
+    customdata = get("customdata")
+    if curve == EVENT_CURVE and customdata is not None:
+        return "event", int(customdata[0])
+    if curve == CLUSTER_CURVE:
+        return "cluster", (get("lat"), get("lon"))
+    return None, None
@@ -0,0 +1,294 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+from scipy import fft, signal
+
+from utils.preprocessing import PreprocessConfig, preprocess_batch
+from utils.trace import CompactTrace
+
+# Band and conditioning applied to templates and continuous data alike
+# (counts are fine: normalized correlation does not depend on the gain)
+MATCH_CONFIG = PreprocessConfig(detrend="demean", taper=0.0, freqmin=2.0, freqmax=15.0, response=None)
+
+DEFAULT_TEMPLATE_LENGTH = 10.0  # seconds
+PRE_ONSET = 1.0                 # seconds kept before the onset
+MAD_THRESHOLD = 8.0             # detection threshold, in MADs of the stacked correlation
+CHUNK_SECONDS = 3600            # continuous data scanned per worker task
+MIN_VALID_FRACTION = 0.9        # windows with more gaps than this are not correlated
+
+
+@dataclass
+class Template:
+    """
+    Waveforms of one event at several stations, ready for correlation.
+    Each station's samples are zero-mean with unit norm; offsets are the start of each
+    station's window relative to the earliest one (the moveout across the network).
+    """
+    name: str
+    sampling_rate: float
+    data: dict = field(default_factory=dict)     # seed id -> samples
+    offsets: dict = field(default_factory=dict)  # seed id -> seconds
+    starttime: float = None                      # epoch of the earliest window
+
+    @property
+    def npts(self) -> int:
+        return len(next(iter(self.data.values())))
+
+
+@dataclass
+class Detection:
+    template: str
+    time: float         # epoch of the template's earliest window in the continuous data
+    cc: float           # correlation averaged over the stations
+    threshold: float
+    n_stations: int
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = x - x.mean()
+    norm = np.linalg.norm(x)
+    return x / norm if norm > 0 else x
+
+
+def make_template(name: str, traces: list[CompactTrace], onsets: list[float],
+                  length: float = DEFAULT_TEMPLATE_LENGTH, config: PreprocessConfig = MATCH_CONFIG) -> Template:
+    """
+    Cuts [onset - PRE_ONSET, onset - PRE_ONSET + length] from each (raw) trace.
+    Traces are filtered whole before cutting, so the template has no filter edge effects.
+    Stations with gaps in the window or a different sampling rate are left out.
+    """
+    valid = [(tr, t) for tr, t in zip(traces, onsets) if tr is not None and not tr.empty and t is not None]
+    if not valid:
+        return None
+    sampling_rate = valid[0][0].sampling_rate
+    npts = int(round(length * sampling_rate))
+    template = Template(name, sampling_rate)
+    for tr, onset in valid:
+        if tr.sampling_rate != sampling_rate:
+            continue
+        filtered = preprocess_batch(tr.data[None, :], sampling_rate, config)[0]
+        i0 = tr.index_at(onset - PRE_ONSET)
+        window = filtered[i0:i0 + npts] if i0 >= 0 else np.array([])
+        if len(window) < npts or np.isnan(window).any():
+            continue
+        template.data[tr.seed_id] = _normalize(window)
+        template.offsets[tr.seed_id] = tr.starttime + i0 / sampling_rate
+    if not template.data:
+        return None
+    first = min(template.offsets.values())
+    template.starttime = first
+    template.offsets = {sid: t - first for sid, t in template.offsets.items()}
+    return template
+
+
+def detect_onset(trace: CompactTrace, sta: float = 0.5, lta: float = 10.0, on: float = 3.0) -> float:
+    """
+    First STA/LTA trigger of a trace (epoch seconds), or the time of the peak amplitude
+    if nothing triggers. Used to cut templates from single event recordings.
+    """
+    from obspy.signal.trigger import recursive_sta_lta
+
+    filtered = np.nan_to_num(preprocess_batch(trace.data[None, :], trace.sampling_rate, MATCH_CONFIG)[0])
+    ratio = recursive_sta_lta(filtered, int(sta * trace.sampling_rate), int(lta * trace.sampling_rate))
+    # The LTA needs a full window before the ratio is meaningful
+    ratio[:int(lta * trace.sampling_rate)] = 0.0
+    triggered = np.flatnonzero(ratio > on)
+    i = triggered[0] if triggered.size else int(np.argmax(np.abs(filtered)))
+    return trace.starttime + i * trace.delta
+
+
+def template_from_event_trace(name: str, trace: CompactTrace, length: float = DEFAULT_TEMPLATE_LENGTH) -> Template:
+    """Single-station template from an event recording (e.g. the Campi Flegrei max event)."""
+    if trace is None or trace.empty:
+        return None
+    return make_template(name, [trace], [detect_onset(trace)], length)
+
+
+def templates_from_catalog(events, station_coords: dict, length: float = DEFAULT_TEMPLATE_LENGTH,
+                           margin: float = 30.0) -> list[Template]:
+    """
+    Templates of catalog events from the local SDS archive, cut at the predicted P arrival.
+
+    Args:
+        events: Catalog rows (time, latitude, longitude, depth).
+        station_coords: seed id (NET.STA.LOC.CHA, wildcards allowed) -> (latitude, longitude).
+        margin: Extra seconds read on each side, so filtering does not affect the template.
+    """
+    from obspy import UTCDateTime
+    from obspy.geodetics import locations2degrees
+
+    from utils.sds_archive import read_trace
+    from utils.travel_times import arrival_times
+
+    templates = []
+    for _, event in events.iterrows():
+        origin = UTCDateTime(event['time'])
+        traces, onsets = [], []
+        for seed_id, (lat, lon) in station_coords.items():
+            times = arrival_times(locations2degrees(event['latitude'], event['longitude'], lat, lon), event['depth'])
+            if times is None or np.isnan(times[0]):
+                continue
+            onset = origin + float(times[0])
+            trace = read_trace(*seed_id.split("."), onset - PRE_ONSET - margin, onset + length + margin)
+            if trace is not None:
+                traces.append(trace)
+                onsets.append(onset.timestamp)
+        template = make_template(f"{origin.isoformat()[:19]} M{event['magnitude']}", traces, onsets, length)
+        if template is not None:
+            templates.append(template)
+    return templates
+
+
+def normalized_xcorr(data: np.ndarray, templates: np.ndarray) -> np.ndarray:
+    """
+    Normalized cross-correlation of one continuous channel with several templates at once.
+
+    Args:
+        data: 1-D continuous samples (NaN marks gaps).
+        templates: 2-D array (n_templates, m), rows zero-mean with unit norm.
+
+    Returns:
+        2-D array (n_templates, len(data) - m + 1) of Pearson coefficients in [-1, 1];
+        0 where the data window is flat or mostly gaps.
+    """
+    n, m = len(data), templates.shape[1]
+    if n < m:
+        return np.zeros((len(templates), 0))
+    valid = ~np.isnan(data)
+    x = np.where(valid, data, 0.0).astype(np.float64)
+
+    # One forward FFT of the data serves every template
+    nfft = fft.next_fast_len(n + m - 1, real=True)
+    spectrum = fft.rfft(x, nfft)
+    kernels = fft.rfft(templates[:, ::-1], nfft, axis=1)
+    cc = fft.irfft(kernels * spectrum, nfft, axis=1)[:, m - 1:n]
+
+    # Energy of each demeaned data window from running sums (templates are zero-mean,
+    # so removing the window mean does not change the numerator)
+    c1 = np.concatenate([[0.0], np.cumsum(x)])
+    c2 = np.concatenate([[0.0], np.cumsum(x * x)])
+    cv = np.concatenate([[0], np.cumsum(valid)])
+    s1, s2, nv = c1[m:] - c1[:-m], c2[m:] - c2[:-m], cv[m:] - cv[:-m]
+    energy = s2 - s1 * s1 / m
+    usable = (nv >= MIN_VALID_FRACTION * m) & (energy > 1e-10 * max(float(energy.max()), 1e-300))
+    norm = np.where(usable, np.sqrt(np.maximum(energy, 0.0)), np.inf)
+    return np.clip(cc / norm, -1.0, 1.0)
+
+
+def stack_correlations(correlations: dict, offsets: dict, sampling_rate: float, length: int):
+    """
+    Aligns each station's correlation on the template moveout and averages them.
+
+    Returns:
+        (stacked correlation of the given length, number of stations used)
+    """
+    stacked = np.zeros(length)
+    used = 0
+    for seed_id, cc in correlations.items():
+        shift = int(round(offsets[seed_id] * sampling_rate))
+        segment = cc[shift:shift + length]
+        if len(segment) < length:
+            continue
+        stacked += segment
+        used += 1
+    return (stacked / used if used else stacked), used
+
+
+def mad_threshold(values: np.ndarray, multiplier: float = MAD_THRESHOLD) -> float:
+    median = np.median(values)
+    return float(median + multiplier * np.median(np.abs(values - median)))
+
+
+def scan_chunk(data: dict, starttime: float, core_npts: int, sampling_rate: float, templates: list[Template],
+               multiplier: float = MAD_THRESHOLD) -> list[Detection]:
+    """
+    Scans one chunk of continuous data (seed id -> samples on a common grid starting at starttime).
+    Only detections starting in the first core_npts samples are kept: the rest of the chunk is the
+    overlap with the next one. Runs in a worker process.
+    """
+    detections = []
+    if not templates:
+        return detections
+    m = templates[0].npts
+    # Templates correlated per station in one batch
+    correlations = {}
+    for seed_id, samples in data.items():
+        rows = [t.data[seed_id] for t in templates if seed_id in t.data]
+        if rows:
+            correlations[seed_id] = iter(normalized_xcorr(samples, np.vstack(rows)))
+
+    for template in templates:
+        per_station = {sid: next(correlations[sid]) for sid in template.data if sid in correlations}
+        if not per_station:
+            continue
+        span = int(round(max(template.offsets.values()) * sampling_rate))
+        length = min(core_npts, len(next(iter(data.values()))) - span - m + 1)
+        if length <= 0:
+            continue
+        stacked, used = stack_correlations(per_station, template.offsets, sampling_rate, length)
+        if not used:
+            continue
+        threshold = mad_threshold(stacked, multiplier)
+        peaks, props = signal.find_peaks(stacked, height=threshold, distance=m)
+        for i, height in zip(peaks, props["peak_heights"]):
+            detections.append(Detection(template.name, starttime + i / sampling_rate, float(height), threshold, used))
+    return detections
+
+
+def _align(traces: list[CompactTrace], config: PreprocessConfig):
+    """Filters the continuous traces and places them on a common time grid (NaN where missing)."""
+    sampling_rate = traces[0].sampling_rate
+    start = min(tr.starttime for tr in traces)
+    end = max(tr.endtime for tr in traces)
+    n = int(round((end - start) * sampling_rate)) + 1
+    aligned = {}
+    for tr in traces:
+        row = np.full(n, np.nan, dtype=np.float32)
+        i0 = int(round((tr.starttime - start) * sampling_rate))
+        row[i0:i0 + tr.npts] = preprocess_batch(tr.data[None, :], sampling_rate, config)[0]
+        aligned[tr.seed_id] = row
+    return start, aligned
+
+
+def scan(continuous: list[CompactTrace], templates: list[Template], multiplier: float = MAD_THRESHOLD,
+         chunk_seconds: float = CHUNK_SECONDS, workers: int = None,
+         config: PreprocessConfig = MATCH_CONFIG) -> list[Detection]:
+    """
+    Matched-filter scan of continuous multi-station data.
+
+    The data is split into chunks (overlapping by the longest template span) that are
+    scanned in a process pool; the threshold is MAD-based per chunk and template.
+
+    Returns:
+        Detections sorted by time.
+    """
+    templates = [t for t in templates if t is not None]
+    continuous = [tr for tr in continuous if tr is not None and not tr.empty]
+    if not templates or not continuous:
+        return []
+    sampling_rate = templates[0].sampling_rate
+    m = templates[0].npts
+    templates = [t for t in templates if t.sampling_rate == sampling_rate and t.npts == m]
+    continuous = [tr for tr in continuous if tr.sampling_rate == sampling_rate]
+    if not continuous:
+        return []
+
+    start, aligned = _align(continuous, config)
+    total = len(next(iter(aligned.values())))
+    core = int(chunk_seconds * sampling_rate)
+    overlap = m + int(round(max(max(t.offsets.values()) for t in templates) * sampling_rate))
+
+    tasks = []
+    for i0 in range(0, total, core):
+        chunk = {sid: row[i0:i0 + core + overlap] for sid, row in aligned.items()}
+        tasks.append((chunk, start + i0 / sampling_rate, core, sampling_rate, templates, multiplier))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        results = [scan_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(scan_chunk, *zip(*tasks)))
+    return sorted((d for chunk in results for d in chunk), key=lambda d: d.time)
@@ -0,0 +1,193 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import streamlit as st
+from obspy import UTCDateTime
+
+from utils.sds_archive import ARCHIVE_DIR, day_file_path, read_stream
+
+# Accumulated PPSD histograms, one ObsPy npz per channel and day:
+# <root>/<NET>.<STA>.<LOC>.<CHA>/<YYYY-MM-DD>.npz
+PPSD_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'ppsd')
+
+PPSD_LENGTH = 3600.0  # seconds per PSD segment (hourly, the usual PPSD setting)
+PPSD_OVERLAP = 0.5
+
+# UTC hours of the day/night noise windows (Italy is UTC+1/+2: night is roughly 1-7 local time)
+DAY_HOURS = (8, 18)
+NIGHT_HOURS = (0, 5)
+PERCENTILES = (10, 50, 90)
+
+
+def day_path(seed_id: str, day: UTCDateTime, root: str = PPSD_DIR) -> str:
+    return os.path.join(root, seed_id, f"{day.strftime('%Y-%m-%d')}.npz")
+
+
+def needs_update(seed_id: str, day: UTCDateTime, archive_dir: str = ARCHIVE_DIR, root: str = PPSD_DIR) -> bool:
+    """
+    True if the archive holds data for that day newer than the stored histogram.
+    Days whose histogram is up to date are never opened again.
+    """
+    network, station, location, channel = seed_id.split(".")
+    source = day_file_path(network, station, location, channel, day, archive_dir)
+    if not os.path.exists(source):
+        return False
+    target = day_path(seed_id, day, root)
+    return not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source)
+
+
+def accumulate_day(seed_id: str, day: UTCDateTime, archive_dir: str = ARCHIVE_DIR, root: str = PPSD_DIR) -> int:
+    """
+    Adds the archived data of one day to its stored histogram. Segments already in the
+    histogram are skipped by ObsPy, so a partially filled day only computes the new hours.
+    Runs in a worker process.
+
+    Returns:
+        Number of PSD segments in the day after the update.
+    """
+    from obspy.signal import PPSD
+
+    from utils.inventory import load_inventory
+
+    network, station, location, channel = seed_id.split(".")
+    # Segments never cross midnight, so every segment belongs to exactly one day file
+    stream = read_stream(network, station, location, channel, day, day + 86400, archive_dir)
+    stream = stream.select(id=seed_id)
+    if not stream:
+        return 0
+
+    path = day_path(seed_id, day, root)
+    metadata = load_inventory(network, station)
+    if os.path.exists(path):
+        ppsd = PPSD.load_npz(path, metadata=metadata)
+    else:
+        if metadata is None:
+            return 0
+        ppsd = PPSD(stream[0].stats, metadata, ppsd_length=PPSD_LENGTH, overlap=PPSD_OVERLAP)
+    if ppsd.times_processed:
+        # Resume after the last stored segment: old hours are not even read again
+        step = PPSD_LENGTH * (1.0 - PPSD_OVERLAP)
+        stream = stream.slice(max(ppsd.times_processed) + step)
+        if not stream:
+            return len(ppsd.times_processed)
+    ppsd.add(stream)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    ppsd.save_npz(tmp_path)
+    # ObsPy writes an uncompressed npz
+    with np.load(tmp_path) as npz:
+        arrays = {key: npz[key] for key in npz.files}
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return len(ppsd.times_processed)
+
+
+def update(seed_ids: list[str], days: list[UTCDateTime], workers: int = None,
+           archive_dir: str = ARCHIVE_DIR, root: str = PPSD_DIR) -> dict:
+    """
+    Brings the stored histograms up to date with the archive, one (channel, day) task
+    per worker process. Returns {(seed_id, 'YYYY-MM-DD'): segments} for the updated days.
+    """
+    tasks = [(seed_id, day) for seed_id in seed_ids for day in days
+             if needs_update(seed_id, day, archive_dir, root)]
+    if not tasks:
+        return {}
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        counts = [accumulate_day(seed_id, day, archive_dir, root) for seed_id, day in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(executor.map(accumulate_day, *zip(*tasks),
+                                       [archive_dir] * len(tasks), [root] * len(tasks)))
+    return {(seed_id, day.strftime('%Y-%m-%d')): n for (seed_id, day), n in zip(tasks, counts)}
+
+
+def stored_days(seed_id: str, start: UTCDateTime, end: UTCDateTime, root: str = PPSD_DIR) -> list[str]:
+    days = []
+    day = UTCDateTime(start.year, start.month, start.day)
+    while day < end:
+        path = day_path(seed_id, day, root)
+        if os.path.exists(path):
+            days.append(path)
+        day += 86400
+    return days
+
+
+def stored_channels(network: str, station: str, channel: str, root: str = PPSD_DIR) -> list[str]:
+    """Seed ids (any location code) with stored histograms."""
+    pattern = os.path.join(root, f"{network}.{station}.*.{channel}")
+    return sorted(os.path.basename(p) for p in glob.glob(pattern))
+
+
+def _hours_filter(hours: tuple) -> list:
+    # PPSD time_of_weekday: (weekday, start hour, end hour), -1 = every day
+    return [(-1, float(hours[0]), float(hours[1]))]
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def noise_percentiles(seed_id: str, start: float, end: float, version: tuple = (),
+                      root: str = PPSD_DIR) -> dict:
+    """
+    Day and night noise percentiles of a channel over [start, end] from the stored histograms.
+    version should change when the files change (e.g. their modification times).
+
+    Returns:
+        {"periods": array, "day": {p: dB array}, "night": {p: dB array}, "segments": n},
+        or None if no histogram is stored for the interval.
+    """
+    from obspy.signal import PPSD
+
+    paths = stored_days(seed_id, UTCDateTime(start), UTCDateTime(end), root)
+    if not paths:
+        return None
+    ppsd = PPSD.load_npz(paths[0])
+    for path in paths[1:]:
+        ppsd.add_npz(path)
+
+    result = {"periods": None, "segments": len(ppsd.times_processed)}
+    for name, hours in (("day", DAY_HOURS), ("night", NIGHT_HOURS)):
+        ppsd.calculate_histogram(starttime=UTCDateTime(start), endtime=UTCDateTime(end),
+                                 time_of_weekday=_hours_filter(hours))
+        if ppsd.current_histogram_count == 0:
+            result[name] = {}
+            continue
+        curves = {}
+        for p in PERCENTILES:
+            periods, values = ppsd.get_percentile(percentile=p)
+            curves[p] = np.asarray(values)
+            result["periods"] = np.asarray(periods)
+        result[name] = curves
+    return result if result["periods"] is not None else None
+
+
+def files_version(seed_id: str, start: float, end: float, root: str = PPSD_DIR) -> tuple:
+    """Modification times of the stored days (cache key for noise_percentiles)."""
+    return tuple(os.path.getmtime(p) for p in stored_days(seed_id, UTCDateTime(start), UTCDateTime(end), root))
+
+
+def plot_noise_levels(percentiles: dict, color: str = "black", height: int = 400):
+    """
+    Day (solid) and night (dashed) noise percentiles against Peterson's low/high noise models.
+    """
+    import plotly.graph_objects as go
+    from obspy.signal.spectral_estimation import get_nhnm, get_nlnm
+
+    fig = go.Figure()
+    for model, name in ((get_nlnm(), "NLNM"), (get_nhnm(), "NHNM")):
+        fig.add_trace(go.Scatter(x=model[0], y=model[1], mode="lines", name=name,
+                                 line=dict(color="gray", width=1)))
+    periods = percentiles["periods"]
+    for key, dash, label in (("day", "solid", "Giorno"), ("night", "dash", "Notte")):
+        for p, values in percentiles[key].items():
+            fig.add_trace(go.Scatter(x=periods, y=values, mode="lines", name=f"{label} p{p}",
+                                     line=dict(color=color, dash=dash, width=2 if p == 50 else 1)))
+    fig.update_layout(
+        height=height,
+        margin=dict(l=0, r=0, t=10, b=0),
+        xaxis=dict(title="Periodo (s)", type="log", range=[np.log10(periods.min()), np.log10(periods.max())]),
+        yaxis_title="PSD (dB rel. 1 (m/s²)²/Hz)",
+    )
+    return fig
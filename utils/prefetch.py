@@ -0,0 +1,114 @@
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils import fdsn
+from utils.fetch_waveform import find_event_waveform, get_nearby_stations
+
+# Events warmed after each map render, and how hard the prefetcher may work
+PREFETCH_TOP_N = 5
+PREFETCH_WORKERS = 2                     # concurrent prefetches, for the whole process
+PREFETCH_BYTE_BUDGET = 32 * 1024 * 1024  # waveform bytes downloaded per map state
+PREFETCH_MAX_SESSIONS = 64               # sessions with a batch still tracked (least recent evicted)
+
+# Recency bonus in magnitude units: +1 for an event of today, halving every year
+RECENCY_HALF_LIFE_DAYS = 365.0
+
+
+def rank_events(df: pd.DataFrame, n: int = PREFETCH_TOP_N, now: pd.Timestamp = None) -> pd.DataFrame:
+    """The n most prominent events: magnitude plus a bonus for recent events."""
+    if df.empty:
+        return df
+    now = now if now is not None else df['time'].max()
+    age_days = (now - df['time']).dt.total_seconds().to_numpy() / 86400.0
+    score = df['magnitude'].to_numpy() + 0.5 ** (np.maximum(age_days, 0.0) / RECENCY_HALF_LIFE_DAYS)
+    top = np.argsort(-score, kind='stable')[:n]
+    return df.iloc[top]
+
+
+class Prefetcher:
+    """
+    Warms the station lookup and waveform caches of utils.fetch_waveform for the events a
+    user is likely to click, on a small shared thread pool at BACKGROUND priority.
+
+    Each session has one current batch: scheduling a new one (a newer filter or map
+    state) cancels the queued work of the previous batch and makes its running tasks
+    stop at the next step (between stations too). A batch stops downloading once its
+    byte budget is spent. Finished batches are dropped, and at most max_sessions are
+    tracked: the least recently scheduled one is cancelled beyond that.
+    """
+
+    def __init__(self, workers: int = PREFETCH_WORKERS, byte_budget: int = PREFETCH_BYTE_BUDGET,
+                 max_sessions: int = PREFETCH_MAX_SESSIONS):
+        self.byte_budget = byte_budget
+        self.max_sessions = max_sessions
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._batches: OrderedDict[str, dict] = OrderedDict()  # session -> {"generation", "futures", "bytes"}
+        self._generations = itertools.count()  # unique across sessions, so dropped batches are never reused
+        self._lock = threading.Lock()
+        self.completed = 0
+
+    def schedule(self, session: str, events: pd.DataFrame):
+        """Replaces the session's batch with the given events (already ranked)."""
+        with self._lock:
+            previous = self._batches.pop(session, None)
+            if previous:
+                for future in previous["futures"]:
+                    future.cancel()
+            self._evict()
+            generation = next(self._generations)
+            batch = {"generation": generation, "futures": [], "bytes": 0}
+            self._batches[session] = batch
+            for _, event in events.iterrows():
+                batch["futures"].append(self._executor.submit(self._warm, session, generation, event))
+
+    def _evict(self):
+        """Drops finished batches, then the least recent ones beyond max_sessions (lock held)."""
+        for session in [s for s, b in self._batches.items() if all(f.done() for f in b["futures"])]:
+            del self._batches[session]
+        while len(self._batches) >= self.max_sessions:
+            _, batch = self._batches.popitem(last=False)
+            for future in batch["futures"]:
+                future.cancel()
+
+    def _current(self, session: str, generation: int) -> bool:
+        with self._lock:
+            batch = self._batches.get(session)
+            return batch is not None and batch["generation"] == generation and batch["bytes"] < self.byte_budget
+
+    def _warm(self, session: str, generation: int, event):
+        with fdsn.priority(fdsn.BACKGROUND):
+            if not self._current(session, generation):
+                return
+            stations = get_nearby_stations(event['latitude'], event['longitude'], event['time'])
+            if not stations or not self._current(session, generation):
+                return
+            _, trace = find_event_waveform(event, stations,
+                                           should_stop=lambda: not self._current(session, generation))
+        with self._lock:
+            batch = self._batches.get(session)
+            if batch is not None and batch["generation"] == generation and trace is not None:
+                batch["bytes"] += trace.data.nbytes
+            self.completed += 1
+
+    def pending(self, session: str) -> int:
+        with self._lock:
+            batch = self._batches.get(session)
+            return sum(not f.done() for f in batch["futures"]) if batch else 0
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> Prefetcher:
+    """The process-wide prefetcher, created on first use."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
@@ -0,0 +1,282 @@
+import os
+from dataclasses import dataclass, replace
+from functools import lru_cache
+
+import numpy as np
+import streamlit as st
+from scipy import signal
+
+from utils.disk_cache import disk_cache
+from utils.inventory import INVENTORY_DIR, get_response
+from utils.trace import CompactTrace
+
+OUTPUT_UNITS = {"DISP": "m", "VEL": "m/s", "ACC": "m/s²"}
+
+
+@dataclass(frozen=True)
+class PreprocessConfig:
+    """
+    Parameters of the preprocessing pipeline:
+    detrend -> taper -> instrument response removal -> bandpass.
+    """
+    detrend: str = "linear"       # "linear", "demean" or None
+    taper: float = 0.05           # fraction of the window tapered at each end
+    freqmin: float = 0.5          # Hz (None = no highpass)
+    freqmax: float = 20.0         # Hz (None = no lowpass)
+    corners: int = 4
+    zero_phase: bool = True       # forward-backward filtering (offline windows only)
+    response: str = "full"        # "full" deconvolution, "sensitivity" scaling or None (raw counts)
+    water_level: float = 60.0     # dB, stabilizes the spectral division
+    output: str = "VEL"           # "DISP", "VEL" or "ACC"
+
+    @property
+    def units(self) -> str:
+        return OUTPUT_UNITS[self.output] if self.response else "counts"
+
+
+DEFAULT_CONFIG = PreprocessConfig()
+
+
+@lru_cache(maxsize=32)
+def bandpass_sos(freqmin: float, freqmax: float, sampling_rate: float, corners: int = 4):
+    """
+    Butterworth filter coefficients (second-order sections), computed once per configuration.
+    Falls back to highpass/lowpass when one of the corners is missing or not in (0, Nyquist);
+    swapped corners are reordered. Returns None if no filtering is requested or the band
+    is empty (equal corners).
+    """
+    nyquist = 0.5 * sampling_rate
+    if freqmin is not None and freqmax is not None:
+        if freqmin == freqmax:
+            return None
+        freqmin, freqmax = min(freqmin, freqmax), max(freqmin, freqmax)
+    if freqmin is not None and not 0 < freqmin < nyquist:
+        freqmin = None
+    if freqmax is not None and not 0 < freqmax < nyquist:
+        freqmax = None
+    if freqmin is not None and freqmax is not None:
+        return signal.butter(corners, [freqmin, freqmax], btype="bandpass", fs=sampling_rate, output="sos")
+    if freqmin is not None:
+        return signal.butter(corners, freqmin, btype="highpass", fs=sampling_rate, output="sos")
+    if freqmax is not None:
+        return signal.butter(corners, freqmax, btype="lowpass", fs=sampling_rate, output="sos")
+    return None
+
+
+@lru_cache(maxsize=32)
+def cosine_taper(npts: int, fraction: float) -> np.ndarray:
+    """Read-only Tukey (cosine) taper applied to both ends of a window."""
+    taper = signal.windows.tukey(npts, alpha=min(1.0, 2 * fraction))
+    taper.setflags(write=False)
+    return taper
+
+
+def detrend_batch(data: np.ndarray, kind: str = "linear") -> np.ndarray:
+    """
+    Removes the mean (kind='demean') or the least-squares line (kind='linear') from
+    every row of a 2-D array. NaN samples (gaps) are ignored in the fit.
+    """
+    valid = ~np.isnan(data)
+    n_valid = np.maximum(valid.sum(axis=1, keepdims=True), 1)
+    mean = np.nansum(data, axis=1, keepdims=True) / n_valid
+    if kind == "demean":
+        return data - mean
+
+    x = np.broadcast_to(np.arange(data.shape[1], dtype=np.float64), data.shape)
+    x_mean = np.where(valid, x, 0.0).sum(axis=1, keepdims=True) / n_valid
+    xc = np.where(valid, x - x_mean, 0.0)
+    slope = np.nansum(xc * (data - mean), axis=1, keepdims=True) / np.maximum((xc ** 2).sum(axis=1, keepdims=True), 1e-12)
+    return data - mean - slope * (x - x_mean)
+
+
+@lru_cache(maxsize=64)
+def response_spectrum(seed_id: str, day: float, nfft: int, sampling_rate: float, output: str, water_level: float):
+    """
+    Inverse instrument response on the rfft grid (water-level stabilized), or None.
+    Cached per channel/day/length, so repeated windows never re-evaluate the response.
+    """
+    response = get_response(seed_id, day)
+    if response is None:
+        return None
+    spectrum, _ = response.get_evalresp_response(1.0 / sampling_rate, nfft, output=output)
+    amplitude = np.abs(spectrum)
+    floor = amplitude.max() * 10.0 ** (-water_level / 20.0)
+    # Raise the spectrum to the water level, keeping its phase
+    scale = np.where((amplitude > 0) & (amplitude < floor), floor / np.maximum(amplitude, 1e-30), 1.0)
+    spectrum = spectrum * scale
+    inverse = np.zeros_like(spectrum)
+    nonzero = spectrum != 0
+    inverse[nonzero] = 1.0 / spectrum[nonzero]
+    inverse.setflags(write=False)
+    return inverse
+
+
+def sensitivity(seed_id: str, time: float):
+    """Overall sensitivity (counts per physical unit) of a channel, or None."""
+    response = get_response(seed_id, time)
+    if response is None or response.instrument_sensitivity is None:
+        return None
+    return response.instrument_sensitivity.value
+
+
+def preprocess_batch(data: np.ndarray, sampling_rate: float, config: PreprocessConfig = DEFAULT_CONFIG,
+                     corrections: list = None) -> np.ndarray:
+    """
+    Runs the pipeline on a multi-station batch at once.
+
+    Args:
+        data: 2-D array (n_traces, n_samples), same sampling rate; NaN marks gaps.
+        sampling_rate: Sampling rate in Hz.
+        config: Pipeline parameters.
+        corrections: One entry per row: the inverse response spectrum (config.response='full'),
+            the sensitivity (config.response='sensitivity'), or None to leave that row in counts.
+
+    Returns:
+        The processed 2-D float64 array (gaps are NaN again).
+    """
+    data = np.array(data, dtype=np.float64, ndmin=2)
+    gaps = np.isnan(data)
+
+    if config.detrend:
+        data = detrend_batch(data, config.detrend)
+    data[gaps] = 0.0
+    if config.taper:
+        data *= cosine_taper(data.shape[1], config.taper)
+
+    if config.response and corrections is not None:
+        if config.response == "full":
+            nfft = data.shape[1] * 2
+            spectra = np.fft.rfft(data, n=nfft, axis=1)
+            for i, inverse in enumerate(corrections):
+                if inverse is not None:
+                    spectra[i] *= inverse
+            data = np.fft.irfft(spectra, n=nfft, axis=1)[:, :data.shape[1]]
+        else:
+            scale = np.array([1.0 / c if c else 1.0 for c in corrections])
+            data *= scale[:, None]
+
+    sos = bandpass_sos(config.freqmin, config.freqmax, sampling_rate, config.corners)
+    if sos is not None:
+        data = signal.sosfiltfilt(sos, data, axis=1) if config.zero_phase else signal.sosfilt(sos, data, axis=1)
+
+    data[gaps] = np.nan
+    return data
+
+
+def trace_correction(trace: CompactTrace, config: PreprocessConfig):
+    """Response correction of a trace for the given configuration (see preprocess_batch)."""
+    if not config.response:
+        return None
+    if config.response == "full":
+        day = float(np.floor(trace.starttime / 86400.0) * 86400.0)
+        return response_spectrum(trace.seed_id, day, trace.npts * 2, trace.sampling_rate, config.output, config.water_level)
+    return sensitivity(trace.seed_id, trace.starttime)
+
+
+def _inventory_files(trace: CompactTrace, config: PreprocessConfig = None) -> list:
+    """The station file the response correction is read from (a disk-cache dependency)."""
+    if trace is None:
+        return []
+    return [os.path.join(INVENTORY_DIR, f"{trace.network}.{trace.station}.xml")]
+
+
+@st.cache_data
+@disk_cache(depends_on=_inventory_files)
+def preprocess(trace: CompactTrace, config: PreprocessConfig = DEFAULT_CONFIG) -> CompactTrace:
+    """
+    Applies the preprocessing pipeline to a single trace.
+    If the station response is unavailable the trace is filtered but stays in counts.
+    """
+    if trace is None or trace.empty:
+        return trace
+    correction = trace_correction(trace, config)
+    data = preprocess_batch(trace.data[None, :], trace.sampling_rate, config, [correction])[0]
+    units = config.units if correction is not None else "counts"
+    return replace(trace, data=data.astype(np.float32), units=units)
+
+
+def preprocess_traces(traces: list[CompactTrace], config: PreprocessConfig = DEFAULT_CONFIG) -> list[CompactTrace]:
+    """
+    Preprocesses several traces in one vectorized batch per (sampling rate, length) group.
+    """
+    results = [None] * len(traces)
+    groups = {}
+    for i, tr in enumerate(traces):
+        if tr is not None and not tr.empty:
+            groups.setdefault((tr.sampling_rate, tr.npts), []).append(i)
+    for (sampling_rate, _), indices in groups.items():
+        corrections = [trace_correction(traces[i], config) for i in indices]
+        batch = preprocess_batch(np.vstack([traces[i].data for i in indices]), sampling_rate, config, corrections)
+        for row, i, correction in zip(batch, indices, corrections):
+            units = config.units if correction is not None else "counts"
+            results[i] = replace(traces[i], data=row.astype(np.float32), units=units)
+    return results
+
+
+class StreamingPreprocessor:
+    """
+    Incremental version of the pipeline for real-time ring buffers.
+
+    Only the samples appended since the last call are filtered (causal sosfilt with the
+    filter state carried over), and the response is removed by sensitivity scaling,
+    which is valid in the passband. Detrend/taper do not apply to an endless stream:
+    the highpass removes the offset, and the filter starts in steady state.
+    """
+
+    def __init__(self, config: PreprocessConfig = DEFAULT_CONFIG):
+        self.config = replace(config, zero_phase=False)
+        self._zi = None
+        self._sos = None
+        self._scale = 1.0
+        self._units = "counts"
+        self.output: CompactTrace = None
+
+    def _start(self, trace: CompactTrace):
+        self._sos = bandpass_sos(self.config.freqmin, self.config.freqmax, trace.sampling_rate, self.config.corners)
+        sens = sensitivity(trace.seed_id, trace.starttime) if self.config.response else None
+        self._scale = 1.0 / sens if sens else 1.0
+        self._units = self.config.units if sens else "counts"
+        self._zi = None
+        self.output = None
+
+    def process(self, buffer: CompactTrace) -> CompactTrace:
+        """
+        Processes the new part of the buffer and returns the processed buffer
+        (same time span as the input).
+        """
+        if buffer is None or buffer.empty:
+            return buffer
+        if self.output is None or buffer.starttime > self.output.endtime or buffer.endtime < self.output.endtime:
+            # First call or discontinuity (buffer was reset): restart the filter
+            self._start(buffer)
+            new = buffer
+        else:
+            new = buffer.slice(starttime=self.output.endtime + buffer.delta / 2)
+
+        if not new.empty:
+            x = np.asarray(new.data, dtype=np.float64) * self._scale
+            gaps = np.isnan(x)
+            if self._sos is not None:
+                if self._zi is None:
+                    first = x[~gaps][0] if (~gaps).any() else 0.0
+                    self._zi = signal.sosfilt_zi(self._sos) * first
+                x = np.where(gaps, 0.0, x)
+                x, self._zi = signal.sosfilt(self._sos, x, zi=self._zi)
+            x[gaps] = np.nan
+            chunk = replace(new, data=x.astype(np.float32), units=self._units)
+            self.output = chunk if self.output is None else self.output.merge(chunk)
+
+        self.output = self.output.slice(starttime=buffer.starttime)
+        return self.output
+
+
+def get_streaming_preprocessor(station: str, config: PreprocessConfig) -> StreamingPreprocessor:
+    """
+    Returns the streaming preprocessor of a real-time station, kept in session state.
+    It is rebuilt when the configuration changes.
+    """
+    processors = st.session_state.setdefault("preprocessors", {})
+    processor = processors.get(station)
+    if processor is None or processor.config != replace(config, zero_phase=False):
+        processors[station] = processor = StreamingPreprocessor(config)
+    return processor
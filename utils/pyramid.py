@@ -0,0 +1,213 @@
+import calendar
+import glob
+import os
+import time
+
+import numpy as np
+
+from utils.trace import CompactTrace
+
+# Decimation pyramid of the archived channels: per-bucket statistics at several resolutions,
+# one memory-mapped file per channel, day and level:
+# <root>/<YEAR>/<NET>.<STA>.<LOC>.<CHA>.<YEAR>.<JDAY>.L<seconds>.npy
+PYRAMID_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'pyramid')
+
+# Bucket lengths in seconds, finest first (each must be a multiple of the finest)
+LEVELS = (1, 10, 60)
+
+# Columns of a level file: min and max are NaN for empty buckets; sum, sum of squares
+# and count make the RMS exact when buckets are merged
+MIN, MAX, SUM, SUMSQ, COUNT = range(5)
+N_FIELDS = 5
+
+
+def level_path(seed_id: str, day: float, level: int, root: str = PYRAMID_DIR) -> str:
+    year, jday = _year_jday(day)
+    return os.path.join(root, str(year), f"{seed_id}.{year}.{jday:03d}.L{level}.npy")
+
+
+def _year_jday(day: float):
+    t = time.gmtime(day)
+    return t.tm_year, t.tm_yday
+
+
+def _empty_level(level: int) -> np.ndarray:
+    arr = np.zeros((86400 // level, N_FIELDS))
+    arr[:, [MIN, MAX]] = np.nan
+    return arr
+
+
+def _open_level(seed_id: str, day: float, level: int, root: str, create: bool = False):
+    path = level_path(seed_id, day, level, root)
+    if not os.path.exists(path):
+        if not create:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, _empty_level(level))
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r+" if create else "r")
+
+
+def _bucket_stats(values: np.ndarray, buckets: np.ndarray):
+    """Statistics of consecutive runs of equal (non-decreasing) bucket indices."""
+    valid = ~np.isnan(values)
+    values, buckets = values[valid].astype(np.float64), buckets[valid]
+    if values.size == 0:
+        return None
+    starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    return (buckets[starts],
+            np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts),
+            np.add.reduceat(values, starts),
+            np.add.reduceat(values ** 2, starts),
+            np.diff(np.append(starts, values.size)))
+
+
+def _aggregate(rows: np.ndarray, bins: np.ndarray, n_bins: int) -> np.ndarray:
+    """Merges level rows into n_bins output buckets (bins must be non-decreasing)."""
+    out = np.zeros((n_bins, N_FIELDS))
+    out[:, [MIN, MAX]] = np.nan
+    if rows.size == 0:
+        return out
+    starts = np.flatnonzero(np.concatenate([[True], bins[1:] != bins[:-1]]))
+    target = bins[starts]
+    out[target, MIN] = np.fmin.reduceat(rows[:, MIN], starts)
+    out[target, MAX] = np.fmax.reduceat(rows[:, MAX], starts)
+    out[target, SUM] = np.add.reduceat(rows[:, SUM], starts)
+    out[target, SUMSQ] = np.add.reduceat(rows[:, SUMSQ], starts)
+    out[target, COUNT] = np.add.reduceat(rows[:, COUNT], starts)
+    return out
+
+
+def update(trace: CompactTrace, root: str = PYRAMID_DIR):
+    """
+    Adds new samples to the pyramid. Only the touched buckets are updated in place, so the
+    cost is proportional to the new data. Samples must not have been added before
+    (the archiver only passes what it appends to the archive).
+    """
+    if trace is None or trace.empty:
+        return
+    finest = LEVELS[0]
+    t = 0
+    while t < trace.npts:
+        # One day file at a time
+        start = trace.starttime + t * trace.delta
+        day = np.floor(start / 86400.0) * 86400.0
+        n = min(trace.npts - t, int(np.ceil(round((day + 86400 - start) * trace.sampling_rate, 6))))
+        offsets = (start - day) + np.arange(n) * trace.delta
+        buckets = np.minimum((offsets // finest).astype(np.int64), 86400 // finest - 1)
+        stats = _bucket_stats(trace.data[t:t + n], buckets)
+        t += n
+        if stats is None:
+            continue
+
+        b, mn, mx, s, ss, cnt = stats
+        fine = _open_level(trace.seed_id, day, finest, root, create=True)
+        fine[b, MIN] = np.fmin(fine[b, MIN], mn)
+        fine[b, MAX] = np.fmax(fine[b, MAX], mx)
+        fine[b, SUM] += s
+        fine[b, SUMSQ] += ss
+        fine[b, COUNT] += cnt
+        fine.flush()
+
+        # Coarser levels: recompute the touched buckets from the finest level
+        for level in LEVELS[1:]:
+            ratio = level // finest
+            lo, hi = b[0] // ratio, b[-1] // ratio + 1
+            rows = np.asarray(fine[lo * ratio:hi * ratio])
+            coarse = _open_level(trace.seed_id, day, level, root, create=True)
+            coarse[lo:hi] = _aggregate(rows, np.arange(len(rows)) // ratio, hi - lo)
+            coarse.flush()
+
+
+def enforce_retention(retention_days: int, now: float = None, root: str = PYRAMID_DIR) -> int:
+    """Deletes level files of days older than retention_days. Returns the number of deleted files."""
+    if not os.path.isdir(root):
+        return 0
+    now = time.time() if now is None else now
+    cutoff = np.floor(now / 86400.0) * 86400.0 - retention_days * 86400
+    deleted = 0
+    for path in glob.glob(os.path.join(root, "*", "*.L*.npy")):
+        parts = os.path.basename(path).split(".")
+        try:
+            day = calendar.timegm(time.strptime(f"{parts[-4]} {parts[-3]}", "%Y %j"))
+        except (IndexError, ValueError):
+            continue
+        if day < cutoff:
+            os.remove(path)
+            deleted += 1
+    return deleted
+
+
+def choose_level(span: float, max_points: int) -> int:
+    """
+    Coarsest level that still has at least max_points buckets over the span
+    (the finest level for short spans).
+    """
+    for level in reversed(LEVELS):
+        if span / level >= max_points:
+            return level
+    return LEVELS[0]
+
+
+def _resolve_seed_id(seed_id: str, day: float, level: int, root: str):
+    """Expands wildcards in the seed id against the stored files of a day."""
+    if not any(c in seed_id for c in "*?"):
+        return seed_id
+    matches = sorted(glob.glob(level_path(seed_id, day, level, root)))
+    if not matches:
+        return None
+    return os.path.basename(matches[0]).rsplit(".", 4)[0]
+
+
+def envelope(seed_id: str, starttime: float, endtime: float, max_points: int = 1500,
+             root: str = PYRAMID_DIR, demean: bool = True):
+    """
+    Min/max/RMS envelope of [starttime, endtime] on max_points equal buckets.
+    The cost depends on max_points, not on the length of the window.
+
+    Returns:
+        Dict with 'times' (bucket start, epoch s), 'min', 'max', 'rms' arrays (NaN for empty
+        buckets) and the pyramid 'level' used, or None if nothing is stored for the window.
+    """
+    span = endtime - starttime
+    level = choose_level(span, max_points)
+    n_bins = int(min(max_points, np.ceil(span / level)))
+    width = span / n_bins
+
+    rows, row_times = [], []
+    day = np.floor(starttime / 86400.0) * 86400.0
+    while day < endtime:
+        sid = _resolve_seed_id(seed_id, day, level, root)
+        arr = _open_level(sid, day, level, root) if sid else None
+        if arr is not None:
+            lo = int(max(0, (starttime - day) // level))
+            hi = int(min(len(arr), np.ceil((endtime - day) / level)))
+            if hi > lo:
+                rows.append(np.asarray(arr[lo:hi]))
+                row_times.append(day + np.arange(lo, hi) * level)
+        day += 86400.0
+    if not rows:
+        return None
+
+    rows, row_times = np.concatenate(rows), np.concatenate(row_times)
+    bins = np.clip(((row_times - starttime) // width).astype(np.int64), 0, n_bins - 1)
+    out = _aggregate(rows, bins, n_bins)
+    count = out[:, COUNT]
+    if not count.any():
+        return None
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = out[:, SUM] / count
+        offset = np.nansum(out[:, SUM]) / count.sum() if demean else 0.0
+        # RMS about the window mean: E[(x - m)^2] = E[x^2] - 2 m E[x] + m^2
+        rms = np.sqrt(np.maximum(out[:, SUMSQ] / count - 2 * offset * mean + offset ** 2, 0.0))
+    rms[count == 0] = np.nan
+    return {
+        "times": starttime + np.arange(n_bins) * width,
+        "min": out[:, MIN] - offset,
+        "max": out[:, MAX] - offset,
+        "rms": rms,
+        "level": level,
+    }
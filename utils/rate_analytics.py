@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from scipy import special, stats
+
+from utils.seismology import ExactSum
+
+# Log-spaced bins of the inter-event time distribution, in hours (3.6 s to ~1 year);
+# times outside the range are counted in the first or last bin
+INTEREVENT_BINS = np.logspace(-3, 4, 57)
+
+# |beta| or |Z| above this is a significant rate change (~95% for a normal statistic)
+SIGNIFICANCE = 2.0
+
+
+class InterEventMoments:
+    """
+    Sufficient statistics of inter-event times (count, sums of t, t² and log t, log-binned
+    histogram), fed in any number of parts with exactly the same result.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.n_positive = 0  # events at the same instant have no log
+        self._sum = ExactSum()
+        self._sum_squares = ExactSum()
+        self._sum_logs = ExactSum()
+        self._histogram = np.zeros(len(INTEREVENT_BINS) - 1, dtype=np.int64)
+
+    def add(self, hours: np.ndarray):
+        hours = hours[~np.isnan(hours)]
+        positive = hours[hours > 0]
+        self.n += len(hours)
+        self.n_positive += len(positive)
+        self._sum.add(hours)
+        self._sum_squares.add(hours ** 2)
+        self._sum_logs.add(np.log(positive))
+        clipped = np.clip(positive, INTEREVENT_BINS[0], INTEREVENT_BINS[-1])
+        self._histogram += np.histogram(clipped, bins=INTEREVENT_BINS)[0]
+
+    def summary(self) -> dict:
+        """
+        Mean, coefficient of variation (1 for a Poisson process, above 1 for clustered
+        seismicity) and the maximum-likelihood gamma fit (shape k, scale theta, in hours).
+        """
+        result = {'n': self.n, 'mean_hours': np.nan, 'cv': np.nan,
+                  'gamma_shape': np.nan, 'gamma_scale': np.nan, 'valid': False}
+        if self.n < 2:
+            return result
+        mean = self._sum.value() / self.n
+        variance = (self._sum_squares.value() - self.n * mean ** 2) / (self.n - 1)
+        result['mean_hours'] = mean
+        result['cv'] = np.sqrt(max(variance, 0.0)) / mean if mean > 0 else np.nan
+
+        if self.n_positive >= 10:
+            positive_mean = self._sum.value() / self.n_positive  # zeros add nothing to the sum
+            shape = gamma_shape_mle(np.log(positive_mean) - self._sum_logs.value() / self.n_positive)
+            result.update(gamma_shape=shape, gamma_scale=positive_mean / shape, valid=bool(np.isfinite(shape)))
+        return result
+
+    def distribution(self) -> pd.DataFrame:
+        """Probability density per log bin, with the density of the gamma fit."""
+        low, high = INTEREVENT_BINS[:-1], INTEREVENT_BINS[1:]
+        total = self._histogram.sum()
+        density = self._histogram / (total * (high - low)) if total else np.zeros(len(low))
+        centre = np.sqrt(low * high)
+        fit = self.summary()
+        gamma = (stats.gamma.pdf(centre, fit['gamma_shape'], scale=fit['gamma_scale'])
+                 if fit['valid'] else np.full(len(centre), np.nan))
+        return pd.DataFrame({'hours': centre, 'count': self._histogram, 'density': density, 'gamma': gamma})
+
+
+def gamma_shape_mle(s: float, iterations: int = 5) -> float:
+    """
+    Shape of the maximum-likelihood gamma fit, from s = log(mean) - mean(log t): the
+    closed-form approximation refined by Newton steps on log(k) - digamma(k) = s.
+    """
+    if not s > 0:
+        return np.nan  # all times equal: no finite shape
+    k = (3 - s + np.sqrt((s - 3) ** 2 + 24 * s)) / (12 * s)
+    for _ in range(iterations):
+        k -= (np.log(k) - special.digamma(k) - s) / (1 / k - special.polygamma(1, k))
+    return float(k)
+
+
+def daily_counts(times: np.ndarray) -> pd.Series:
+    """Number of events per calendar day (days without events omitted), ascending."""
+    days, counts = np.unique(times[~np.isnat(times)].astype("datetime64[D]"), return_counts=True)
+    return pd.Series(counts, index=pd.DatetimeIndex(days.astype("datetime64[ns]")), dtype=np.int64)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def rate_changes(daily: pd.Series, window_days: int, bin_days: int = 1) -> pd.DataFrame:
+    """
+    Rolling rate-change statistics over the whole catalog. Events are counted in bins of
+    bin_days; for every trailing window of window_days the window is compared with the
+    rest of the catalog:
+
+    - beta (Matthews & Reasenberg, 1988): observed minus expected number of events in
+      the window, in standard deviations of the binomial expectation;
+    - Z (Habermann, 1983): difference of the mean rate per bin inside and outside the
+      window, over its standard error.
+
+    Both are positive for an increase. All windows come from cumulative counts, so the
+    whole timeline costs O(number of bins).
+    """
+    columns = ['time', 'count', 'beta', 'z']
+    if daily.empty:
+        return pd.DataFrame(columns=columns)
+
+    days = pd.date_range(daily.index.min(), daily.index.max(), freq='D')
+    per_day = daily.reindex(days, fill_value=0).to_numpy()
+    # Bins are aligned on the last day, so the newest bin is complete; the oldest
+    # days that do not fill a bin are left out
+    n_bins = len(per_day) // bin_days
+    first = len(per_day) - n_bins * bin_days
+    counts = per_day[first:].reshape(n_bins, bin_days).sum(axis=1).astype(np.float64)
+    k = max(1, window_days // bin_days)  # bins per window
+    if n_bins - k < 2:
+        return pd.DataFrame(columns=columns)  # no "outside" to compare with
+
+    cumulative = np.concatenate([[0.0], np.cumsum(counts)])
+    cumulative_squares = np.concatenate([[0.0], np.cumsum(counts ** 2)])
+    n_total, squares_total = cumulative[-1], cumulative_squares[-1]
+    inside = cumulative[k:] - cumulative[:-k]
+    inside_squares = cumulative_squares[k:] - cumulative_squares[:-k]
+    outside, outside_squares, m = n_total - inside, squares_total - inside_squares, n_bins - k
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = k / n_bins
+        beta = (inside - n_total * fraction) / np.sqrt(n_total * fraction * (1 - fraction))
+
+        mean_inside, mean_outside = inside / k, outside / m
+        var_inside = (inside_squares - k * mean_inside ** 2) / (k - 1) if k > 1 else np.zeros_like(inside)
+        var_outside = (outside_squares - m * mean_outside ** 2) / (m - 1)
+        z = (mean_inside - mean_outside) / np.sqrt(var_inside / k + var_outside / m)
+
+    # Each window is labelled with its last day (inclusive)
+    ends = days[first] + pd.to_timedelta(np.arange(k, n_bins + 1) * bin_days - 1, unit='D')
+    return pd.DataFrame({'time': ends, 'count': inside, 'beta': beta,
+                         'z': np.where(np.isfinite(z), z, np.nan)})
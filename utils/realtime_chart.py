@@ -0,0 +1,157 @@
+import base64
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+import streamlit.components.v1 as components
+
+from utils.downsample import plot_waveform
+from utils.spectral import SpectralEngine
+from utils.trace import CompactTrace
+
+_COMPONENT_DIR = os.path.join(os.path.dirname(__file__), "components", "realtime_chart")
+
+
+def install_plotly_js() -> bool:
+    """
+    Copies the plotly.js bundled with the plotly package next to the component, so the
+    chart is served by Streamlit itself (works offline and under a strict CSP).
+    On a read-only deploy run it at build time (scripts/warm_cache.py does).
+
+    Returns:
+        True if the component has its plotly.js.
+    """
+    import plotly
+
+    source = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+    target = os.path.join(_COMPONENT_DIR, "plotly.min.js")
+    try:
+        if not os.path.exists(target) or os.path.getsize(target) != os.path.getsize(source):
+            shutil.copyfile(source, target)
+    except OSError:
+        pass  # Read-only installation: the charts fall back to st.plotly_chart
+    return os.path.exists(target)
+
+
+_plotly_js_ready = install_plotly_js()
+_realtime_chart = components.declare_component("realtime_chart", path=_COMPONENT_DIR)
+
+
+def _encode(samples: np.ndarray) -> str:
+    """
+    Packs samples as little-endian float32 and encodes them for the JSON component channel.
+    """
+    return base64.b64encode(np.ascontiguousarray(samples, dtype="<f4").tobytes()).decode("ascii")
+
+
+def _stream_state(key: str, source) -> tuple:
+    """
+    Per-chart streaming state ({"seq", "sent_until", "nonce", "source"}) and whether the
+    whole window must be sent: first render, new source, or a resync requested by the client.
+    """
+    state = st.session_state.setdefault(f"{key}_stream", {"seq": 0, "sent_until": None, "nonce": None,
+                                                          "source": source})
+    if state.get("source") != source:
+        state["source"] = source
+        state["sent_until"] = None
+
+    # Value set by the client when it needs a full resync
+    client_value = st.session_state.get(key)
+    reset = state["sent_until"] is None
+    if isinstance(client_value, dict) and client_value.get("nonce") != state["nonce"]:
+        state["nonce"] = client_value.get("nonce")
+        reset = True
+    return state, reset
+
+
+def realtime_chart(trace: CompactTrace, key: str, color: str = None, window_seconds: int = 300, height: int = 300,
+                   xaxis_title: str = "Time", yaxis_title: str = None, source=None):
+    """
+    Renders an append-only streaming waveform chart.
+
+    The browser keeps the Plotly figure alive between reruns: each call only sends the
+    samples newer than the last ones delivered (as a compact float32 array), which the
+    client appends with Plotly.extendTraces, dropping samples older than window_seconds.
+    The full window is sent again only on the first render or when the client reports
+    that it missed an update.
+
+    Args:
+        trace: CompactTrace holding the station buffer (gaps are sent as NaN).
+        key: Unique key of the chart (one per station).
+        source: Identifies how the samples were produced (e.g. the PreprocessConfig): when it
+            changes, the whole window is sent again instead of appending to the old samples.
+    """
+    if not _plotly_js_ready:
+        plot_waveform(trace, key=key, color=color, height=height, xaxis_title=xaxis_title, yaxis_title=yaxis_title)
+        return
+
+    state, reset = _stream_state(key, source)
+    new = None
+    if trace is not None and not trace.empty:
+        new = trace if reset else trace.slice(starttime=state["sent_until"] + trace.delta / 2)
+        if reset or not new.empty:
+            state["seq"] += 1
+            state["sent_until"] = trace.endtime
+
+    has_new = new is not None and not new.empty
+    _realtime_chart(
+        seq=state["seq"],
+        reset=reset and has_new,
+        t0=new.starttime * 1000.0 if has_new else 0.0,
+        dt=new.delta * 1000.0 if has_new else 0.0,
+        data=_encode(new.data) if has_new else "",
+        max_points=int(window_seconds * (trace.sampling_rate if has_new else 100.0)),
+        color=color,
+        height=height,
+        xaxis_title=xaxis_title,
+        yaxis_title=yaxis_title or (trace.amplitude_label if trace is not None else ""),
+        kind="line",
+        key=key,
+        default=None,
+    )
+
+
+def realtime_spectrogram(engine: SpectralEngine, key: str, height: int = 300, xaxis_title: str = "Time",
+                         yaxis_title: str = "Freq (Hz)", source=None):
+    """
+    Renders an append-only streaming spectrogram of a real-time engine (see realtime_chart).
+
+    Each call only sends the columns (segments) newer than the last ones delivered, in dB
+    as a float32 [freq x time] block; the client appends them and keeps as many columns
+    as the engine holds. A new engine configuration or source sends the whole window again.
+    """
+    times, freqs, sxx = engine.spectrogram()
+    if not _plotly_js_ready:
+        if sxx.size:
+            fig = go.Figure(go.Heatmap(x=pd.to_datetime(times, unit="s"), y=freqs, z=10 * np.log10(sxx + 1e-20),
+                                       colorscale="Viridis", colorbar=dict(title="dB")))
+            fig.update_layout(height=height, margin=dict(l=0, r=0, t=30, b=0),
+                              xaxis_title=xaxis_title, yaxis_title=yaxis_title)
+            st.plotly_chart(fig, width='stretch', height=height)
+        return
+
+    state, reset = _stream_state(key, (source, engine.config()))
+    new = np.ones(len(times), dtype=bool) if reset else times > state["sent_until"] + 1e-6
+    if sxx.size and new.any():
+        state["seq"] += 1
+        state["sent_until"] = times[-1]
+    has_new = bool(sxx.size) and new.any()
+    columns = times[new] if has_new else times[:0]
+    _realtime_chart(
+        seq=state["seq"],
+        reset=reset and has_new,
+        t0=columns[0] * 1000.0 if has_new else 0.0,
+        dt=engine.hop / engine.sampling_rate * 1000.0,
+        data=_encode(10 * np.log10(sxx[:, new] + 1e-20)) if has_new else "",
+        freqs=freqs.tolist(),
+        max_points=len(times),
+        height=height,
+        xaxis_title=xaxis_title,
+        yaxis_title=yaxis_title,
+        kind="heatmap",
+        key=key,
+        default=None,
+    )
@@ -0,0 +1,163 @@
+import io
+import os
+
+import numpy as np
+from obspy import Stream, UTCDateTime, read
+from obspy.clients.filesystem.sds import Client as SDSClient
+
+from utils.trace import CompactTrace
+
+# Local waveform archive in SeisComP Data Structure layout:
+# <root>/<YEAR>/<NET>/<STA>/<CHA>.D/<NET>.<STA>.<LOC>.<CHA>.D.<YEAR>.<JDAY>
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'sds')
+
+# Fraction of the requested window that must be present to serve it from the archive
+MIN_COVERAGE = 0.95
+
+
+def day_file_path(network: str, station: str, location: str, channel: str, day: UTCDateTime,
+                  root: str = ARCHIVE_DIR) -> str:
+    year, jday = day.year, day.julday
+    return os.path.join(root, str(year), network, station, f"{channel}.D",
+                        f"{network}.{station}.{location}.{channel}.D.{year}.{jday:03d}")
+
+
+def _split_by_day(trace):
+    """Yields (day start, piece of the trace inside that day)."""
+    t = trace.stats.starttime
+    end = trace.stats.endtime
+    while t <= end:
+        day = UTCDateTime(t.year, t.month, t.day)
+        next_day = day + 86400
+        piece = trace.slice(t, next_day - trace.stats.delta / 2, nearest_sample=False)
+        if piece.stats.npts:
+            yield day, piece
+        t = next_day
+
+
+def write_stream(stream: Stream, root: str = ARCHIVE_DIR) -> int:
+    """
+    Appends a stream to the archive day files, merging with what is already stored.
+    Writes are atomic (temporary file + rename), so readers never see a partial file.
+
+    Returns:
+        Number of day files written.
+    """
+    pieces = {}
+    for trace in stream:
+        for day, piece in _split_by_day(trace):
+            stats = piece.stats
+            path = day_file_path(stats.network, stats.station, stats.location, stats.channel, day, root)
+            pieces.setdefault(path, Stream()).append(piece)
+
+    for path, new in pieces.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            new = read(path) + new
+        new.merge(method=1, fill_value=None)
+        # MiniSEED cannot store masked arrays: gaps are written as separate records
+        new = new.split()
+        for tr in new:
+            if tr.data.dtype.kind == "f":
+                tr.data = tr.data.astype(np.float32)
+        tmp_path = f"{path}.tmp"
+        new.write(tmp_path, format="MSEED")
+        os.replace(tmp_path, path)
+    return len(pieces)
+
+
+def append_stream(stream: Stream, root: str = ARCHIVE_DIR) -> int:
+    """
+    Appends new MiniSEED records to the day files without rewriting them (O(chunk) per call).
+    The caller must only append data that follows what is already stored (e.g. the archiver).
+
+    Returns:
+        Number of day files touched.
+    """
+    pieces = {}
+    for trace in stream:
+        for day, piece in _split_by_day(trace):
+            stats = piece.stats
+            path = day_file_path(stats.network, stats.station, stats.location, stats.channel, day, root)
+            pieces.setdefault(path, Stream()).append(piece)
+
+    for path, new in pieces.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        new = new.split()
+        for tr in new:
+            if tr.data.dtype.kind == "f":
+                tr.data = tr.data.astype(np.float32)
+        buffer = io.BytesIO()
+        new.write(buffer, format="MSEED", reclen=512)
+        # Records are encoded in memory first and appended with a single write
+        with open(path, "ab") as f:
+            f.write(buffer.getvalue())
+    return len(pieces)
+
+
+def parse_day_file(path: str):
+    """Returns the day (UTCDateTime) of an SDS day file from its name, or None."""
+    parts = os.path.basename(path).split(".")
+    if len(parts) != 7:
+        return None
+    try:
+        return UTCDateTime(year=int(parts[5]), julday=int(parts[6]))
+    except ValueError:
+        return None
+
+
+def enforce_retention(retention_days: int, now: UTCDateTime = None, root: str = ARCHIVE_DIR) -> int:
+    """
+    Deletes day files older than retention_days and prunes empty directories.
+
+    Returns:
+        Number of deleted files.
+    """
+    if not os.path.isdir(root):
+        return 0
+    now = now or UTCDateTime()
+    cutoff = UTCDateTime(now.year, now.month, now.day) - retention_days * 86400
+    deleted = 0
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        for name in filenames:
+            day = parse_day_file(name)
+            if day is not None and day < cutoff:
+                os.remove(os.path.join(dirpath, name))
+                deleted += 1
+        if dirpath != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return deleted
+
+
+def read_stream(network: str, station: str, location: str, channel: str,
+                starttime: UTCDateTime, endtime: UTCDateTime, root: str = ARCHIVE_DIR) -> Stream:
+    """Reads a window from the archive (wildcards allowed). Returns an empty Stream if nothing is stored."""
+    if not os.path.isdir(root):
+        return Stream()
+    return SDSClient(root).get_waveforms(network, station, location, channel, starttime, endtime)
+
+
+def read_trace(network: str, station: str, location: str, channel: str,
+               starttime: UTCDateTime, endtime: UTCDateTime, root: str = ARCHIVE_DIR,
+               min_coverage: float = MIN_COVERAGE) -> CompactTrace:
+    """
+    Serves a window from the archive as a CompactTrace.
+
+    Returns:
+        The trace, or None if the archive does not cover at least min_coverage of the window.
+    """
+    st = read_stream(network, station, location, channel, starttime, endtime, root)
+    trace = CompactTrace.from_stream(st)
+    if trace is None or trace.empty:
+        return None
+    expected = (endtime - starttime) * trace.sampling_rate
+    present = np.count_nonzero(~np.isnan(trace.data))
+    if expected <= 0 or present / expected < min_coverage:
+        return None
+    return trace
+
+
+def covers(network: str, station: str, location: str, channel: str,
+           starttime: UTCDateTime, endtime: UTCDateTime, root: str = ARCHIVE_DIR) -> bool:
+    """True if the archive already holds the window (used to skip/resume downloads)."""
+    return read_trace(network, station, location, channel, starttime, endtime, root) is not None
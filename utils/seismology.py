@@ -1,8 +1,15 @@
+from fractions import Fraction
+
 import numpy as np
 import pandas as pd
 import streamlit as st
 
+from utils.disk_cache import disk_cache
+from utils.spectral import SpectralEngine, psd_frame
+from utils.trace import CompactTrace
+
 @st.cache_data
+@disk_cache()
 def calculate_gutenberg_richter(df: pd.DataFrame, magnitude_col: str = 'magnitude', mc: float = None):
     """
     Calculates the a and b parameters of the Gutenberg-Richter law using the MLE method (Aki, 1965).
@@ -22,29 +29,53 @@ def calculate_gutenberg_richter(df: pd.DataFrame, magnitude_col: str = 'magnitud
     """
     if df.empty or magnitude_col not in df.columns:
         return {'a_value': np.nan, 'b_value': np.nan, 'mc': np.nan, 'n_total': 0, 'valid': False}
+    return gutenberg_richter_mle(df[magnitude_col], mc)
+
+
+def gutenberg_richter_mle(magnitudes: pd.Series, mc: float = None) -> dict:
+    """
+    Uncached core of calculate_gutenberg_richter on a series of magnitudes
+    (same return value). Usable outside a Streamlit script run.
+    """
+    if magnitudes.empty:
+        return {'a_value': np.nan, 'b_value': np.nan, 'mc': np.nan, 'n_total': 0, 'valid': False}
 
-    mags = df[magnitude_col].dropna()
+    mags = magnitudes.dropna()
     
     # Round to 1 decimal place for consistency with standard seismological practice
     mags_rounded = mags.round(1)
 
     # 1. Estimate Mc if not provided
     if mc is None:
-        if not mags_rounded.empty:
-            # The mode is a simple but effective estimate for Mc as a first approximation
-            # If there are multiple modes, we take the minimum (conservative approach to not lose data, 
-            # although technically one should take the maximum to be sure of completeness.)
-            mc = mags_rounded.mode().min()
-        else:
-            mc = 0.0
+        mc = estimate_mc(mags_rounded.value_counts())
             
     # 2. Filter dataset for M >= Mc
     # Use original data (not rounded) for filtering and mean, for greater precision,
     # but the cut is made with respect to Mc (which is rounded)
-    df_above_mc = df[df[magnitude_col] >= mc]
-    mags_above = df_above_mc[magnitude_col]
-    n_total = len(mags_above)
+    mags_above = magnitudes[magnitudes >= mc].to_numpy()
+    total = ExactSum()
+    total.add(mags_above)
+    return gutenberg_richter_from_stats(len(mags_above), total.value(), mc)
 
+
+def estimate_mc(rounded_counts: pd.Series) -> float:
+    """
+    Magnitude of completeness from the counts of the magnitudes rounded to 0.1
+    ({magnitude: count}, NaN excluded).
+    """
+    if rounded_counts.empty:
+        return 0.0
+    # The mode is a simple but effective estimate for Mc as a first approximation
+    # If there are multiple modes, we take the minimum (conservative approach to not lose data, 
+    # although technically one should take the maximum to be sure of completeness.)
+    return rounded_counts[rounded_counts == rounded_counts.max()].index.min()
+
+
+def gutenberg_richter_from_stats(n_total: int, magnitude_sum: float, mc: float) -> dict:
+    """
+    G-R parameters from the sufficient statistics of the events with M >= Mc: their
+    number and the sum of their magnitudes (same return value as gutenberg_richter_mle).
+    """
     # 3. Check minimum number of events
     if n_total < 10:
         return {
@@ -56,7 +87,7 @@ def calculate_gutenberg_richter(df: pd.DataFrame, magnitude_col: str = 'magnitud
         }
 
     # 4. MLE Calculation (Aki, 1965)
-    mean_mag = mags_above.mean()
+    mean_mag = magnitude_sum / n_total
     
     # Avoid division by zero
     if np.isclose(mean_mag, mc):
@@ -82,29 +113,55 @@ def calculate_gutenberg_richter(df: pd.DataFrame, magnitude_col: str = 'magnitud
         'valid': valid
     }
 
+
+class ExactSum:
+    """
+    Sum of float64 values without rounding error, fed in any number of parts: the result
+    does not depend on how the values are split, so chunked and in-memory computations
+    agree to the last bit. Vectorized: values are split into integer mantissas, summed
+    exactly per binary exponent.
+    """
+
+    HALF = 26  # mantissas are summed as two halves, so that int64 sums cannot overflow
+
+    def __init__(self):
+        self._total = Fraction(0)
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values) & (values != 0)]
+        if not len(values):
+            return
+        mantissas, exponents = np.frexp(values)
+        ints = (mantissas * 2.0 ** 53).astype(np.int64)  # exact
+        for exponent in np.unique(exponents):
+            selected = ints[exponents == exponent]
+            high = int((selected >> self.HALF).sum())
+            low = int((selected & ((1 << self.HALF) - 1)).sum())
+            self._total += Fraction((high << self.HALF) + low) * Fraction(2) ** (int(exponent) - 53)
+
+    def value(self) -> float:
+        """The exact sum, correctly rounded to float."""
+        return float(self._total)
+
 @st.cache_data
-def fft_analysis(df: pd.DataFrame, sampling_rate: float = 100.0) -> pd.DataFrame:
+@disk_cache()
+def fft_analysis(trace: CompactTrace, nperseg: int = 256, window: str = "hann", fmax: float = 20.0) -> pd.DataFrame:
     """
-    Computes the Fast Fourier Transform (FFT) of the velocity signal.
+    Computes the power spectral density of the signal (Welch's method).
     
     Args:
-        df: DataFrame containing 'velocity' column.
-        sampling_rate: Sampling rate in Hz (default 100.0).
+        trace: CompactTrace with the signal samples.
+        nperseg: Length of each FFT segment in samples.
+        window: Window function applied to each segment (see utils.spectral.WINDOW_FUNCTIONS).
+        fmax: Upper frequency limit in Hz (e.g., < 20Hz for seismic signals often sufficient for visualization).
         
     Returns:
         DataFrame with 'Freq (Hz)' and 'Power' columns.
     """
-    if df.empty or 'velocity' not in df.columns:
+    if trace is None or trace.empty:
         return pd.DataFrame()
-        
-    # Remove DC component (detrending constant)
-    velocity = df['velocity'] - df['velocity'].mean()
-    
-    fft_vals = np.fft.rfft(velocity)
-    fft_freq = np.fft.rfftfreq(len(velocity), d=1/sampling_rate)
-    
-    fft_df = pd.DataFrame({'Freq (Hz)': fft_freq, 'Power': np.abs(fft_vals)})
-    # Limit to relevant frequencies (e.g., < 20Hz for seismic signals often sufficient for visualization)
-    fft_df = fft_df[fft_df['Freq (Hz)'] < 20]
-    
-    return fft_df
+
+    engine = SpectralEngine(trace.sampling_rate, nperseg, window=window, fmax=fmax)
+    engine.update(trace.data, trace.starttime)
+    return psd_frame(engine)
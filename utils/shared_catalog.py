@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Published catalog versions (Arrow IPC files) and the pointer to the current one.
+# Every worker process memory-maps the current file read-only, so the catalog sits
+# once in the OS page cache however many workers there are.
+SHARED_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'shared')
+POINTER_PATH = os.path.join(SHARED_DIR, 'current.json')
+
+# Versions kept on disk: the current one plus the previous, still mapped by workers
+# that have not looked at the pointer since the swap
+KEEP_VERSIONS = 2
+
+# Rows per record batch: the unit out-of-core readers hold in memory
+PARTITION_ROWS = int(os.getenv("CATALOG_PARTITION_ROWS", 1_000_000))
+
+
+def source_stamp(path: str) -> str:
+    """Identifies a version of a source file (size and modification time)."""
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _version_path(version: str) -> str:
+    return os.path.join(SHARED_DIR, f"catalog-{version}.arrow")
+
+
+def _write_atomic(path: str, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class _PartitionWriter:
+    """
+    Writes frames as record batches of one Arrow file, laid out so that reading them
+    back is zero-copy: NaN stays NaN (no validity bitmaps), integer columns become
+    float64 (a later partition may have gaps) and text columns are dictionary-encoded,
+    the dictionary growing by deltas as new values appear.
+    """
+
+    def __init__(self, path: str):
+        self._sink = pa.OSFile(path, 'wb')
+        self._writer = None
+        self._categories: dict[str, list] = {}
+        self.rows = 0
+
+    def _array(self, name: str, values: pd.Series) -> pa.Array:
+        if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            categories = self._categories.setdefault(name, [])
+            known = set(categories)
+            categories.extend(v for v in pd.unique(values.dropna().astype(object)) if v not in known)
+            codes = pd.Categorical(values, categories=categories).codes.astype(np.int32)
+            return pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0), pa.array(categories, pa.string()))
+        if pd.api.types.is_integer_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype):
+            values = values.astype(np.float64)
+        return pa.array(values.to_numpy())
+
+    def write(self, df: pd.DataFrame):
+        batch = pa.record_batch({name: self._array(name, df[name]) for name in df.columns})
+        if self._writer is None:
+            options = ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self._writer = ipc.new_file(self._sink, batch.schema, options=options)
+        self._writer.write_batch(batch)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._sink.close()
+
+
+def current() -> dict:
+    """The current version ({"version", "source", "rows"}), or None if nothing is published."""
+    try:
+        with open(POINTER_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def publish(frames, source: str) -> dict:
+    """
+    Writes a new version from an iterable of frames (the partitions, e.g. CSV chunks)
+    and makes it current, holding one partition in memory at a time. The pointer is
+    swapped atomically after the file is complete, so readers see either the old or the
+    new catalog. Publishing the same source twice (e.g. two workers racing) writes the
+    same version.
+    """
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    version = hashlib.sha1(source.encode()).hexdigest()[:16]
+    rows = 0
+
+    def write_table(path):
+        nonlocal rows
+        writer = _PartitionWriter(path)
+        try:
+            for frame in frames:
+                writer.write(frame)
+        finally:
+            writer.close()
+        rows = writer.rows
+
+    def write_pointer(path):
+        with open(path, 'w') as f:
+            json.dump(pointer, f)
+
+    _write_atomic(_version_path(version), write_table)
+    pointer = {"version": version, "source": source, "rows": rows}
+    _write_atomic(POINTER_PATH, write_pointer)
+    _prune(version)
+    return pointer
+
+
+def _prune(current_version: str):
+    """Deletes all but the newest KEEP_VERSIONS files (open mappings stay valid on POSIX)."""
+    files = []
+    for name in os.listdir(SHARED_DIR):
+        if name.startswith('catalog-') and name.endswith('.arrow'):
+            path = os.path.join(SHARED_DIR, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue  # Pruned by another worker meanwhile
+    for _, path in sorted(files, reverse=True)[KEEP_VERSIONS:]:
+        if path != _version_path(current_version):
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Still mapped on a platform that forbids it: next time
+
+
+def _reader(version: str) -> ipc.RecordBatchFileReader:
+    return ipc.open_file(pa.memory_map(_version_path(version), 'r'))
+
+
+def iter_partitions(version: str, columns: list[str]):
+    """
+    Yields {column: numpy array} for each partition of a version, in file order. The
+    arrays are views of the memory-mapped file, so memory use is bounded by what the
+    caller derives from one partition.
+    """
+    reader = _reader(version)
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in columns}
+
+
+def attach(version: str) -> pd.DataFrame:
+    """
+    Read-only DataFrame over a published version. Numeric and time columns are views
+    of the memory-mapped file (no copy); text columns come back as categoricals, whose
+    codes are the only per-process copy.
+    """
+    table = _reader(version).read_all()
+    df = table.to_pandas(split_blocks=True, self_destruct=False)
+    # Carried over to filtered frames: identifies their catalog in cache keys
+    df.attrs["catalog_version"] = version
+    return df
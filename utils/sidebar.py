@@ -1,5 +1,20 @@
+import os
+
 import streamlit as st
 import pandas as pd
+from dotenv import load_dotenv
+
+from utils.catalog_aggregates import filter_mask, frame_partition, summarize
+
+load_dotenv()
+
+# Latitude/longitude range of the map filters: a named region, or "auto" for the
+# extent of the catalog
+REGIONS = {
+    "mediterraneo": ((27.0, 48.0), (-7.0, 37.5)),
+    "globale": ((-90.0, 90.0), (-180.0, 180.0)),
+}
+CATALOG_REGION = os.getenv("CATALOG_REGION", "mediterraneo")
 
 class Sidebar:
     years: tuple[int, int] = (0, 0)
@@ -9,22 +24,23 @@ class Sidebar:
     longitude: tuple[float, float] = (0.0, 0.0)
 
     @classmethod
-    def init_sidebar(cls, df: pd.DataFrame):
+    def init_sidebar(cls, df: pd.DataFrame, summary: dict = None):
+        """
+        Draws the filters. Their ranges come from df, or from summary (see
+        utils.catalog_aggregates.summarize) when the catalog is not loaded in memory.
+        """
         st.sidebar.header("Filtri")
 
-        if df is None:
+        if df is None and summary is None:
             st.error("Dataset 'catalog.csv' non trovato. Esegui lo script di setup!")
             st.stop()
             
-        min_year = int(df['time'].dt.year.min()) 
-        max_year = int(df['time'].dt.year.max())
-        max_depth = df['depth'].max()
-        min_mag = df['magnitude'].min()
-        max_mag = df['magnitude'].max()
-        minlatitude = 27.0
-        maxlatitude = 48.0 
-        minlongitude = -7.0 
-        maxlongitude = 37.5
+        bounds = cls.bounds(df, summary)
+        min_year, max_year = bounds["years"]
+        max_depth = bounds["depth"][1]
+        min_mag, max_mag = bounds["magnitude"]
+        minlatitude, maxlatitude = bounds["latitude"]
+        minlongitude, maxlongitude = bounds["longitude"]
 
         cls.years = st.sidebar.slider("Periodo", min_year, max_year, (min_year, max_year))
         cls.depth = st.sidebar.slider("Profondità (km)", 0.0, max_depth, (0.0, max_depth), 10.0)
@@ -32,20 +48,36 @@ class Sidebar:
         cls.longitude = st.sidebar.slider("Longitudine", minlongitude, maxlongitude, (minlongitude, maxlongitude), 0.1)
         cls.magnitude = st.sidebar.slider("Magnitudo", 0.0, 10.5, (min_mag, max_mag), 0.5)
 
+    @classmethod
+    def bounds(cls, df: pd.DataFrame = None, summary: dict = None) -> dict:
+        """Default range of each filter for the given catalog (what the sliders start at)."""
+        summary = summary or summarize([frame_partition(df)])
+        if CATALOG_REGION == "auto":
+            latitude, longitude = summary["latitude"], summary["longitude"]
+        else:
+            latitude, longitude = REGIONS[CATALOG_REGION]
+        return {
+            "years": summary["years"],
+            "depth": (0.0, summary["depth"][1]),
+            "magnitude": summary["magnitude"],
+            "latitude": latitude,
+            "longitude": longitude,
+        }
+
+    @classmethod
+    def set_defaults(cls, df: pd.DataFrame):
+        """Sets the filters to their defaults without drawing the sidebar (e.g. in scripts)."""
+        for name, value in cls.bounds(df).items():
+            setattr(cls, name, value)
 
     @classmethod
     def apply_filters(cls, df: pd.DataFrame):
-        filtered_df = df[
-            (df['time'].dt.year >= cls.years[0]) & 
-            (df['time'].dt.year <= cls.years[1]) & 
-            (df['magnitude'] >= cls.magnitude[0]) & 
-            (df['magnitude'] <= cls.magnitude[1]) & 
-            (df['depth'] >= cls.depth[0]) & 
-            (df['depth'] <= cls.depth[1]) & 
-            (df['latitude'] >= cls.latitude[0]) &
-            (df['latitude'] <= cls.latitude[1]) &
-            (df['longitude'] >= cls.longitude[0]) &
-            (df['longitude'] <= cls.longitude[1])
-        ].copy()
-
-        return filtered_df, cls.years, cls.depth, cls.magnitude
\ No newline at end of file
+        # Same mask as the out-of-core path (utils.catalog_aggregates)
+        filtered_df = df[filter_mask(frame_partition(df), cls.filter_key())].copy()
+
+        return filtered_df, cls.years, cls.depth, cls.magnitude
+
+    @classmethod
+    def filter_key(cls) -> tuple:
+        """Hashable summary of the current filters (e.g. for caching derived results)."""
+        return (cls.years, cls.depth, cls.magnitude, cls.latitude, cls.longitude)
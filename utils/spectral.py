@@ -0,0 +1,191 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.trace import CompactTrace
+
+# Window functions available in the UI (name -> numpy generator)
+WINDOW_FUNCTIONS = {
+    "hann": np.hanning,
+    "hamming": np.hamming,
+    "blackman": np.blackman,
+    "boxcar": np.ones,
+}
+
+SEGMENT_LENGTHS = [128, 256, 512, 1024, 2048]
+
+
+@lru_cache(maxsize=32)
+def get_window(name: str, nperseg: int) -> np.ndarray:
+    """
+    Returns the (read-only) window of the given type and length.
+    Windows are computed once per (name, length) and shared by every engine.
+    """
+    if name not in WINDOW_FUNCTIONS:
+        raise ValueError(f"Unknown window '{name}'. Available: {', '.join(WINDOW_FUNCTIONS)}")
+    # Periodic (DFT-even) window, as used for spectral estimation
+    window = WINDOW_FUNCTIONS[name](nperseg + 1)[:-1].astype(np.float64)
+    window.setflags(write=False)
+    return window
+
+
+@lru_cache(maxsize=32)
+def get_frequency_grid(nperseg: int, sampling_rate: float, fmax: float = None) -> tuple[np.ndarray, int]:
+    """
+    Returns the rfft frequency grid limited to fmax and the number of bins kept.
+    """
+    freqs = np.fft.rfftfreq(nperseg, d=1.0 / sampling_rate)
+    n_bins = len(freqs) if fmax is None else int(np.searchsorted(freqs, fmax, side="left"))
+    freqs = freqs[:n_bins].copy()
+    freqs.setflags(write=False)
+    return freqs, n_bins
+
+
+class SpectralEngine:
+    """
+    Welch PSD / STFT spectrogram engine with a per-segment FFT cache.
+
+    Segments are aligned to an absolute sample clock (sample number since epoch),
+    so the same segment of a sliding real-time buffer is transformed only once:
+    each update only computes the segments that were completed since the last call.
+    """
+
+    def __init__(self, sampling_rate: float = 100.0, nperseg: int = 256, overlap: float = 0.5,
+                 window: str = "hann", fmax: float = 20.0):
+        if not 0.0 <= overlap < 1.0:
+            raise ValueError("overlap must be in [0, 1)")
+        self.sampling_rate = float(sampling_rate)
+        self.nperseg = int(nperseg)
+        self.hop = max(1, int(round(self.nperseg * (1.0 - overlap))))
+        self.overlap = overlap
+        self.window_name = window
+        self.fmax = fmax
+
+        self.window = get_window(window, self.nperseg)
+        self.freqs, self._n_bins = get_frequency_grid(self.nperseg, self.sampling_rate, fmax)
+        # One-sided PSD density scaling (same convention as scipy.signal.welch)
+        self._scale = 1.0 / (self.sampling_rate * np.sum(self.window ** 2))
+        self._onesided = np.full(self._n_bins, 2.0)
+        self._onesided[0] = 1.0
+        if self.nperseg % 2 == 0 and self._n_bins == self.nperseg // 2 + 1:
+            self._onesided[-1] = 1.0
+
+        # Absolute segment index -> PSD of that segment
+        self._segments: dict[int, np.ndarray] = {}
+        self._span = (0, 0)  # range of segment indices covered by the last update
+
+    def config(self) -> tuple:
+        return (self.sampling_rate, self.nperseg, self.overlap, self.window_name, self.fmax)
+
+    def update(self, data: np.ndarray, starttime: float) -> int:
+        """
+        Feeds the engine with the current content of a (sliding) buffer.
+
+        Args:
+            data: 1-D array of samples.
+            starttime: Epoch time (seconds) of the first sample.
+
+        Returns:
+            Number of segments that were actually transformed.
+        """
+        data = np.asarray(data, dtype=np.float64)
+        n0 = int(round(starttime * self.sampling_rate))
+        first = -(-n0 // self.hop)  # ceil division
+        last = (n0 + len(data) - self.nperseg) // self.hop  # inclusive
+        if len(data) < self.nperseg or last < first:
+            self._segments.clear()
+            self._span = (0, 0)
+            return 0
+
+        # Evict segments that have slid out of the buffer
+        for k in [k for k in self._segments if k < first or k > last]:
+            del self._segments[k]
+        self._span = (first, last + 1)
+
+        missing = np.array([k for k in range(first, last + 1) if k not in self._segments], dtype=np.int64)
+        if missing.size == 0:
+            return 0
+
+        offsets = missing * self.hop - n0
+        frames = np.lib.stride_tricks.sliding_window_view(data, self.nperseg)[offsets]
+        # Constant detrend per segment (keeps segments independent of each other)
+        frames = (frames - frames.mean(axis=1, keepdims=True)) * self.window
+        spectra = np.fft.rfft(frames, axis=1)[:, :self._n_bins]
+        psd = (np.abs(spectra) ** 2) * self._scale * self._onesided
+        # Segments overlapping a gap (NaN samples) are all-NaN and excluded from the average
+
+        for k, row in zip(missing.tolist(), psd):
+            self._segments[k] = row
+        return int(missing.size)
+
+    def _stack(self) -> tuple[np.ndarray, np.ndarray]:
+        keys = np.arange(*self._span)
+        if keys.size == 0:
+            return keys, np.empty((0, self._n_bins))
+        return keys, np.vstack([self._segments[k] for k in keys])
+
+    def welch(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (frequencies, PSD) averaged over the cached segments.
+        """
+        _, stack = self._stack()
+        stack = stack[~np.isnan(stack).any(axis=1)]
+        if stack.shape[0] == 0:
+            return self.freqs, np.array([])
+        return self.freqs, stack.mean(axis=0)
+
+    def spectrogram(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns (segment center times as epoch seconds, frequencies, PSD matrix [freq x time]).
+        """
+        keys, stack = self._stack()
+        times = (keys * self.hop + self.nperseg / 2.0) / self.sampling_rate
+        return times, self.freqs, stack.T
+
+
+@st.cache_data
+def compute_spectrogram(trace: CompactTrace, nperseg: int = 256, window: str = "hann", fmax: float = 20.0):
+    """
+    Computes the STFT spectrogram of a trace.
+
+    Returns:
+        Tuple (times, frequencies, power in dB) or None if the trace is too short.
+    """
+    if trace is None or trace.empty:
+        return None
+
+    engine = SpectralEngine(trace.sampling_rate, nperseg, window=window, fmax=fmax)
+    engine.update(trace.data, trace.starttime)
+    return spectrogram_arrays(engine)
+
+
+def psd_frame(engine: SpectralEngine) -> pd.DataFrame:
+    freqs, psd = engine.welch()
+    if psd.size == 0:
+        return pd.DataFrame()
+    return pd.DataFrame({'Freq (Hz)': freqs, 'Power': psd})
+
+
+def spectrogram_arrays(engine: SpectralEngine):
+    times, freqs, sxx = engine.spectrogram()
+    if sxx.size == 0:
+        return None
+    times = pd.to_datetime(times, unit="s")
+    return times, freqs, 10 * np.log10(sxx + 1e-20)
+
+
+def get_realtime_engine(station: str, source=None, **config) -> SpectralEngine:
+    """
+    Returns the spectral engine bound to a real-time station buffer, kept in session state.
+    The engine is rebuilt only when its configuration or source changes: source identifies
+    how the samples were produced (e.g. the PreprocessConfig), so cached segments of
+    differently processed data are never averaged together.
+    """
+    engines = st.session_state.setdefault("spectral_engines", {})
+    entry = engines.get(station)
+    candidate = SpectralEngine(**config)
+    if entry is None or entry[0] != source or entry[1].config() != candidate.config():
+        entry = engines[station] = (source, candidate)
+    return entry[1]
@@ -0,0 +1,167 @@
+import json
+import os
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class CompactTrace:
+    """
+    Compact representation of a single-channel waveform.
+
+    Samples live in one contiguous float32 array on a regular time grid; gaps are
+    explicit NaN samples. Timestamps are never stored: they are derived from the
+    start time and sampling rate only when needed (e.g. for plotting).
+    """
+    starttime: float  # epoch seconds of the first sample
+    sampling_rate: float
+    data: np.ndarray
+    network: str = ""
+    station: str = ""
+    location: str = ""
+    channel: str = ""
+    units: str = "counts"  # physical units of the samples (raw counts until the response is removed)
+
+    @property
+    def npts(self) -> int:
+        return len(self.data)
+
+    @property
+    def delta(self) -> float:
+        return 1.0 / self.sampling_rate
+
+    @property
+    def endtime(self) -> float:
+        """Epoch time of the last sample."""
+        return self.starttime + (self.npts - 1) * self.delta
+
+    @property
+    def empty(self) -> bool:
+        return self.npts == 0
+
+    @property
+    def amplitude_label(self) -> str:
+        """Axis label for the samples, e.g. 'Velocity (m/s)' or 'Counts'."""
+        quantity = {"m": "Displacement", "m/s": "Velocity", "m/s²": "Acceleration"}.get(self.units)
+        return f"{quantity} ({self.units})" if quantity else "Counts"
+
+    @property
+    def seed_id(self) -> str:
+        return f"{self.network}.{self.station}.{self.location}.{self.channel}"
+
+    def times(self, index: np.ndarray = None) -> pd.DatetimeIndex:
+        """
+        Builds the time axis (all samples, or only the given sample indices).
+        """
+        index = np.arange(self.npts) if index is None else np.asarray(index)
+        return pd.to_datetime(self.starttime + index * self.delta, unit="s")
+
+    def index_at(self, t: float) -> int:
+        """Index of the first sample at or after epoch time t."""
+        return int(np.ceil(round((t - self.starttime) * self.sampling_rate, 6)))
+
+    def gaps(self) -> list[tuple[float, float]]:
+        """
+        Returns the gaps as (start, end) epoch times of the missing samples.
+        """
+        missing = np.isnan(self.data)
+        if not missing.any():
+            return []
+        edges = np.diff(np.concatenate([[0], missing.astype(np.int8), [0]]))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        return [(float(self.starttime + s * self.delta), float(self.starttime + e * self.delta)) for s, e in zip(starts, ends)]
+
+    def slice(self, starttime: float = None, endtime: float = None) -> "CompactTrace":
+        """
+        Returns the samples within [starttime, endtime] (a view, no copy).
+        """
+        i0 = 0 if starttime is None else max(0, self.index_at(starttime))
+        i1 = self.npts if endtime is None else min(self.npts, int(np.floor(round((endtime - self.starttime) * self.sampling_rate, 6))) + 1)
+        i1 = max(i0, i1)
+        return replace(self, starttime=self.starttime + i0 * self.delta, data=self.data[i0:i1])
+
+    def merge(self, other: "CompactTrace") -> "CompactTrace":
+        """
+        Merges another trace of the same channel on this trace's sample grid.
+        Samples of `other` win where both traces have data; uncovered samples become NaN.
+        """
+        if other is None or other.empty:
+            return self
+        if self.empty:
+            return other
+        if not np.isclose(other.sampling_rate, self.sampling_rate):
+            raise ValueError(f"Cannot merge traces sampled at {self.sampling_rate} and {other.sampling_rate} Hz")
+
+        start = min(self.starttime, other.starttime)
+        end = max(self.endtime, other.endtime)
+        n = int(round((end - start) * self.sampling_rate)) + 1
+        data = np.full(n, np.nan, dtype=np.float32)
+        for tr in (self, other):
+            offset = int(round((tr.starttime - start) * self.sampling_rate))
+            target = data[offset:offset + tr.npts]
+            valid = ~np.isnan(tr.data[:len(target)])
+            target[valid] = tr.data[:len(target)][valid]
+        return replace(self, starttime=start, data=data)
+
+    @classmethod
+    def from_stream(cls, stream) -> "CompactTrace":
+        """
+        Builds a trace from an ObsPy Stream, merging all segments of the first channel.
+        Gaps between segments become NaN samples.
+        """
+        if stream is None or len(stream) == 0:
+            return None
+        trace_id = stream[0].id
+        merged = stream.select(id=trace_id).copy()
+        merged.merge(method=1, fill_value=None)
+        tr = merged[0]
+        data = np.ma.masked_array(tr.data).astype(np.float32).filled(np.nan)
+        return cls(
+            starttime=float(tr.stats.starttime.timestamp),
+            sampling_rate=float(tr.stats.sampling_rate),
+            data=np.ascontiguousarray(data),
+            network=tr.stats.network,
+            station=tr.stats.station,
+            location=tr.stats.location,
+            channel=tr.stats.channel,
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Expands the trace into a DataFrame with one timestamp per sample (plotting/export only).
+        """
+        return pd.DataFrame({"times": self.times(), "velocity": self.data})
+
+    def save(self, path: str):
+        """
+        Saves the samples as .npy (memory-mappable) with a JSON header next to it.
+        `path` is the file name without extension.
+        """
+        np.save(f"{path}.npy", np.ascontiguousarray(self.data, dtype=np.float32))
+        header = {
+            "starttime": self.starttime,
+            "sampling_rate": self.sampling_rate,
+            "network": self.network,
+            "station": self.station,
+            "location": self.location,
+            "channel": self.channel,
+            "units": self.units,
+        }
+        with open(f"{path}.json", "w") as f:
+            json.dump(header, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CompactTrace":
+        """
+        Loads a trace saved with save(). With mmap=True the samples are memory-mapped, not read.
+        Returns None if the files do not exist.
+        """
+        if not (os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json")):
+            return None
+        with open(f"{path}.json") as f:
+            header = json.load(f)
+        data = np.load(f"{path}.npy", mmap_mode="r" if mmap else None)
+        return cls(data=data, **header)
@@ -0,0 +1,121 @@
+import os
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+# Velocity model shipped with ObsPy (no network access needed)
+DEFAULT_MODEL = "iasp91"
+
+# Lookup table grid: epicentral distance (degrees) x source depth (km)
+DISTANCES = np.round(np.arange(0.0, 10.0 + 1e-9, 0.1), 4)
+DEPTHS = np.concatenate([np.arange(0.0, 50.0, 2.0), np.arange(50.0, 700.0 + 1e-9, 25.0)])
+
+P_PHASES = ["p", "P", "Pg", "Pn", "Pdiff"]
+S_PHASES = ["s", "S", "Sg", "Sn", "Sdiff"]
+
+# Seconds kept before the P arrival and after the S arrival
+DEFAULT_PRE = 10.0
+DEFAULT_POST = 40.0
+
+
+def table_path(model: str = DEFAULT_MODEL) -> str:
+    return os.path.join(DATA_DIR, f"traveltimes_{model}.npz")
+
+
+def build_table(model: str = DEFAULT_MODEL, distances: np.ndarray = DISTANCES, depths: np.ndarray = DEPTHS) -> dict:
+    """
+    Computes first P and S arrival times with TauP on the distance/depth grid.
+    This is the slow part (one TauP call per grid node): run it once with
+    scripts/build_traveltime_table.py.
+    """
+    from obspy.taup import TauPyModel
+
+    taup = TauPyModel(model=model)
+    p_times = np.full((len(distances), len(depths)), np.nan)
+    s_times = np.full((len(distances), len(depths)), np.nan)
+    for j, depth in enumerate(depths):
+        for i, distance in enumerate(distances):
+            arrivals = taup.get_travel_times(source_depth_in_km=float(depth), distance_in_degree=float(distance),
+                                             phase_list=P_PHASES + S_PHASES)
+            p = [a.time for a in arrivals if a.name in P_PHASES]
+            s = [a.time for a in arrivals if a.name in S_PHASES]
+            p_times[i, j] = min(p) if p else np.nan
+            s_times[i, j] = min(s) if s else np.nan
+    return {"distances": distances, "depths": depths, "p": p_times, "s": s_times}
+
+
+def save_table(table: dict, model: str = DEFAULT_MODEL):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp_path = table_path(model) + ".tmp.npz"
+    np.savez_compressed(tmp_path, **table)
+    os.replace(tmp_path, table_path(model))
+
+
+_tables: dict[str, dict] = {}
+
+
+def load_table(model: str = DEFAULT_MODEL):
+    """
+    Loads the precomputed lookup table (None if it has not been built yet).
+    The table is read from disk once per process.
+    """
+    if model not in _tables:
+        path = table_path(model)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as npz:
+            _tables[model] = {key: npz[key] for key in npz.files}
+    return _tables[model]
+
+
+def _interpolate(table: dict, grid: str, distance: np.ndarray, depth: np.ndarray) -> np.ndarray:
+    """
+    Bilinear interpolation on the (distance, depth) grid, vectorized over many stations.
+    """
+    dists, depths, values = table["distances"], table["depths"], table[grid]
+    distance = np.clip(distance, dists[0], dists[-1])
+    depth = np.clip(depth, depths[0], depths[-1])
+    i = np.clip(np.searchsorted(dists, distance) - 1, 0, len(dists) - 2)
+    j = np.clip(np.searchsorted(depths, depth) - 1, 0, len(depths) - 2)
+    u = (distance - dists[i]) / (dists[i + 1] - dists[i])
+    v = (depth - depths[j]) / (depths[j + 1] - depths[j])
+    return ((1 - u) * (1 - v) * values[i, j] + u * (1 - v) * values[i + 1, j]
+            + (1 - u) * v * values[i, j + 1] + u * v * values[i + 1, j + 1])
+
+
+def arrival_times(distance_deg, depth_km, model: str = DEFAULT_MODEL):
+    """
+    Predicted first P and S travel times (seconds after origin) from the lookup table.
+
+    Args:
+        distance_deg: Epicentral distance(s) in degrees (scalar or array).
+        depth_km: Source depth in km.
+
+    Returns:
+        Tuple (p, s) with the same shape as distance_deg, or None if the table is missing.
+    """
+    table = load_table(model)
+    if table is None:
+        return None
+    distance = np.asarray(distance_deg, dtype=np.float64)
+    depth = np.broadcast_to(np.asarray(depth_km, dtype=np.float64), distance.shape)
+    return _interpolate(table, "p", distance, depth), _interpolate(table, "s", distance, depth)
+
+
+def phase_window(distance_deg: float, depth_km: float, pre: float = DEFAULT_PRE, post: float = DEFAULT_POST,
+                 model: str = DEFAULT_MODEL):
+    """
+    Waveform window around the expected phases: [P - pre, S + post].
+
+    Returns:
+        Tuple (offset, duration) in seconds relative to the origin time,
+        or None if no travel-time table is available.
+    """
+    times = arrival_times(distance_deg, depth_km, model)
+    if times is None:
+        return None
+    p, s = float(times[0]), float(times[1])
+    if np.isnan(p) or np.isnan(s):
+        return None
+    start = p - pre
+    return start, (s + post) - start